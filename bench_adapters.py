@@ -0,0 +1,104 @@
+"""
+Microbenchmark of the geometry adapters
+
+Compares the EWKB adapters against the previous WKT ones, for segments of
+increasing size. If a configuration file is given, it also measures how long
+PostGIS takes to read each representation.
+
+    $ python bench_adapters.py --config config.json
+"""
+import argparse
+import json
+import timeit
+import psycopg2
+
+from datetime import datetime, timedelta
+from os.path import expanduser, isfile
+from tracktotrip3 import Point, Segment
+from main import db
+from main.default_config import CONFIG
+from utils import update_dict
+
+def make_segment(n_points):
+    """ Creates a synthetic 1 Hz segment
+
+    Args:
+        n_points (int): number of points
+    Returns:
+        :obj:`tracktotrip3.Segment`
+    """
+    start = datetime(2022, 1, 1)
+    points = [
+        Point(38.7 + i * 1e-5, -9.1 + i * 2e-5, start + timedelta(seconds=i))
+        for i in range(n_points)
+    ]
+    return Segment(points)
+
+def time_adapter(adapter, segment, repeat):
+    """ Average time, in milliseconds, that an adapter takes to produce the SQL literal
+
+    Args:
+        adapter (function): see `db.adapt_segment`
+        segment (:obj:`tracktotrip3.Segment`)
+        repeat (int)
+    Returns:
+        float
+    """
+    return timeit.timeit(lambda: adapter(segment).getquoted(), number=repeat) / repeat * 1000
+
+def time_server(cur, adapter, segment, repeat):
+    """ Average time, in milliseconds, of a round trip in which PostGIS reads the geometry
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        adapter (function): see `db.adapt_segment`
+        segment (:obj:`tracktotrip3.Segment`)
+        repeat (int)
+    Returns:
+        float
+    """
+    literal = adapter(segment).getquoted().decode()
+    query = "SELECT ST_NPoints((%s)::geography::geometry)" % literal
+    return timeit.timeit(lambda: cur.execute(query) or cur.fetchone(), number=repeat) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the EWKB and WKT geometry adapters')
+    parser.add_argument('--config', '-c', dest='config', metavar='c', type=str,
+            help='configuration file, to also measure the database')
+    parser.add_argument('--repeat', '-r', dest='repeat', type=int, default=50,
+            help='repetitions per measurement')
+    args = parser.parse_args()
+
+    cur = None
+    if args.config and isfile(expanduser(args.config)):
+        config = dict(CONFIG)
+        with open(expanduser(args.config), 'r') as config_file:
+            update_dict(config, json.loads(config_file.read()))
+        dbc = config['db']
+        conn = db.connect_db(dbc['host'], dbc['name'], dbc['user'], dbc['port'], dbc['pass'])
+        cur = conn.cursor() if conn else None
+
+    print("%10s %12s %12s %12s %12s" % ('points', 'wkt (ms)', 'ewkb (ms)', 'wkt db (ms)', 'ewkb db (ms)'))
+    for n_points in [100, 1000, 10000, 86400]:
+        segment = make_segment(n_points)
+        repeat = max(1, args.repeat * 100 // n_points)
+
+        wkt = time_adapter(db.adapt_segment_wkt, segment, repeat)
+        ewkb = time_adapter(db.adapt_segment, segment, repeat)
+
+        wkt_db, ewkb_db = float('nan'), float('nan')
+        if cur:
+            try:
+                wkt_db = time_server(cur, db.adapt_segment_wkt, segment, repeat)
+                ewkb_db = time_server(cur, db.adapt_segment, segment, repeat)
+            except psycopg2.Error as e:
+                print(("error ", e))
+                cur.connection.rollback()
+
+        print("%10d %12.3f %12.3f %12.3f %12.3f" % (n_points, wkt, ewkb, wkt_db, ewkb_db))
+
+    if cur:
+        db.dispose(cur.connection, cur)
+
+if __name__ == '__main__':
+    main()
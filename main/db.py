@@ -3,24 +3,162 @@ Database related functions
 """
 import datetime
 import json
-import ppygis3
+import math
+import struct
+import threading
+import time
+import weakref
+import numpy as np
 import psycopg2
 
-from psycopg2.extensions import AsIs, register_adapter
+from collections import deque, OrderedDict
+from psycopg2.extensions import AsIs, register_adapter, TRANSACTION_STATUS_IDLE
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError
 from tracktotrip3 import Segment, Point
-from tracktotrip3.location import update_location_centroid
+from tracktotrip3.utils import estimate_meters_to_deg
 from life.life import Life
 
+SRID = 4326
+# Little endian EWKB geometry types, with the Z and SRID flags set
+EWKB_POINTZ = 0xA0000001
+EWKB_LINESTRINGZ = 0xA0000002
+EWKB_POINT_HEADER = struct.Struct('<BII')
+EWKB_LINESTRING_HEADER = struct.Struct('<BIII')
+# Maximum number of points sampled for each location, see `update_location`
+LOCATION_SAMPLE_SIZE = 50
+
+def point_to_ewkb(point):
+    """ Encodes a `tracktotrip3.Point` as EWKB, with SRID 4326
+
+    Args:
+        point (:obj:`tracktotrip3.Point`)
+    Returns:
+        bytes
+    """
+    return EWKB_POINT_HEADER.pack(1, EWKB_POINTZ, SRID) + struct.pack('<ddd', point.lon, point.lat, 0)
+
+def segment_to_ewkb(segment):
+    """ Encodes a `tracktotrip3.Segment` as an EWKB linestring, with SRID 4326
+
+    Coordinates are packed into a (lon, lat, 0) array and copied in one go
+
+    Args:
+        segment (:obj:`tracktotrip3.Segment`)
+    Returns:
+        bytes
+    """
+    points = segment.points
+    coords = np.zeros((len(points), 3), dtype='<f8')
+    coords[:, 0] = [p.lon for p in points]
+    coords[:, 1] = [p.lat for p in points]
+
+    return EWKB_LINESTRING_HEADER.pack(1, EWKB_LINESTRINGZ, SRID, len(points)) + coords.tobytes()
+
 def adapt_point(point):
     """ Adapts a `tracktotrip3.Point` to use with `psycopg` methods
 
+    The point is sent as hex encoded EWKB, which PostGIS reads without parsing text coordinates
+
     Params:
         points (:obj:`tracktotrip3.Point`)
     """
-    return AsIs("'SRID=%s;POINT(%s %s 0)'" % (4326, point.lon, point.lat))
+    return AsIs("'%s'::geography" % point_to_ewkb(point).hex())
+
+def adapt_point_wkt(point):
+    """ Adapts a `tracktotrip3.Point` to its WKT representation
+
+    Previous adapter, kept for comparison. See `bench_adapters.py`
+
+    Params:
+        points (:obj:`tracktotrip3.Point`)
+    """
+    return AsIs("'SRID=%s;POINT(%s %s 0)'" % (SRID, point.lon, point.lat))
+
+EWKB_Z = 0x80000000
+EWKB_M = 0x40000000
+EWKB_SRID = 0x20000000
+
+def ewkb_to_array(gis_geometry):
+    """ Reads an EWKB point or linestring into an array of coordinates
+
+    The coordinates are a view over the EWKB buffer, they are not copied
+
+    Args:
+        gis_geometry (str or bytes): EWKB, either raw or hex encoded (as returned by psycopg)
+    Returns:
+        :obj:`numpy.ndarray`: (n, 3) array with longitude, latitude and altitude
+    """
+    if isinstance(gis_geometry, bytes) and gis_geometry[:1] == b'0':
+        gis_geometry = gis_geometry.decode()
+    buf = bytes.fromhex(gis_geometry) if isinstance(gis_geometry, str) else gis_geometry
+    endian = '<' if buf[0] == 1 else '>'
+    (geom_type,) = struct.unpack_from(endian + 'I', buf, 1)
+
+    offset = 9 if geom_type & EWKB_SRID else 5
+    dims = 2 + bool(geom_type & EWKB_Z) + bool(geom_type & EWKB_M)
+
+    if geom_type & 0xFF == 1:
+        n_points = 1
+    elif geom_type & 0xFF == 2:
+        (n_points,) = struct.unpack_from(endian + 'I', buf, offset)
+        offset += 4
+    else:
+        raise TypeError('Unsupported geometry type: %d' % (geom_type & 0xFF))
+
+    coords = np.frombuffer(buf, dtype=endian + 'f8', count=n_points * dims, offset=offset)
+    coords = coords.reshape(n_points, dims)
+
+    if dims == 2:
+        return np.column_stack((coords, np.zeros(n_points)))
+    return coords[:, :3]
+
+class LazySegment(Segment):
+    """ Segment backed by an array of coordinates
+
+    `tracktotrip3.Point` objects are only created when `points` is first accessed
+
+    Arguments:
+        coords: (n, 3) array with longitude, latitude and altitude
+        timestamps: List of timestamps, or None
+    """
+    def __init__(self, coords, timestamps=None, debug = False):
+        self.coords = coords
+        self.timestamps = timestamps
+        super().__init__(None, debug)
+
+    @property
+    def points(self):
+        if self._points is None:
+            timestamps = self.timestamps
+            lons = self.coords[:, 0].tolist()
+            lats = self.coords[:, 1].tolist()
+            self._points = [
+                Point(lat, lon, timestamps[i] if timestamps is not None else None, self.debug)
+                for i, (lat, lon) in enumerate(zip(lats, lons))
+            ]
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+
+    def bounds(self, thr=0, lower_index=0, upper_index=-1):
+        """ Computes the bounds of the segment, or part of it
+
+        Uses the coordinates array while points haven't been created.
+        See `tracktotrip3.Segment.bounds`
+        """
+        coords = self.coords[lower_index:upper_index]
+        if self._points is not None or len(coords) == 0:
+            return super().bounds(thr, lower_index, upper_index)
+
+        min_lon, min_lat = coords[:, :2].min(axis=0).tolist()
+        max_lon, max_lat = coords[:, :2].max(axis=0).tolist()
+        return (min_lat - thr, min_lon - thr, max_lat + thr, max_lon + thr)
 
 def to_point(gis_point, time=None, debug = False):
-    """ Creates from raw ppygis representation
+    """ Creates from raw EWKB representation
 
     Args:
         gis_point
@@ -31,11 +169,13 @@ def to_point(gis_point, time=None, debug = False):
     Returns:
         :obj:`tracktotrip3.Point`
     """
-    gis_point = ppygis3.Geometry.read_ewkb(gis_point)
-    return Point(gis_point.y, gis_point.x, time, debug)
+    lon, lat = ewkb_to_array(gis_point)[0, :2].tolist()
+    return Point(lat, lon, time, debug)
 
 def to_segment(gis_points, timestamps=None, debug = False):
-    """ Creates from raw ppygis representation
+    """ Creates from raw EWKB representation
+
+    Points are only created when needed, see `LazySegment`
 
     Args:
         gis_points
@@ -44,25 +184,27 @@ def to_segment(gis_points, timestamps=None, debug = False):
         debug (bool, optional): activates debug mode. 
             Defaults to False
     Returns:
-        :obj:`tracktotrip3.Segment`
+        :obj:`LazySegment`
     """
-    gis_geometry = ppygis3.Geometry.read_ewkb(gis_points)
-    result = []
-    
-    if type(gis_geometry) is ppygis3.Point:
-        result.append(Point(gis_geometry.y, gis_geometry.x, timestamps, debug))
-    else:
-        gis_points = gis_geometry.points
-
-        for i, point in enumerate(gis_points):
-            tmstmp = timestamps[i] if timestamps is not None else None
-            result.append(Point(point.y, point.x, tmstmp, debug))
-
-    return Segment(result, debug)
+    return LazySegment(ewkb_to_array(gis_points), timestamps, debug)
 
 def adapt_segment(segment, debug = False):
     """ Adapts a `tracktotrip3.Segment` to use with `psycopg` methods
 
+    The segment is sent as hex encoded EWKB, with SRID 4326
+
+    Args:
+        segment (:obj:`tracktotrip3.Segment`)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    """
+    return AsIs("'%s'::geography" % segment_to_ewkb(segment).hex())
+
+def adapt_segment_wkt(segment, debug = False):
+    """ Adapts a `tracktotrip3.Segment` to its WKT representation
+
+    Previous adapter, kept for comparison. See `bench_adapters.py`
+
     Args:
         segment (:obj:`tracktotrip3.Segment`)
         debug (bool, optional): activates debug mode. 
@@ -136,30 +278,72 @@ def life_time(point, debug = False):
     time = point.time.time()
     return "%02d%02d" % (time.hour, time.minute)
 
-def load_from_segments_annotated(cur, track, life_content, max_distance, min_samples, insert_locs = True, debug = False):
+def life_stays(life, debug = False):
+    """ Lists the stays of a `life.Life` object
+
+    Args:
+        life (:obj:`life.Life`)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        :obj:`list` of (str, :obj:`datetime.datetime`, :obj:`datetime.datetime`): label, start and end
+    """
+    stays = []
+    for day in life.days:
+        date = day.date
+        for span in day.spans:
+            if isinstance(span.place, str):
+                start = span_date_to_datetime(date, span.start, debug)
+                end = span_date_to_datetime(date, span.end, debug)
+                stays.append((span.place, start, end))
+    return stays
+
+def life_places(life, debug = False):
+    """ Lists the canonical places of a `life.Life` object
+
+    Args:
+        life (:obj:`life.Life`)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        :obj:`list` of (str, :obj:`tracktotrip3.Point`)
+    """
+    return [
+        (place, Point(lat, lon, None, debug))
+        for place, (lat, lon) in list(life.coordinates.items())
+        if isinstance(place, str) and place != '#?'
+    ]
+
+def load_from_segments_annotated(cur, track, life_content, max_distance, min_samples, insert_locs = True, debug = False, location_cache = None, sample_size = LOCATION_SAMPLE_SIZE):
     """ Uses a LIFE formated string to populate the database
 
+    Stays and locations are written in batches, see `insert_stays` and `insert_locations`
+
     Args:
         cur (:obj:`psycopg2.cursor`)
         track (:obj:`tracktotrip3.Track`)
         life_content (str): LIFE formatted string
         max_distance (float): Max location distance. See
-            `tracktotrip3.location.update_location_centroid`
+            `update_location`
         min_samples (float): Minimum samples requires for location.  See
-            `tracktotrip3.location.update_location_centroid`
+            `update_location`
         insert_locs (bool): Determines whether locations are inserted into database
             Defaults to True
         debug (bool, optional): activates debug mode. 
             Defaults to False
+        location_cache (:obj:`LocationCache`, optional): See `insert_locations`
+        sample_size (int, optional): See `insert_locations`
     """
     
     life = Life()
     life.from_string(life_content.split('\n'))
 
+    locations = []
+
     def in_loc(points, start, end):
-        """ Inserts locations into database
+        """ Queues locations to be inserted into the database
         
-        See `insert_location`
+        See `insert_locations`
 
         Args:
             points (:obj:`dict`)
@@ -178,73 +362,58 @@ def load_from_segments_annotated(cur, track, life_content, max_distance, min_sam
         if startLocation is not None:
             if isinstance(startLocation, str): 
                 if startLocation != '#?':
-                    insert_location(cur, startLocation, startPoint, max_distance, min_samples, debug)
+                    locations.append((startLocation, startPoint))
             else: # is a tuple with (start, end) -> multiplace
                 if startLocation[0] != '#?':
-                    insert_location(cur, startLocation[0], startPoint, max_distance, min_samples, debug)
+                    locations.append((startLocation[0], startPoint))
                 if endLocation is not None and startLocation[1] != '#?':
-                    insert_location(cur, startLocation[1], endPoint, max_distance, min_samples, debug)
+                    locations.append((startLocation[1], endPoint))
 
         if endLocation is not None:
             if isinstance(endLocation, str):
                 if endLocation != '#?':
-                    insert_location(cur, endLocation, endPoint, max_distance, min_samples, debug)
+                    locations.append((endLocation, endPoint))
             else: # is a tuple with (start, end) -> multiplace
                 if startLocation is not None and endLocation[0] != '#?':
-                    insert_location(cur, endLocation[0], startPoint, max_distance, min_samples, debug)
+                    locations.append((endLocation[0], startPoint))
                 if endLocation[1] != '#?':
-                    insert_location(cur, endLocation[1], endPoint, max_distance, min_samples, debug)
+                    locations.append((endLocation[1], endPoint))
 
     if insert_locs:
         for segment in track.segments:
             in_loc(segment.points, 0, -1)
 
     # Insert stays
-    for day in life.days:
-        date = day.date
-        for span in day.spans:
-            start = span_date_to_datetime(date, span.start, debug)
-            end = span_date_to_datetime(date, span.end, debug)
-
-            if isinstance(span.place, str):
-                insert_stay(cur, span.place, start, end, debug)
+    insert_stays(cur, life_stays(life, debug), debug)
 
-    # Insert canonical places
-    for place, (lat, lon) in list(life.coordinates.items()):
-        if isinstance(place, str) and place != '#?':
-            insert_location(cur, place, Point(lat, lon, None, debug), max_distance, min_samples, debug)
+    # Insert locations, followed by canonical places
+    locations.extend(life_places(life, debug))
+    insert_locations(cur, locations, max_distance, min_samples, debug, location_cache, sample_size=sample_size)
 
 
-def load_from_life(cur, content, max_distance, min_samples, debug = False):
+def load_from_life(cur, content, max_distance, min_samples, debug = False, location_cache = None, sample_size = LOCATION_SAMPLE_SIZE):
     """ Uses a LIFE formated string to populate the database
 
     Args:
         cur (:obj:`psycopg2.cursor`)
         content (str): LIFE formatted string
         max_distance (float): Max location distance. See
-            `tracktotrip3.location.update_location_centroid`
+            `update_location`
         min_samples (float): Minimum samples requires for location.  See
-            `tracktotrip3.location.update_location_centroid`
+            `update_location`
         debug (bool, optional): activates debug mode. 
             Defaults to False    
+        location_cache (:obj:`LocationCache`, optional): See `insert_locations`
+        sample_size (int, optional): See `insert_locations`
     """
     life = Life()
     life.from_string(content.split('\n'))
 
     # Insert canonical places
-    for place, (lat, lon) in list(life.coordinates.items()):
-        if isinstance(place, str) and place != '#?':
-            insert_location(cur, place, Point(lat, lon, None, debug), max_distance, min_samples, debug)
+    insert_locations(cur, life_places(life, debug), max_distance, min_samples, debug, location_cache, sample_size=sample_size)
 
     # Insert stays
-    for day in life.days:
-        date = day.date
-        for span in day.spans:
-            start = span_date_to_datetime(date, span.start, debug)
-            end = span_date_to_datetime(date, span.end, debug)
-
-            if isinstance(span.place, str):
-                insert_stay(cur, span.place, start, end, debug)
+    insert_stays(cur, life_stays(life, debug), debug)
 
 
 def connect_db(host, name, user, port, password):
@@ -272,18 +441,326 @@ def connect_db(host, name, user, port, password):
         pass
     return None
 
+class ConnectionPool(object):
+    """ Thread-safe pool of database connections
+
+    Connections are kept open after being released, up to `max_size` of them. When
+    all of them are checked out, `getconn` blocks until one is released (or until
+    `timeout` seconds have passed).
+
+    Arguments:
+        connect: Function with no arguments that opens a new connection
+        min_size: Number of connections opened when the pool is created
+        max_size: Maximum number of connections open at the same time
+        health_check: Pings idle connections before handing them out
+        timeout: Maximum number of seconds to wait for a connection, None waits forever
+    """
+    def __init__(self, connect, min_size=1, max_size=10, health_check=True, timeout=None):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.health_check = health_check
+        self.timeout = timeout
+        self.idle = deque()
+        self.size = 0
+        self.in_use = 0
+        self.cond = threading.Condition()
+        self.counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'reclaimed': 0,
+            'peak_in_use': 0
+        }
+
+        for _ in range(min(min_size, self.max_size)):
+            self.idle.append(self.new_connection())
+            self.size += 1
+
+    def new_connection(self):
+        """ Opens a new connection
+
+        Returns:
+            :obj:`psycopg2.connection`
+        """
+        conn = self.connect()
+        with self.cond:
+            self.counters['created'] += 1
+        return conn
+
+    def is_alive(self, conn):
+        """ Checks whether an idle connection can still be used
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+        Returns:
+            bool
+        """
+        if conn.closed or conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            return False
+        if not self.health_check:
+            return True
+
+        try:
+            # Autocommit avoids the extra BEGIN/ROLLBACK round trips
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.autocommit = False
+            return True
+        except psycopg2.Error:
+            return False
+
+    def discard(self, conn):
+        """ Closes a connection that is no longer usable
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+        """
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self.cond:
+            self.size -= 1
+            self.counters['discarded'] += 1
+            self.cond.notify()
+
+    def getconn(self):
+        """ Checks out a connection, waiting for one to be released if needed
+
+        Returns:
+            :obj:`psycopg2.connection`
+        Raises:
+            :obj:`psycopg2.pool.PoolError`: if no connection was available in time
+            :obj:`psycopg2.Error`: if a new connection could not be opened
+        """
+        start = time.perf_counter()
+        waited = False
+
+        while True:
+            with self.cond:
+                while not self.idle and self.size >= self.max_size:
+                    waited = True
+                    remaining = None
+                    if self.timeout is not None:
+                        remaining = self.timeout - (time.perf_counter() - start)
+                    if (remaining is not None and remaining <= 0) or not self.cond.wait(remaining):
+                        self.counters['timeouts'] += 1
+                        raise PoolError("connection pool exhausted")
+
+                if self.idle:
+                    conn = self.idle.pop()
+                else:
+                    # Reserves the slot before connecting, outside of the lock
+                    conn = None
+                    self.size += 1
+
+            if conn is None:
+                try:
+                    conn = self.new_connection()
+                except psycopg2.Error:
+                    with self.cond:
+                        self.size -= 1
+                        self.cond.notify()
+                    raise
+                break
+            elif self.is_alive(conn):
+                break
+            else:
+                self.discard(conn)
+
+        elapsed = time.perf_counter() - start
+        with self.cond:
+            self.in_use += 1
+            self.counters['checkouts'] += 1
+            self.counters['peak_in_use'] = max(self.counters['peak_in_use'], self.in_use)
+            if waited:
+                self.counters['waits'] += 1
+                self.counters['wait_time'] += elapsed
+                self.counters['max_wait_time'] = max(self.counters['max_wait_time'], elapsed)
+
+        return conn
+
+    def putconn(self, conn):
+        """ Returns a connection to the pool
+
+        Connections left in a transaction are rolled back, broken ones are closed
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+        """
+        with self.cond:
+            self.in_use -= 1
+
+        if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+
+        if conn.closed or conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            self.discard(conn)
+        else:
+            with self.cond:
+                self.idle.append(conn)
+                self.cond.notify()
+
+    def reclaim(self):
+        """ Frees the slot of a checked out connection that was garbage collected without
+            being given back
+        """
+        with self.cond:
+            self.in_use -= 1
+            self.size -= 1
+            self.counters['reclaimed'] += 1
+            self.cond.notify()
+
+    def stats(self):
+        """ Pool usage counters
+
+        Returns:
+            :obj:`dict`
+        """
+        with self.cond:
+            stats = dict(self.counters)
+            stats.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.in_use
+            })
+        return stats
+
+    def close(self):
+        """ Closes all idle connections
+        """
+        with self.cond:
+            while self.idle:
+                self.idle.pop().close()
+                self.size -= 1
+
+POOLS = {}
+CHECKED_OUT = {}
+POOLS_LOCK = threading.Lock()
+
+def get_pool(host, name, user, port, password, min_size=1, max_size=10, health_check=True, timeout=None):
+    """ Gets the process-wide connection pool for a database, creating it if needed
+
+    Pools are shared by every manager that connects with the same parameters
+
+    Args:
+        host (str)
+        name (str)
+        user (str)
+        port (str)
+        password (str)
+        min_size (int, optional): Connections opened upfront. Defaults to 1
+        max_size (int, optional): Maximum open connections. Defaults to 10
+        health_check (bool, optional): Pings connections on checkout. Defaults to True
+        timeout (float, optional): Seconds to wait for a free connection. Defaults to None
+    Returns:
+        :obj:`ConnectionPool` or None
+    """
+    if host is None or name is None or user is None or password is None:
+        return None
+
+    key = (host, name, user, port, password)
+    with POOLS_LOCK:
+        pool = POOLS.get(key)
+        if pool is None:
+            try:
+                pool = ConnectionPool(
+                    lambda: psycopg2.connect(host=host, database=name, user=user, password=password, port=port),
+                    min_size,
+                    max_size,
+                    health_check,
+                    timeout
+                )
+            except psycopg2.Error:
+                return None
+            POOLS[key] = pool
+    return pool
+
+def checkout(pool):
+    """ Checks out a connection from a pool
+
+    Use `dispose` to give it back
+
+    Args:
+        pool (:obj:`ConnectionPool`)
+    Returns:
+        :obj:`psycopg2.connection` or None
+    """
+    try:
+        conn = pool.getconn()
+    except (psycopg2.Error, PoolError):
+        return None
+
+    key = id(conn)
+    # Connections that are never disposed (e.g. after an exception) must not hold a slot forever
+    finalizer = weakref.finalize(conn, reclaim, key)
+    with POOLS_LOCK:
+        CHECKED_OUT[key] = (pool, finalizer)
+    return conn
+
+def reclaim(key):
+    """ Frees the pool slot of a checked out connection that was garbage collected
+
+    Args:
+        key (int): id of the connection
+    """
+    with POOLS_LOCK:
+        pool, _ = CHECKED_OUT.pop(key, (None, None))
+    if pool:
+        pool.reclaim()
+
+def release(conn):
+    """ Gives a connection back to its pool, or closes it if it isn't pooled
+
+    Args:
+        conn (:obj:`psycopg2.connection`)
+    """
+    with POOLS_LOCK:
+        pool, finalizer = CHECKED_OUT.pop(id(conn), (None, None))
+
+    if pool:
+        finalizer.detach()
+        pool.putconn(conn)
+    else:
+        conn.close()
+
+def pool_stats():
+    """ Usage counters of every connection pool
+
+    Returns:
+        :obj:`list` of :obj:`dict`
+    """
+    with POOLS_LOCK:
+        pools = list(POOLS.items())
+    return [dict(pool.stats(), host=key[0], database=key[1]) for key, pool in pools]
+
 def dispose(conn, cur):
     """ Disposes a connection
 
+    Pooled connections are given back to their pool instead of being closed
+
     Args:
         conn (:obj:`psycopg2.connection`): Connection
         cur (:obj:`psycopg2.cursor`): Cursor
     """
     if conn:
-        conn.commit()
-        if cur:
-            cur.close()
-        conn.close()
+        try:
+            conn.commit()
+        finally:
+            if cur:
+                cur.close()
+            release(conn)
     elif cur:
         cur.close()
 
@@ -306,55 +783,31 @@ def gis_bounds(bounds, debug = False):
 
     return AsIs("'POLYGON((%s))'" % (points))
 
-def insert_location(cur, label, point, max_distance, min_samples, debug = False):
+def insert_location(cur, label, point, max_distance, min_samples, debug = False, location_index = None, sample_size = LOCATION_SAMPLE_SIZE):
     """ Inserts a location into the database
 
+    See `insert_locations`
+
     Args:
         cur (:obj:`psycopg2.cursor`)
         label (str): Location's name
         point (:obj:`Point`): Position marked with current label
         max_distance (float): Max location distance. See
-            `tracktotrip3.location.update_location_centroid`
+            `update_location`
         min_samples (float): Minimum samples requires for location.  See
-            `tracktotrip3.location.update_location_centroid`
+            `update_location`
         debug (bool, optional): activates debug mode. 
             Defaults to False
+        location_index (:obj:`location_index.LocationIndex`, optional): index to keep up
+            to date. Defaults to None
+        sample_size (int, optional): Maximum size of the location's sample. See
+            `update_location`
     """
 
     if (debug):
         print('Inserting location %s, %f, %f' % (label, point.lat, point.lon))
 
-    cur.execute("""
-            SELECT location_id, label, centroid, point_cluster
-            FROM locations
-            WHERE label=%s
-            ORDER BY ST_Distance(centroid, %s)
-            """, (label, point))
-    if cur.rowcount > 0:
-        # Updates current location set of points and centroid
-        location_id, _, centroid, point_cluster = cur.fetchone()
-        centroid = to_point(centroid, debug=debug)
-        point_cluster = to_segment(point_cluster, debug=debug).points
-
-        centroid, point_cluster = update_location_centroid(
-            point,
-            point_cluster,
-            max_distance,
-            min_samples,
-            debug
-        )
-
-        cur.execute("""
-                UPDATE locations
-                SET centroid=%s, point_cluster=%s
-                WHERE location_id=%s
-                """, (centroid, Segment(point_cluster, debug), location_id))
-    else:
-        # Creates new location
-        cur.execute("""
-                INSERT INTO locations (label, centroid, point_cluster)
-                VALUES (%s, %s, %s)
-                """, (label, point, Segment([point, point], debug)))
+    insert_locations(cur, [(label, point)], max_distance, min_samples, debug, location_index=location_index, sample_size=sample_size)
 
 def insert_stay(cur, label, start_date, end_date, debug = False):
     """ Inserts stay in the database
@@ -373,6 +826,296 @@ def insert_stay(cur, label, start_date, end_date, debug = False):
         VALUES (%s, %s, %s)
         """, (label, start_date, end_date))
 
+def insert_stays(cur, stays, debug = False):
+    """ Inserts several stays in the database, with a single statement
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        stays (:obj:`list` of (str, :obj:`datetime.datetime`, :obj:`datetime.datetime`)): label,
+            start and end of each stay
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    """
+    if len(stays) > 0:
+        execute_values(cur, """
+            INSERT INTO stays(location_label, start_date, end_date)
+            VALUES %s
+            """, stays)
+
+UINT64_MASK = (1 << 64) - 1
+
+def reservoir_slot(n_points):
+    """ Pseudo-random slot of a location's sample, to be replaced by its `n_points`th point
+
+    Derived from the number of points, with SplitMix64's mixing function, so that
+    updates are deterministic without creating a random number generator for each point
+
+    Args:
+        n_points (int): number of points of the location, including the new one
+    Returns:
+        int: between 0 and `n_points` - 1
+    """
+    z = (n_points * 0x9E3779B97F4A7C15) & UINT64_MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & UINT64_MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & UINT64_MASK
+    return (z ^ (z >> 31)) % n_points
+
+def new_location(point, debug = False):
+    """ Creates the in-memory representation of a location, without any point
+
+    Use `update_location` to add points to it
+
+    Args:
+        point (:obj:`Point`): Initial centroid
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        :obj:`dict`
+    """
+    return {
+        'id': None,
+        'centroid': Point(point.lat, point.lon, None, debug),
+        'n_points': 0,
+        'n_inliers': 0,
+        'm2': 0.0,
+        'sample': [],
+        'changed': True
+    }
+
+def update_location(location, point, max_distance, min_samples, sample_size=LOCATION_SAMPLE_SIZE, debug = False):
+    """ Adds a point to a location, in constant time
+
+    The centroid is the running mean of the location's inliers. Until there are
+    `min_samples` inliers every point is one, afterwards only points closer to the
+    centroid than `max_distance`, or than three times the inliers' spread, are.
+    A bounded, representative sample of every point is kept with reservoir sampling
+
+    Args:
+        location (:obj:`dict`): See `new_location`
+        point (:obj:`Point`): Point to add
+        max_distance (float): Max distance, in meters, of a point to the centroid
+        min_samples (int): Number of points accepted before outliers are rejected
+        sample_size (int, optional): Maximum size of the sample. Defaults to 50
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    """
+    location['n_points'] += 1
+    n_points = location['n_points']
+
+    sample = location['sample']
+    if len(sample) < sample_size:
+        sample.append(point)
+    else:
+        i = reservoir_slot(n_points)
+        if i < sample_size:
+            sample[i] = point
+
+    centroid = location['centroid']
+    n_inliers = location['n_inliers']
+    d_lat = point.lat - centroid.lat
+    d_lon = point.lon - centroid.lon
+
+    spread = math.sqrt(location['m2'] / n_inliers) if n_inliers > 0 else 0
+    threshold = max(estimate_meters_to_deg(max_distance, precision=6, debug=debug), 3 * spread)
+
+    if n_inliers < min_samples or math.hypot(d_lat, d_lon) <= threshold:
+        # Welford's update of the mean and of the sum of squared distances
+        n_inliers += 1
+        lat = centroid.lat + d_lat / n_inliers
+        lon = centroid.lon + d_lon / n_inliers
+        location['m2'] += d_lat * (point.lat - lat) + d_lon * (point.lon - lon)
+        location['n_inliers'] = n_inliers
+        location['centroid'] = Point(lat, lon, None, debug)
+
+    location['changed'] = True
+
+def sample_segment(location, debug = False):
+    """ Segment representation of a location's sample, as stored in `point_cluster`
+
+    Args:
+        location (:obj:`dict`)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        :obj:`tracktotrip3.Segment`
+    """
+    sample = location['sample']
+    # Linestrings need at least two points
+    return Segment(sample if len(sample) > 1 else sample * 2, debug)
+
+class LocationCache(object):
+    """ Write-back cache of locations, keyed by label
+
+    Labels are read from the database the first time they are used. Points are added
+    in memory (see `update_location`), so repeated labels cost no round trips until
+    `flush` writes every changed location. A cache must only be used for one
+    transaction, and flushed before committing it, since other transactions may write
+    the same locations.
+
+    Arguments:
+        max_distance: Max location distance. See `update_location`
+        min_samples: Minimum samples requires for location. See `update_location`
+        sample_size: Maximum size of each location's sample. See `update_location`
+        locations: Dictionary with the locations of each label
+        moved: Centroids, before and after each change, since the last flush
+    """
+    def __init__(self, max_distance, min_samples, sample_size=LOCATION_SAMPLE_SIZE, debug = False):
+        self.max_distance = max_distance
+        self.min_samples = min_samples
+        self.sample_size = sample_size
+        self.debug = debug
+        self.locations = {}
+        self.moved = []
+
+    def load(self, cur, labels):
+        """ Reads labels that aren't cached yet, with a single query
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+            labels (:obj:`list` of str)
+        """
+        missing = [label for label in OrderedDict.fromkeys(labels) if label not in self.locations]
+        if len(missing) == 0:
+            return
+
+        cur.execute("""
+                SELECT location_id, label, centroid, point_cluster, n_points, n_inliers, m2
+                FROM locations
+                WHERE label = ANY(%s)
+                ORDER BY location_id
+                """, (missing,))
+
+        for label in missing:
+            self.locations[label] = []
+        for location_id, label, centroid, point_cluster, n_points, n_inliers, m2 in cur.fetchall():
+            sample = to_segment(point_cluster, debug=self.debug).points
+            self.locations[label].append({
+                'id': location_id,
+                'centroid': to_point(centroid, debug=self.debug),
+                'n_points': n_points,
+                'n_inliers': n_inliers,
+                'm2': m2,
+                'sample': sample[:min(n_points, len(sample))],
+                'changed': False
+            })
+
+    def add(self, cur, locations):
+        """ Adds points to locations, creating the ones that don't exist
+
+        Each point is added to the nearest location with the same label
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+            locations (:obj:`list` of (str, :obj:`Point`)): label and position of each location
+        """
+        self.load(cur, [label for label, _ in locations])
+
+        for label, point in locations:
+            candidates = self.locations[label]
+            if len(candidates) == 0:
+                candidates.append(new_location(point, self.debug))
+
+            if len(candidates) == 1:
+                location = candidates[0]
+            else:
+                location = min(candidates, key=lambda l: l['centroid'].distance(point))
+
+            centroid = location['centroid']
+            update_location(location, point, self.max_distance, self.min_samples, self.sample_size, self.debug)
+            if location['centroid'] is not centroid:
+                if location['id'] is not None:
+                    self.moved.append(centroid)
+                self.moved.append(location['centroid'])
+
+    def flush(self, cur, location_index = None):
+        """ Writes every changed location, with one statement for new locations and another
+            for existing ones
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+            location_index (:obj:`location_index.LocationIndex`, optional): index to update
+                with the written locations. Defaults to None
+        Returns:
+            :obj:`list` of :obj:`tracktotrip3.Point`: centroids that were moved, see `moved`
+        """
+        new_locations = []
+        changed_locations = []
+        written = []
+        for label, candidates in list(self.locations.items()):
+            for location in candidates:
+                if location['changed']:
+                    written.append((label, location))
+                    if location['id'] is None:
+                        new_locations.append((label, location))
+                    else:
+                        changed_locations.append(location)
+
+        if len(new_locations) > 0:
+            ids = execute_values(cur, """
+                INSERT INTO locations (label, centroid, point_cluster, n_points, n_inliers, m2)
+                VALUES %s
+                RETURNING location_id, label
+                """, [
+                    (label, l['centroid'], sample_segment(l, self.debug), l['n_points'], l['n_inliers'], l['m2'])
+                    for label, l in new_locations
+                ], fetch=True)
+            ids = dict([(label, location_id) for location_id, label in ids])
+            for label, location in new_locations:
+                location['id'] = ids[label]
+
+        if len(changed_locations) > 0:
+            execute_values(cur, """
+                UPDATE locations
+                SET centroid=v.centroid, point_cluster=v.point_cluster, n_points=v.n_points,
+                    n_inliers=v.n_inliers, m2=v.m2
+                FROM (VALUES %s) AS v(location_id, centroid, point_cluster, n_points, n_inliers, m2)
+                WHERE locations.location_id=v.location_id
+                """, [
+                    (l['id'], l['centroid'], sample_segment(l, self.debug), l['n_points'], l['n_inliers'], l['m2'])
+                    for l in changed_locations
+                ])
+
+        for _, location in new_locations:
+            location['changed'] = False
+        for location in changed_locations:
+            location['changed'] = False
+
+        if location_index is not None:
+            for label, location in written:
+                location_index.update(location['id'], label, location['centroid'])
+
+        moved, self.moved = self.moved, []
+        return moved
+
+def insert_locations(cur, locations, max_distance, min_samples, debug = False, location_cache = None, location_index = None, sample_size = LOCATION_SAMPLE_SIZE):
+    """ Inserts several locations into the database
+
+    Produces the same result as calling `insert_location` for each location, in order,
+    but reads and writes each label once. See `LocationCache`
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        locations (:obj:`list` of (str, :obj:`Point`)): label and position of each location
+        max_distance (float): Max location distance. See
+            `update_location`
+        min_samples (float): Minimum samples requires for location.  See
+            `update_location`
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+        location_cache (:obj:`LocationCache`, optional): cache to add the locations to. Its
+            owner is responsible for flushing it. Defaults to None (locations are written)
+        location_index (:obj:`location_index.LocationIndex`, optional): index to update with
+            the written locations, when there's no `location_cache`. Defaults to None
+        sample_size (int, optional): Maximum size of each location's sample, when there's
+            no `location_cache`, whose own is used otherwise. See `update_location`
+    """
+    if location_cache is None:
+        location_cache = LocationCache(max_distance, min_samples, sample_size, debug)
+        location_cache.add(cur, locations)
+        location_cache.flush(cur, location_index)
+    else:
+        location_cache.add(cur, locations)
+
 def insert_segment(cur, segment, max_distance, min_samples, debug = False):
     """ Inserts segment in the database
 
@@ -380,9 +1123,9 @@ def insert_segment(cur, segment, max_distance, min_samples, debug = False):
         cur (:obj:`psycopg2.cursor`)
         segment (:obj:`tracktotrip3.Segment`): Segment to insert
         max_distance (float): Max location distance. See
-            `tracktotrip3.location.update_location_centroid`
+            `update_location`
         min_samples (float): Minimum samples requires for location.  See
-            `tracktotrip3.location.update_location_centroid`
+            `update_location`
         debug (bool, optional): activates debug mode. 
             Defaults to False
     Returns:
@@ -544,17 +1287,110 @@ def query_locations(cur, lat, lon, radius, debug = False):
 
     return a
 
-def get_canonical_trips(cur, debug = False):
+def query_nearest_locations(cur, points, radius, limit, debug = False):
+    """ Queries the database for the locations around several points, in one query
+
+    Each point is joined laterally with its `limit` closest locations, within the same
+    radius as `query_locations`. Only the labels and centroids are read, as arrays,
+    instead of a row, with the point cluster, for each location
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        points (:obj:`list` of :obj:`tracktotrip3.Point`)
+        radius (float): Radius from the given points, in meters
+        limit (int): Maximum number of locations of each point
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        :obj:`list` of (:obj:`list` of str, :obj:`numpy.ndarray`): for each point, the labels
+            of its locations, closest first, and their centroids, as (lat, lon) rows
+    """
+    nearest = [([], np.zeros((0, 2))) for _ in points]
+    if len(points) == 0:
+        return nearest
+
+    cur.execute("""
+        SELECT q.idx,
+            array_agg(l.label ORDER BY l.distance),
+            array_agg(ST_Y(l.centroid::geometry) ORDER BY l.distance),
+            array_agg(ST_X(l.centroid::geometry) ORDER BY l.distance)
+        FROM (
+            SELECT idx, ST_SetSRID(ST_MakePoint(lon, lat), %s)::geography AS position
+            FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS q(lat, lon, idx)
+        ) AS q
+        CROSS JOIN LATERAL (
+            SELECT label, centroid, ST_Distance(centroid, q.position) AS distance
+            FROM locations
+            WHERE ST_DWithin(centroid, q.position, %s)
+            ORDER BY distance
+            LIMIT %s
+        ) AS l
+        GROUP BY q.idx
+        """, (SRID, [point.lat for point in points], [point.lon for point in points], radius * 4, limit))
+
+    for idx, labels, lats, lons in cur.fetchall():
+        nearest[idx - 1] = (labels, np.column_stack((lats, lons)))
+
+    return nearest
+
+def locations_version(cur, debug = False):
+    """ Fingerprint of the locations table
+
+    Changes whenever a location is added, removed, or receives a point, since every
+    point increments its `n_points`. Used to know when inferred locations may differ
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        :obj:`list` of int: number of locations, greatest id and number of points
+    """
+    cur.execute("""
+        SELECT count(*), coalesce(max(location_id), 0), coalesce(sum(n_points), 0)
+        FROM locations
+        """)
+    return [int(value) for value in cur.fetchone()]
+
+# Simplified geometry columns, from the finest to the coarsest, and their tolerance in
+# degrees. See the simplified geometries migration
+LOD_COLUMNS = [
+    (0.0002, 'points_lod1'),
+    (0.002, 'points_lod2'),
+    (0.02, 'points_lod3')
+]
+
+def lod_column(tolerance, debug = False):
+    """ Geometry column with the coarsest simplification that's within a tolerance
+
+    Args:
+        tolerance (float): Tolerance, in degrees, or None for the full resolution
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        str
+    """
+    column = 'points'
+    if tolerance:
+        for lod_tolerance, lod in LOD_COLUMNS:
+            if lod_tolerance <= tolerance:
+                column = lod
+
+    return column
+
+def get_canonical_trips(cur, tolerance = None, debug = False):
     """ Gets canonical trips
 
     Args:
         cur (:obj:`psycopg2.cursor`)
+        tolerance (float, optional): Simplification tolerance, in degrees. See `lod_column`.
+            Defaults to None, the full resolution
         debug (bool, optional): activates debug mode. 
             Defaults to False
     Returns:
         :obj:`list` of :obj:`dict`:
     """
-    cur.execute("SELECT canonical_id, ST_AsGEOJson(points) FROM canonical_trips")
+    cur.execute("SELECT canonical_id, ST_AsGEOJson(%s) FROM canonical_trips" % lod_column(tolerance, debug))
     trips = cur.fetchall()
     return [{'id': t[0], 'geoJSON': json.loads(t[1])} for t in trips]
 
@@ -572,125 +1408,213 @@ def get_canonical_locations(cur, debug = False):
     locations = cur.fetchall()
     return [{'id': t[0], 'label': t[1], 'geoJSON': json.loads(t[2])} for t in locations]
 
-def get_trips(cur, bounding_box, canonical=False, debug = False):
-    """ Gets trips in db
+def tiles_query(columns, canonical=False, debug = False):
+    """ Query of the trips that intersect some tiles, except the ones already loaded
+
+    Each tile envelope is joined with the trips through the bounds index. Query
+        parameters are the ones of `tiles_params`
+
+    Args:
+        columns (str): columns to select, of the `trips` or `canonical_trips` table
+        canonical (bool, optional): determines whether the trips are canonical or not
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        str
+    """
+    return """
+        SELECT {columns} FROM {table} WHERE {key} IN (
+            SELECT t.{key}
+            FROM unnest(%s::float8[], %s::float8[], %s::float8[], %s::float8[])
+                AS tile(min_lat, min_lon, max_lat, max_lon)
+            INNER JOIN {table} AS t
+                ON t.bounds && ST_MakeEnvelope(tile.min_lat, tile.min_lon, tile.max_lat, tile.max_lon, 4326)
+        ) AND NOT {key} = ANY(%s::integer[])
+    """.format(
+        columns=columns,
+        table='canonical_trips' if canonical else 'trips',
+        key='canonical_id' if canonical else 'trip_id'
+    )
+
+def tiles_params(tiles_bounds, loaded_ids):
+    """ Query parameters of `tiles_query`
+
+    Args:
+        tiles_bounds (:obj:`list` of (float, float, float, float)): min latitude, min longitude,
+            max latitude and max longitude of each tile
+        loaded_ids (:obj:`list` of int): ids of the trips to exclude
+    Returns:
+        :obj:`tuple`
+    """
+    columns = list(zip(*tiles_bounds)) if len(tiles_bounds) > 0 else [(), (), (), ()]
+    return tuple([list(column) for column in columns]) + (list(loaded_ids),)
+
+def get_trips(cur, tiles_bounds, loaded_ids=[], canonical=False, tolerance = None, debug = False):
+    """ Gets trips in some tiles, that weren't loaded yet
+
+    See `tiles_query`
 
     Args:
         cur (:obj:`psycopg2.cursor`)
+        tiles_bounds (:obj:`list` of (float, float, float, float)): min latitude, min longitude,
+            max latitude and max longitude of each tile
+        loaded_ids (:obj:`list` of int, optional): ids of the trips already loaded
+        canonical (bool, optional): determines whether the trips are canonical or not
+        tolerance (float, optional): Simplification tolerance, in degrees. See `lod_column`.
+            Defaults to None, the full resolution
         debug (bool, optional): activates debug mode. 
             Defaults to False
     Returns:
-        :obj:`list` of :obj:`dict`
+        (:obj:`list` of :obj:`dict`, :obj:`list` of int): trips, and their ids
     """
+    if len(tiles_bounds) == 0:
+        return [], []
+
+    columns = '%s, %s, ST_AsGEOJson(%s)' % (
+        'canonical_id' if canonical else 'trip_id',
+        'canonical_id' if canonical else 'day',
+        lod_column(tolerance, debug)
+    )
+    cur.execute(tiles_query(columns, canonical, debug), tiles_params(tiles_bounds, loaded_ids))
 
-    if canonical:
-        cur.execute("""
-            SELECT canonical_id, ST_AsGEOJson(points) FROM canonical_trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
-            """, (bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"]))
-    else:
-        cur.execute("""
-            SELECT start_date::date, ST_AsGEOJson(points) FROM trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
-            """, (bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"]))
-    
     trips = cur.fetchall()
-    return [{'id': t[0], 'geoJSON': json.loads(t[1])} for t in trips]
+    return [{'id': t[1], 'geoJSON': json.loads(t[2])} for t in trips], [t[0] for t in trips]
+
+def can_get_more_trips(cur, tiles_bounds, loaded_ids, canonical=False, debug = False):
+    """ Checks whether there are trips in some tiles that weren't loaded yet
 
-def can_get_more_trips(cur, bounding_box, loaded_bb, canonical=False, debug = False):
-    """ Checks whether there are trips in db that haven't been fetched yet in a certain bounding box
+    Stops at the first trip found. See `tiles_query`
 
     Args:
         cur (:obj:`psycopg2.cursor`)
+        tiles_bounds (:obj:`list` of (float, float, float, float)): min latitude, min longitude,
+            max latitude and max longitude of each tile
+        loaded_ids (:obj:`list` of int): ids of the trips already loaded
+        canonical (bool, optional): determines whether the trips are canonical or not
         debug (bool, optional): activates debug mode. 
             Defaults to False
     Returns:
         bool
     """
+    if len(tiles_bounds) == 0:
+        return False
 
-    if canonical:
-        cur.execute("""
-            WITH results as (
-                (SELECT canonical_id, points FROM canonical_trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)) 
-                EXCEPT (
-                    (SELECT canonical_id, points FROM canonical_trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-                        INTERSECT 
-                    (SELECT canonical_id, points FROM canonical_trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-                )
-            ) SELECT count(1) FROM results
-        """, (  bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"],\
-                loaded_bb[0]["lat"], loaded_bb[0]["lon"], loaded_bb[1]["lat"], loaded_bb[1]["lon"],\
-                bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"]\
-            ))
-    else:
-        cur.execute("""
-            WITH results as (
-                (SELECT trip_id, points FROM trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)) 
-                EXCEPT (
-                    (SELECT trip_id, points FROM trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-                        INTERSECT 
-                    (SELECT trip_id, points FROM trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-                )
-            ) SELECT count(1) FROM results
-        """, (  bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"],\
-                loaded_bb[0]["lat"], loaded_bb[0]["lon"], loaded_bb[1]["lat"], loaded_bb[1]["lon"],\
-                bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"]\
-            ))
+    cur.execute(
+        "SELECT EXISTS (%s)" % tiles_query('1', canonical, debug),
+        tiles_params(tiles_bounds, loaded_ids)
+    )
 
     results = cur.fetchone()
-    return results[0] > 0
+    return results[0]
+
+def stream_all_trips(conn, chunk_size=500, debug = False):
+    """ Streams all trips in db, in chunks, from a server-side cursor
 
-def get_more_trips(cur, bounding_box, loaded_bb, canonical=False, debug = False):
-    """ Gets trips in db that haven't been fetched yet
+    Geometries are kept as GeoJSON strings, so that they can be written as they are
+
+    Args:
+        conn (:obj:`psycopg2.connection`)
+        chunk_size (int, optional): Number of trips fetched at a time. Defaults to 500
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Yields:
+        :obj:`list` of (int, str): trip ids and their GeoJSON representation
+    """
+    with conn.cursor(name='all_trips') as cur:
+        cur.itersize = chunk_size
+        cur.execute("SELECT trip_id, ST_AsGEOJson(points) FROM trips")
+        while True:
+            trips = cur.fetchmany(chunk_size)
+            if len(trips) == 0:
+                break
+            yield trips
+
+# Attributes, geography column and table of each vector tile layer
+TILE_LAYERS = {
+    'trips': (
+        "trip_id AS id, start_location, end_location, start_date::text AS start_date, end_date::text AS end_date",
+        "points",
+        "trips"
+    ),
+    'canonical_trips': ("canonical_id AS id", "points", "canonical_trips"),
+    'locations': ("location_id AS id, label", "centroid", "locations")
+}
+
+def get_tile(cur, layer, zoom, x, y, extent, buffer, debug = False):
+    """ Renders a Mapbox Vector Tile of a layer
+
+    See `TILE_LAYERS`. Geometries are filtered with the (buffered) tile envelope, so that
+        spatial indexes are used
 
     Args:
         cur (:obj:`psycopg2.cursor`)
+        layer (str): trips, canonical_trips or locations
+        zoom (int)
+        x (int)
+        y (int)
+        extent (int): tile resolution
+        buffer (int): buffer around the tile, in tile units
         debug (bool, optional): activates debug mode. 
             Defaults to False
     Returns:
-        :obj:`list` of :obj:`dict`
+        bytes
     """
+    columns, geom, table = TILE_LAYERS[layer]
+    cur.execute("""
+        WITH envelope AS (
+            SELECT ST_TileEnvelope(%(zoom)s, %(x)s, %(y)s) AS tile,
+                ST_Transform(ST_TileEnvelope(%(zoom)s, %(x)s, %(y)s, margin => %(margin)s), 4326)::geography AS area
+        )
+        SELECT ST_AsMVT(features.*, %(layer)s, %(extent)s, 'geom', 'id') FROM (
+            SELECT {columns},
+                ST_AsMVTGeom(ST_Transform({geom}::geometry, 3857), envelope.tile, %(extent)s, %(buffer)s) AS geom
+            FROM {table}, envelope
+            WHERE {geom} && envelope.area
+        ) AS features
+        WHERE features.geom IS NOT NULL
+        """.format(columns=columns, geom=geom, table=table), {
+            'zoom': zoom,
+            'x': x,
+            'y': y,
+            'margin': float(buffer) / extent,
+            'layer': layer,
+            'extent': extent,
+            'buffer': buffer
+        })
+    result = cur.fetchone()
 
-    if canonical:
-        cur.execute("""
-            (SELECT canonical_id, ST_AsGEOJson(points) FROM canonical_trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)) 
-            EXCEPT (
-                (SELECT canonical_id, ST_AsGEOJson(points) FROM canonical_trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-                    INTERSECT 
-                (SELECT canonical_id, ST_AsGEOJson(points) FROM canonical_trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-            )
-        """, (  bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"],\
-                loaded_bb[0]["lat"], loaded_bb[0]["lon"], loaded_bb[1]["lat"], loaded_bb[1]["lon"],\
-                bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"]\
-            ))
-    else:
-        cur.execute("""
-            (SELECT start_date::date, ST_AsGEOJson(points) FROM trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)) 
-            EXCEPT (
-                (SELECT start_date::date, ST_AsGEOJson(points) FROM trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-                    INTERSECT 
-                (SELECT start_date::date, ST_AsGEOJson(points) FROM trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-            )
-        """, (  bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"],\
-                loaded_bb[0]["lat"], loaded_bb[0]["lon"], loaded_bb[1]["lat"], loaded_bb[1]["lon"],\
-                bounding_box[0]["lat"], bounding_box[0]["lon"], bounding_box[1]["lat"], bounding_box[1]["lon"]\
-            ))
-
-    trips = cur.fetchall()
-    return [{'id': t[0], 'geoJSON': json.loads(t[1])} for t in trips]
-
+    return bytes(result[0]) if result and result[0] is not None else b''
 
-def get_all_trips(cur, debug = False):
-    """ Gets trips in db
+def get_day_bounds(cur, date, debug = False):
+    """ Bounding boxes of the trips of a day, and of the canonical trips related to them
 
     Args:
         cur (:obj:`psycopg2.cursor`)
+        date (str)
         debug (bool, optional): activates debug mode. 
             Defaults to False
     Returns:
-        :obj:`list` of :obj:`dict`
+        :obj:`dict`: trips and canonical_trips, with lists of (min lat, min lon, max lat, max lon)
     """
-    cur.execute("SELECT trip_id, ST_AsGEOJson(points) FROM trips")
-    trips = cur.fetchall()
-    return [{'id': t[0], 'points': json.loads(t[1])} for t in trips]
+    cur.execute("""
+        SELECT 'trips', ST_YMin(g), ST_XMin(g), ST_YMax(g), ST_XMax(g)
+        FROM (SELECT points::geometry AS g FROM trips WHERE day = %s) AS t
+        UNION ALL
+        SELECT 'canonical_trips', ST_YMin(g), ST_XMin(g), ST_YMax(g), ST_XMax(g)
+        FROM (
+            SELECT c.points::geometry AS g FROM canonical_trips AS c
+            WHERE EXISTS (
+                SELECT 1 FROM canonical_trips_relations AS r INNER JOIN trips AS t ON t.trip_id = r.trip
+                WHERE r.canonical_trip = c.canonical_id AND t.day = %s
+            )
+        ) AS c
+    """, (date, date))
+
+    bounds = {'trips': [], 'canonical_trips': []}
+    for layer, min_lat, min_lon, max_lat, max_lon in cur.fetchall():
+        bounds[layer].append((min_lat, min_lon, max_lat, max_lon))
+
+    return bounds
 
 def remove_trips_from_day(cur, date, debug= False):
     ''' Removes trips and stays associated to a certain day
@@ -702,10 +1626,66 @@ def remove_trips_from_day(cur, date, debug= False):
             Defaults to False
     '''
     cur.execute("""
-        DELETE FROM trips WHERE start_date::date = %s;
-        DELETE FROM stays WHERE start_date::date = %s;
+        DELETE FROM trips WHERE day = %s;
+        DELETE FROM stays WHERE day = %s;
     """, (date, date)) 
 
+def journal_day(cur, date, files, debug = False):
+    """ Records that a day was stored, along with the file operations still to be done
+
+    Must run in the same transaction as the day's writes, so that the day is either
+    stored and journaled, or neither. See `finish_journal_entry`
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        date (str)
+        files (:obj:`dict`): file operations, see `ProcessingManager.day_files`
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        int: journal entry id
+    """
+    cur.execute("""
+        INSERT INTO bulk_journal (day, files)
+        VALUES (%s, %s)
+        RETURNING journal_id
+    """, (date, json.dumps(files)))
+    return cur.fetchone()[0]
+
+def pending_journal_entries(cur, debug = False):
+    """ Days that were stored, but whose file operations may not be done
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        :obj:`list` of (int, str, :obj:`dict`): journal entry id, day and file operations,
+            in the order they were stored
+    """
+    cur.execute("""
+        SELECT journal_id, day, files FROM bulk_journal
+        WHERE done_at IS NULL
+        ORDER BY journal_id
+    """)
+    return [(journal_id, day.isoformat(), files) for journal_id, day, files in cur.fetchall()]
+
+def finish_journal_entry(cur, journal_id, debug = False):
+    """ Marks the file operations of a day as done
+
+    Their contents are no longer needed, and are dropped
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        journal_id (int)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    """
+    cur.execute("""
+        UPDATE bulk_journal SET done_at = now(), files = NULL
+        WHERE journal_id = %s
+    """, (journal_id,))
+
 def remove_canonical_trips_from_day(cur, date, debug=False):
     ''' Removes canonical trips that are only associated to one track of a certain day
     
@@ -716,7 +1696,7 @@ def remove_canonical_trips_from_day(cur, date, debug=False):
             Defaults to False
     '''
     
-    cur.execute(f"""
+    cur.execute("""
         DELETE FROM canonical_trips c WHERE c.canonical_id IN (
             SELECT canonical_id FROM (
                 SELECT canonical_trip as canonical_id, trip as trip_id FROM
@@ -728,10 +1708,10 @@ def remove_canonical_trips_from_day(cur, date, debug=False):
                     ) AS b
                 USING (canonical_trip)
             ) relations INNER JOIN (
-                SELECT trip_id FROM trips WHERE start_date::date = '{date}'
+                SELECT trip_id FROM trips WHERE day = %s
             ) trips USING (trip_id)
         )
-    """)
+    """, (date,))
 
 
 def execute_query(cur, query, debug = False):
@@ -8,17 +8,34 @@ CONFIG = {
     'output_path': None,
     'life_path': None,
     'life_all': None,
+    'tile_cache_path': None,
+    'gpx_cache_path': None,
+    'watch_input': True,
+    'watch_interval': 2,
     'db': {
         'host': None,
         'port': None,
         'name': None,
         'user': None,
-        'pass': None
+        'pass': None,
+        'pool_min_size': 1,
+        'pool_max_size': 10,
+        'pool_health_check': True,
+        'pool_timeout': 30
     },
     'default_timezone': 0,
     'trip_annotations': False,
     'bulk_calculate_canonical': True,
+    'bulk_workers': 1,
+    'bulk_queue_size': 2,
+    'prefetch_days': 2,
+    'stage_cache_path': None,
     'load_more_amount': 10,
+    'viewport': {
+        'max_sessions': 100,
+        'max_tiles': 64,
+        'max_zoom': 16
+    },
     'trip_name_format': '%Y-%m-%d',
     'multiple_gpxs_for_day': False,
     'smoothing': {
@@ -41,10 +58,14 @@ CONFIG = {
         'use': True,
         'max_distance': 20,
         'min_samples': 2,
+        'sample_size': 50,
         'limit': 5,
         'use_google': True,
         'google_key': '',
         'use_foursquare': True,
-        'foursquare_key': ''
+        'foursquare_key': '',
+        'gazetteer_path': None,
+        'place_cache_precision': 4,
+        'place_cache_size': 10000
     },
 }
@@ -0,0 +1,181 @@
+"""
+In-process spatial index of locations
+
+Keeps the centroid of every location in a k-d tree, so that suggesting a location
+(see `db.query_locations`) needs no database round trip.
+"""
+import threading
+import numpy as np
+
+from scipy.spatial import cKDTree
+from tracktotrip3 import Point
+
+# Mean radius of the Earth, in meters
+EARTH_RADIUS = 6371008.8
+# Locations changed after the tree was built are searched one by one, until there are
+# more than this
+MAX_PENDING = 256
+
+def to_xyz(lats, lons):
+    """ Positions on the unit sphere, where the euclidean distance between two points
+        grows with their distance over the Earth
+
+    Args:
+        lats (:obj:`numpy.ndarray` or float): latitudes, in degrees
+        lons (:obj:`numpy.ndarray` or float): longitudes, in degrees
+    Returns:
+        :obj:`numpy.ndarray`: (x, y, z) rows, or a single one
+    """
+    lats = np.radians(lats)
+    lons = np.radians(lons)
+    return np.stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)), axis=-1)
+
+def chord_length(meters):
+    """ Euclidean distance, on the unit sphere, of two points some meters apart
+
+    See `to_xyz`
+
+    Args:
+        meters (float)
+    Returns:
+        float
+    """
+    return 2 * np.sin(min(meters / EARTH_RADIUS, np.pi) / 2)
+
+def distances(lat, lon, lats, lons):
+    """ Distances from a point to other points, with the haversine formula
+
+    Args:
+        lat (float)
+        lon (float)
+        lats (:obj:`numpy.ndarray`)
+        lons (:obj:`numpy.ndarray`)
+    Returns:
+        :obj:`numpy.ndarray`: distances, in meters
+    """
+    lat, lon, lats, lons = np.radians(lat), np.radians(lon), np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+class LocationIndex(object):
+    """ k-d tree of location centroids
+
+    scipy's k-d trees can't be changed, so locations that are added or moved after the
+    tree is built are kept apart, and searched one by one, until there are more than
+    `MAX_PENDING` of them and the tree is rebuilt. The index must be kept up to date with
+    every write to the locations table, see `update`. Updates can be received while the
+    index is loading, and win over the rows it reads.
+
+    Arguments:
+        locations: Dictionary with the label, latitude and longitude of each location id
+        ids: Location id of each point of the tree
+        tree: k-d tree of the locations' positions, see `to_xyz`
+        pending: Ids of the locations changed since the tree was built
+        pending_ids: Sorted `pending` ids, and `pending_xyz` their positions. Computed
+            when needed, see `query`
+        ready: True once the locations were read from the database
+    """
+    def __init__(self, debug = False):
+        self.debug = debug
+        self.locations = {}
+        self.ids = []
+        self.tree = None
+        self.pending = set()
+        self.pending_ids = []
+        self.pending_xyz = None
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def load(self, cur):
+        """ Reads every location from the database
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+        Returns:
+            :obj:`LocationIndex`: self
+        """
+        cur.execute("""
+            SELECT location_id, label, ST_Y(centroid::geometry), ST_X(centroid::geometry)
+            FROM locations
+            """)
+        rows = cur.fetchall()
+
+        with self.lock:
+            for location_id, label, lat, lon in rows:
+                if location_id not in self.locations:
+                    self.locations[location_id] = (label, lat, lon)
+            self.rebuild()
+            self.ready = True
+
+        return self
+
+    def rebuild(self):
+        """ Rebuilds the tree with every location. Must hold the lock
+        """
+        self.ids = sorted(self.locations.keys())
+        self.pending = set()
+        self.pending_xyz = None
+        if len(self.ids) > 0:
+            coords = np.array([self.locations[location_id][1:] for location_id in self.ids])
+            self.tree = cKDTree(to_xyz(coords[:, 0], coords[:, 1]))
+        else:
+            self.tree = None
+
+    def update(self, location_id, label, centroid):
+        """ Registers a location that was inserted, or moved, in the database
+
+        See `db.LocationCache.flush`
+
+        Args:
+            location_id (int)
+            label (str)
+            centroid (:obj:`tracktotrip3.Point`)
+        """
+        with self.lock:
+            self.locations[location_id] = (label, centroid.lat, centroid.lon)
+            self.pending.add(location_id)
+            self.pending_xyz = None
+            if self.ready and len(self.pending) > MAX_PENDING:
+                self.rebuild()
+
+    def query(self, lat, lon, radius):
+        """ Locations within a radius of a point
+
+        Behaves like `db.query_locations`, but measures distances over a sphere
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+            radius (float): Radius from the given point, in meters
+        Returns:
+            :obj:`list` of (str, :obj:`tracktotrip3.Point`, None): label and centroid of
+                each location, closest first. Point clusters aren't kept
+        """
+        position = to_xyz(lat, lon)
+        # Slack for rounding errors, distances are checked afterwards
+        chord = chord_length(radius * 4) * (1 + 1e-9)
+
+        with self.lock:
+            candidates = []
+            if self.tree is not None:
+                nearby = self.tree.query_ball_point(position, chord)
+                candidates = [self.ids[i] for i in nearby if self.ids[i] not in self.pending]
+
+            if len(self.pending) > 0:
+                if self.pending_xyz is None:
+                    self.pending_ids = sorted(self.pending)
+                    coords = np.array([self.locations[location_id][1:] for location_id in self.pending_ids])
+                    self.pending_xyz = to_xyz(coords[:, 0], coords[:, 1])
+                nearby = np.flatnonzero(np.linalg.norm(self.pending_xyz - position, axis=1) <= chord)
+                candidates.extend(self.pending_ids[i] for i in nearby)
+
+            rows = [self.locations[location_id] for location_id in candidates]
+
+        if len(rows) == 0:
+            return []
+
+        coords = np.array([row[1:] for row in rows], dtype=float)
+        meters = distances(lat, lon, coords[:, 0], coords[:, 1])
+        order = [i for i in np.argsort(meters, kind='stable') if meters[i] <= radius * 4]
+
+        return [(rows[i][0], Point(rows[i][1], rows[i][2], None), None) for i in order]
@@ -8,8 +8,9 @@ import json
 from os import remove
 from os.path import join, expanduser, isfile
 from life.life import Life
-from main import db
-from utils import Manager, merge_bounding_boxes
+from main import db, migrations, tiles
+from main.viewport import ViewportSessions
+from utils import Manager
 
 class MainManager(Manager):
     """ Manager that contains general features
@@ -20,7 +21,7 @@ class MainManager(Manager):
     def __init__(self, config_file, debug):
         super().__init__(config_file, debug)
         self.configFile = config_file
-        self.loadedBoundingBox = [{"lat": 0, "lon": 0}, {"lat": 0, "lon": 0}]
+        self.viewports = ViewportSessions(self.config['viewport']['max_sessions'])
 
     def update_config(self, new_config):
         """ Updates the config object by overlapping with the new config object
@@ -32,6 +33,22 @@ class MainManager(Manager):
         with open(expanduser(self.configFile), 'w') as config_file:
             json.dump(self.config, config_file, indent=4)
 
+    def pending_migrations(self):
+        """ Lists database migrations that weren't applied yet
+
+        See `migrations.pending_migrations`
+
+        Returns:
+            :obj:`list` of str or None: None if the database is unreachable
+        """
+        conn, cur = self.db_connect()
+        pending = None
+        if conn and cur:
+            pending = [name for _, name, _ in migrations.pending_migrations(cur)]
+
+        db.dispose(conn, cur)
+        return pending
+
     def get_trips_and_locations(self):
         """ Fetches canonical trips and locations from the database
 
@@ -43,7 +60,7 @@ class MainManager(Manager):
 
         conn, cur = self.db_connect()
         if conn and cur:
-            trips = db.get_canonical_trips(cur, self.debug)
+            trips = db.get_canonical_trips(cur, debug=self.debug)
             locations = db.get_canonical_locations(cur, self.debug)
 
         db.dispose(conn, cur)
@@ -65,109 +82,221 @@ class MainManager(Manager):
         db.dispose(conn, cur)
         return {"locations": locations}
 
-    def get_canonical_trips(self):
+    def get_canonical_trips(self, tolerance=None):
         """ Fetches canonical trips from the database
 
         See `db.get_canonical_trips`
 
+        Args:
+            tolerance (float, optional): simplification tolerance, in degrees
         Returns:
             :obj:`dict`
         """
 
         conn, cur = self.db_connect()
         if conn and cur:
-            trips = db.get_canonical_trips(cur, self.debug)
+            trips = db.get_canonical_trips(cur, tolerance, self.debug)
 
         db.dispose(conn, cur)
         return {"trips": trips}
 
-    def get_trips(self, latMin, lonMin, latMax, lonMax, canonical):
-        """ Fetches trips from the database in bounds
+    def viewport(self, session, canonical, tolerance, reset=False):
+        """ Gets the viewport of a client session
 
-        See `db.get_trips`
+        Trips and canonical trips, at each level of detail, are loaded independently
+
+        Args:
+            session (str): session id
+            canonical (bool): determines whether the trips are canonical or not
+            tolerance (float): simplification tolerance, in degrees
+            reset (bool, optional): starts a new viewport. Defaults to False
+        Returns:
+            :obj:`viewport.Viewport`
+        """
+        layer = '%s:%s' % ('canonical_trips' if canonical else 'trips', db.lod_column(tolerance))
+        if reset:
+            return self.viewports.reset(session, layer)
+        return self.viewports.get(session, layer)
+
+    def viewport_tiles(self, latMin, lonMin, latMax, lonMax):
+        """ Tiles that cover a bounding box
+
+        See `tiles.covering_tiles`
 
         Args:
             latMin (float): minimum latitude of bounds
             lonMin (float): minimum longitude of bounds
             latMax (float): maximum latitude of bounds
             lonMax (float): minimum longitude of bounds
+        Returns:
+            :obj:`list` of (int, int, int)
+        """
+        c_viewport = self.config['viewport']
+        bounds = (float(latMin), float(lonMin), float(latMax), float(lonMax))
+        return tiles.covering_tiles(bounds, c_viewport['max_zoom'], c_viewport['max_tiles'])
+
+    def load_viewport_tiles(self, viewport, viewport_tiles, canonical, tolerance):
+        """ Fetches the trips in tiles that a viewport didn't load yet, and marks them as loaded
+
+        See `db.get_trips`
+
+        Args:
+            viewport (:obj:`viewport.Viewport`)
+            viewport_tiles (:obj:`list` of (int, int, int))
             canonical (bool): determines whether the trips are canonical or not
+            tolerance (float): simplification tolerance, in degrees
         Returns:
-            :obj:`dict`
+            :obj:`list` of :obj:`dict`
         """
+        uncovered = viewport.uncovered(viewport_tiles)
+        trips = []
 
         conn, cur = self.db_connect()
-        self.loadedBoundingBox = [{"lat": latMin, "lon": lonMin}, {"lat": latMax, "lon": lonMax}]
-
         if conn and cur:
-            trips = db.get_trips(cur, self.loadedBoundingBox, canonical, self.debug)
+            tiles_bounds = [tiles.tile_bounds(*tile) for tile in uncovered]
+            trips, trip_ids = db.get_trips(cur, tiles_bounds, viewport.trips, canonical, tolerance, self.debug)
+            viewport.load(uncovered, trip_ids)
 
         db.dispose(conn, cur)
-        return {"trips": trips}
+        return trips
 
-    def can_get_more_trips(self, latMin, lonMin, latMax, lonMax, canonical):
-        """ Checks whether there are trips in db that haven't been fetched yet in a certain bounding box
+    def get_trips(self, session, latMin, lonMin, latMax, lonMax, canonical, tolerance=None):
+        """ Fetches trips from the database in bounds, starting a new viewport for the session
 
-        See `db.get_more_trips`
+        See `load_viewport_tiles`
 
         Args:
+            session (str): client session id
             latMin (float): minimum latitude of bounds
             lonMin (float): minimum longitude of bounds
             latMax (float): maximum latitude of bounds
             lonMax (float): minimum longitude of bounds
             canonical (bool): determines whether the trips are canonical or not
+            tolerance (float, optional): simplification tolerance, in degrees
         Returns:
             :obj:`dict`
         """
 
-        conn, cur = self.db_connect()
+        viewport = self.viewport(session, canonical, tolerance, reset=True)
+        viewport_tiles = self.viewport_tiles(latMin, lonMin, latMax, lonMax)
+        return {"trips": self.load_viewport_tiles(viewport, viewport_tiles, canonical, tolerance)}
+
+    def can_get_more_trips(self, session, latMin, lonMin, latMax, lonMax, canonical, tolerance=None):
+        """ Checks whether there are trips in db that the session hasn't fetched yet in a certain bounding box
+
+        See `db.can_get_more_trips`
+
+        Args:
+            session (str): client session id
+            latMin (float): minimum latitude of bounds
+            lonMin (float): minimum longitude of bounds
+            latMax (float): maximum latitude of bounds
+            lonMax (float): minimum longitude of bounds
+            canonical (bool): determines whether the trips are canonical or not
+            tolerance (float, optional): simplification tolerance, in degrees
+        Returns:
+            bool
+        """
+
+        viewport = self.viewport(session, canonical, tolerance)
+        uncovered = viewport.uncovered(self.viewport_tiles(latMin, lonMin, latMax, lonMax))
+        can_load = False
 
+        conn, cur = self.db_connect()
         if conn and cur:
-            can_load = db.can_get_more_trips(cur, [{"lat": latMin, "lon": lonMin}, {"lat": latMax, "lon": lonMax}], self.loadedBoundingBox, canonical, self.debug)
+            tiles_bounds = [tiles.tile_bounds(*tile) for tile in uncovered]
+            can_load = db.can_get_more_trips(cur, tiles_bounds, viewport.trips, canonical, self.debug)
 
         db.dispose(conn, cur)
         return can_load
 
-    def get_more_trips(self, latMin, lonMin, latMax, lonMax, canonical):
-        """ Fetches trips from the database in bounds that have not yet been loaded
+    def get_more_trips(self, session, latMin, lonMin, latMax, lonMax, canonical, tolerance=None):
+        """ Fetches trips from the database in bounds that the session has not yet loaded
 
-        See `db.get_more_trips`
+        Only the tiles of the bounds that weren't loaded are queried. See `load_viewport_tiles`
 
         Args:
+            session (str): client session id
             latMin (float): minimum latitude of bounds
             lonMin (float): minimum longitude of bounds
             latMax (float): maximum latitude of bounds
             lonMax (float): minimum longitude of bounds
             canonical (bool): determines whether the trips are canonical or not
+            tolerance (float, optional): simplification tolerance, in degrees
         Returns:
             :obj:`dict`
         """
 
-        conn, cur = self.db_connect()
+        viewport = self.viewport(session, canonical, tolerance)
+        viewport_tiles = self.viewport_tiles(latMin, lonMin, latMax, lonMax)
+        return {"trips": self.load_viewport_tiles(viewport, viewport_tiles, canonical, tolerance)}
 
-        if conn and cur:
-            trips = db.get_more_trips(cur, [{"lat": latMin, "lon": lonMin}, {"lat": latMax, "lon": lonMax}], self.loadedBoundingBox, canonical, self.debug)
+    def stream_all_trips(self, ndjson=False):
+        """ Streams all trips from the database, as they are fetched
 
-        self.loadedBoundingBox = merge_bounding_boxes([{"lat": latMin, "lon": lonMin}, {"lat": latMax, "lon": lonMax}], self.loadedBoundingBox) 
+        Either as a `{"trips": [...]}` JSON object or, with `ndjson`, as one trip per line
 
-        db.dispose(conn, cur)
-        return {"trips": trips}
+        See `db.stream_all_trips`
 
-    def get_all_trips(self):
-        """ Fetches all trips from the database
+        Args:
+            ndjson (bool, optional): Defaults to False
+        Yields:
+            str: chunks of the response
+        """
+        if not ndjson:
+            yield '{"trips": ['
 
-        See `db.get_all_trips`
+        conn, cur = self.db_connect()
+        if conn:
+            try:
+                first = True
+                for trips in db.stream_all_trips(conn, debug=self.debug):
+                    trips = ['{"id": %d, "points": %s}' % trip for trip in trips]
+                    if ndjson:
+                        yield '\n'.join(trips) + '\n'
+                    else:
+                        yield ('' if first else ', ') + ', '.join(trips)
+                    first = False
+            finally:
+                db.dispose(conn, cur)
+
+        if not ndjson:
+            yield ']}'
+
+    def get_tile(self, layer, zoom, x, y):
+        """ Gets a Mapbox Vector Tile of a layer, from the tile cache or from the database
+
+        See `db.get_tile`
 
+        Args:
+            layer (str): trips, canonical_trips or locations
+            zoom (int)
+            x (int)
+            y (int)
         Returns:
-            :obj:`dict`
+            bytes or None: None if the layer or the tile don't exist
         """
-
+        if layer not in db.TILE_LAYERS or not tiles.is_valid_tile(zoom, x, y):
+            return None
+
+        cache = self.tile_cache()
+        if cache:
+            tile = cache.get(layer, zoom, x, y)
+            if tile is not None:
+                return tile
+            # Read before the tile is, so that it isn't cached if it changes meanwhile
+            generation = cache.generation(layer)
+
+        tile = None
         conn, cur = self.db_connect()
         if conn and cur:
-            trips = db.get_all_trips(cur, self.debug)
+            tile = db.get_tile(cur, layer, zoom, x, y, tiles.TILE_EXTENT, tiles.TILE_BUFFER, self.debug)
 
         db.dispose(conn, cur)
-        return {"trips": trips}
+
+        if cache and tile is not None:
+            cache.put(layer, zoom, x, y, tile, generation)
+        return tile
 
     def get_life_from_day(self, date):
         """ Returns the LIFE representation of a day in the database
@@ -221,12 +350,14 @@ class MainManager(Manager):
 
         conn, cur = self.db_connect()
         if conn and cur:
+            changed_bounds = db.get_day_bounds(cur, date, self.debug)
             #if canonical trips exist that are only tied to deleted trips, delete
             db.remove_canonical_trips_from_day(cur, date, self.debug)
             #delete trips/stays
             db.remove_trips_from_day(cur, date, self.debug)
 
             db.dispose(conn, cur)
+            self.invalidate_tiles(changed_bounds)
 
         day_datetime = datetime.strptime(date, "%Y-%m-%d")
         
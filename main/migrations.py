@@ -0,0 +1,143 @@
+"""
+Database schema migrations
+
+Migrations live in the `migrations` folder, and are named with their version
+number followed by a description, e.g. `0003_spatial_indexes.sql`. They are either
+SQL files, or Python files that define a `migrate(cur, config, debug)` function.
+Applied versions are recorded in the `schema_migrations` table.
+"""
+import re
+import importlib.util
+
+from os import listdir
+from os.path import join, dirname, abspath, splitext
+
+MIGRATIONS_PATH = join(dirname(dirname(abspath(__file__))), 'migrations')
+MIGRATION_RX = re.compile(r'^(\d+)_(\w+)\.(sql|py)$')
+# Key of the advisory lock that serializes concurrent migration runs
+MIGRATION_LOCK = 4326001
+
+def list_migrations(path=MIGRATIONS_PATH):
+    """ Lists available migrations, sorted by version
+
+    Args:
+        path (str, optional): migrations folder
+    Returns:
+        :obj:`list` of (int, str, str): version, name and file path
+    """
+    migrations = []
+    for filename in listdir(path):
+        match = MIGRATION_RX.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), splitext(filename)[0], join(path, filename)))
+
+    return sorted(migrations)
+
+def create_migrations_table(cur):
+    """ Creates the `schema_migrations` table, if it doesn't exist
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+        )
+    """)
+
+def applied_migrations(cur):
+    """ Versions that were already applied to the database
+
+    Doesn't change the database: none were applied if there's no `schema_migrations`
+    table, which is created by `migrate`
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+    Returns:
+        :obj:`set` of int
+    """
+    cur.execute("SELECT to_regclass('schema_migrations')")
+    if cur.fetchone()[0] is None:
+        return set()
+
+    cur.execute("SELECT version FROM schema_migrations")
+    return set([row[0] for row in cur.fetchall()])
+
+def pending_migrations(cur, path=MIGRATIONS_PATH):
+    """ Lists migrations that weren't applied yet
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        path (str, optional): migrations folder
+    Returns:
+        :obj:`list` of (int, str, str): version, name and file path
+    """
+    applied = applied_migrations(cur)
+    return [m for m in list_migrations(path) if m[0] not in applied]
+
+def apply_migration(cur, migration, config, debug = False):
+    """ Applies a single migration, and records it
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        migration ((int, str, str)): version, name and file path
+        config (:obj:`dict`)
+        debug (bool, optional): activates debug mode.
+            Defaults to False
+    """
+    version, name, path = migration
+
+    if path.endswith('.sql'):
+        with open(path, 'r') as sql_file:
+            cur.execute(sql_file.read())
+    else:
+        spec = importlib.util.spec_from_file_location('migration_%s' % name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.migrate(cur, config, debug)
+
+    cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+
+def migrate(conn, cur, config, debug = False, path=MIGRATIONS_PATH):
+    """ Applies every pending migration, in order
+
+    Each migration runs, and is committed, in its own transaction
+
+    Args:
+        conn (:obj:`psycopg2.connection`)
+        cur (:obj:`psycopg2.cursor`)
+        config (:obj:`dict`)
+        debug (bool, optional): activates debug mode.
+            Defaults to False
+        path (str, optional): migrations folder
+    Returns:
+        :obj:`list` of str: names of the applied migrations
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK,))
+    create_migrations_table(cur)
+    conn.commit()
+
+    applied = []
+    for migration in pending_migrations(cur, path):
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK,))
+        # Another process may have applied it while waiting for the lock
+        if migration[0] in applied_migrations(cur):
+            conn.commit()
+            continue
+
+        if debug:
+            print("Applying migration %s" % migration[1])
+
+        try:
+            apply_migration(cur, migration, config, debug)
+        except Exception:
+            conn.rollback()
+            raise
+
+        conn.commit()
+        applied.append(migration[1])
+
+    conn.commit()
+    return applied
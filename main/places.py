@@ -0,0 +1,213 @@
+"""
+Named places around a point, used to suggest locations
+
+Places come from providers: an offline gazetteer, read from a local file, and the
+Google and Foursquare APIs. Each provider's results are cached by rounded coordinate,
+so nearby points share them and suggestions don't change between requests.
+"""
+import csv
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from os.path import expanduser
+from scipy.spatial import cKDTree
+from tracktotrip3 import Point
+from tracktotrip3.location import query_google, query_foursquare
+from main.location_index import to_xyz, chord_length, distances
+
+class PlaceProvider(object):
+    """ Source of named places
+
+    Subclasses implement `search`
+    """
+    def search(self, point, radius):
+        """ Places within a radius of a point
+
+        Args:
+            point (:obj:`tracktotrip3.Point`)
+            radius (float): Radius, in meters
+        Returns:
+            :obj:`list` of :obj:`dict`: places, with their label, distance to the point (in
+                meters), types and suggestion type. See `tracktotrip3.location.query_google`
+        """
+        raise NotImplementedError()
+
+class GoogleProvider(PlaceProvider):
+    """ Places from Google's Places API, see `tracktotrip3.location.query_google`
+    """
+    def __init__(self, key, debug = False):
+        self.key = key
+        self.debug = debug
+
+    def search(self, point, radius):
+        return query_google(point, radius, self.key, self.debug)
+
+class FoursquareProvider(PlaceProvider):
+    """ Places from Foursquare's Places API, see `tracktotrip3.location.query_foursquare`
+    """
+    def __init__(self, key, debug = False):
+        self.key = key
+        self.debug = debug
+
+    def search(self, point, radius):
+        return query_foursquare(point, radius, self.key, self.debug)
+
+class GazetteerProvider(PlaceProvider):
+    """ Places from a local file, to use without network access
+
+    The file is a CSV with a header, and `name`, `lat` and `lon` columns. An optional
+    `types` column has the types of each place, separated by `|`. It's read the first
+    time it's searched, into a k-d tree of the places' positions
+
+    Arguments:
+        path: Path of the file
+        places: List with the name, latitude, longitude and types of each place
+        tree: k-d tree of the places' positions, see `location_index.to_xyz`
+    """
+    def __init__(self, path, debug = False):
+        self.path = expanduser(path)
+        self.debug = debug
+        self.places = None
+        self.tree = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """ Reads the places, if they weren't read yet
+
+        A missing, or malformed, file has no places, so that suggestions come from the
+        stored locations. It isn't read again
+        """
+        with self.lock:
+            if self.places is not None:
+                return
+
+            places = []
+            try:
+                with open(self.path, 'r', encoding='utf8', newline='') as gazetteer_file:
+                    for row in csv.DictReader(gazetteer_file):
+                        types = [t for t in (row.get('types') or '').split('|') if t]
+                        places.append((row['name'], float(row['lat']), float(row['lon']), types))
+            except (OSError, ValueError, TypeError, KeyError, csv.Error) as error:
+                if self.debug:
+                    print("Could not load places from %s: %s" % (self.path, error))
+                places = []
+
+            if len(places) > 0:
+                coords = np.array([place[1:3] for place in places])
+                self.tree = cKDTree(to_xyz(coords[:, 0], coords[:, 1]))
+            self.places = places
+
+            if self.debug:
+                print("Loaded %d places from %s" % (len(places), self.path))
+
+    def search(self, point, radius):
+        self.load()
+        if self.tree is None:
+            return []
+
+        nearby = self.tree.query_ball_point(to_xyz(point.lat, point.lon), chord_length(radius) * (1 + 1e-9))
+        places = [self.places[i] for i in sorted(nearby)]
+        if len(places) == 0:
+            return []
+
+        coords = np.array([place[1:3] for place in places])
+        meters = distances(point.lat, point.lon, coords[:, 0], coords[:, 1])
+        return [{
+            'label': places[i][0],
+            'distance': float(meters[i]),
+            'types': places[i][3],
+            'suggestion_type': 'GAZETTEER'
+        } for i in np.argsort(meters, kind='stable') if meters[i] <= radius]
+
+class CachedProvider(PlaceProvider):
+    """ Caches the places of another provider, by rounded coordinate
+
+    Points are rounded before searching, so every point that rounds to the same
+    coordinate gets the same places, and distances. Empty results aren't cached, since
+    they may be due to an unreachable API. The least recently used coordinates are
+    evicted when there are more than `max_entries`
+
+    Arguments:
+        provider: Provider whose results are cached
+        precision: Decimal places of the rounded latitude and longitude
+        entries: Ordered dictionary, from the least to the most recently used, of the
+            places of each rounded latitude, longitude and radius
+    """
+    def __init__(self, provider, precision = 4, max_entries = 10000):
+        self.provider = provider
+        self.precision = precision
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def search(self, point, radius):
+        lat, lon = round(point.lat, self.precision), round(point.lon, self.precision)
+        key = (lat, lon, radius)
+
+        with self.lock:
+            places = self.entries.get(key)
+            if places is not None:
+                self.entries.move_to_end(key)
+
+        if places is None:
+            places = self.provider.search(Point(lat, lon, None), radius)
+            if len(places) > 0:
+                with self.lock:
+                    self.entries[key] = places
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+
+        return [dict(place) for place in places]
+
+def place_providers(c_loc, debug = False):
+    """ Providers enabled by the location settings
+
+    Args:
+        c_loc (:obj:`dict`): location settings
+        debug (bool, optional): activates debug mode.
+            Defaults to False
+    Returns:
+        :obj:`list` of :obj:`PlaceProvider`: cached providers, see `CachedProvider`
+    """
+    providers = []
+    if c_loc['use']:
+        if c_loc['gazetteer_path']:
+            providers.append(GazetteerProvider(c_loc['gazetteer_path'], debug))
+        if c_loc['use_google'] and c_loc['google_key']:
+            providers.append(GoogleProvider(c_loc['google_key'], debug))
+        if c_loc['use_foursquare'] and c_loc['foursquare_key']:
+            providers.append(FoursquareProvider(c_loc['foursquare_key'], debug))
+
+    return [CachedProvider(provider, c_loc['place_cache_precision'], c_loc['place_cache_size']) for provider in providers]
+
+def add_places(location, providers, radius, limit):
+    """ Adds the places around a location to its alternatives
+
+    Like `tracktotrip3.location.infer_location` does with the Google and Foursquare
+    APIs: places come after the stored locations, closest first, and are only searched
+    if there's room for them
+
+    Args:
+        location (:obj:`tracktotrip3.location.Location`): location inferred from the stored
+            ones
+        providers (:obj:`list` of :obj:`PlaceProvider`)
+        radius (float): Radius, in meters
+        limit (int): Maximum number of alternatives, when there are stored locations
+    Returns:
+        :obj:`tracktotrip3.location.Location`: location
+    """
+    if len(location.other) >= limit or len(providers) == 0:
+        return location
+
+    places = []
+    for provider in providers:
+        places.extend(provider.search(location.centroid, radius))
+    places = sorted(places, key=lambda place: place['distance'])
+
+    if len(location.other) > 0:
+        location.other = (location.other + places)[:limit]
+    else:
+        location.other = places
+
+    return location
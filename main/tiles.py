@@ -0,0 +1,301 @@
+"""
+Vector tiles
+
+Tiles follow the XYZ (slippy map) scheme, in the Web Mercator projection. Rendered
+tiles are cached on disk, as `<cache path>/<layer>/<z>/<x>/<y>.mvt`, until the data
+under them changes.
+"""
+import math
+import threading
+
+from os import listdir, makedirs, remove, replace, getpid
+from os.path import join, isdir, isfile
+from shutil import rmtree
+
+# Resolution and buffer of each tile, in tile units. See `ST_AsMVT`
+TILE_EXTENT = 4096
+TILE_BUFFER = 256
+MAX_ZOOM = 22
+# Latitude limits of the Web Mercator projection
+MAX_LATITUDE = 85.0511287798
+
+# Number of invalidations of each cached layer, by cache path and layer, see
+# `TileCache.generation`
+GENERATIONS = {}
+GENERATIONS_LOCK = threading.Lock()
+
+def tile_coordinates(lat, lon, zoom):
+    """ Fractional tile coordinates of a position
+
+    Args:
+        lat (float)
+        lon (float)
+        zoom (int)
+    Returns:
+        (float, float): x and y
+    """
+    n_tiles = 2 ** zoom
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    x = (lon + 180.0) / 360.0 * n_tiles
+    y = (1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * n_tiles
+    return x, y
+
+def tiles_in_bounds(bounds, zoom, buffer=float(TILE_BUFFER) / TILE_EXTENT):
+    """ Range of tiles whose (buffered) area intersects a bounding box
+
+    Args:
+        bounds ((float, float, float, float)): min latitude, min longitude, max latitude
+            and max longitude
+        zoom (int)
+        buffer (float, optional): Buffer of each tile, as a fraction of its size.
+            Defaults to the buffer used when rendering
+    Returns:
+        (int, int, int, int): min x, min y, max x and max y, inclusive
+    """
+    min_lat, min_lon, max_lat, max_lon = bounds
+    last = 2 ** zoom - 1
+    # Latitudes grow to the north, while tile rows grow to the south
+    min_x, min_y = tile_coordinates(max_lat, min_lon, zoom)
+    max_x, max_y = tile_coordinates(min_lat, max_lon, zoom)
+
+    return (
+        max(0, int(math.floor(min_x - buffer))),
+        max(0, int(math.floor(min_y - buffer))),
+        min(last, int(math.floor(max_x + buffer))),
+        min(last, int(math.floor(max_y + buffer)))
+    )
+
+def pixel_size(zoom, tile_size=256):
+    """ Approximate size of a pixel, in degrees, at a zoom level
+
+    Args:
+        zoom (float)
+        tile_size (int, optional): tile size, in pixels. Defaults to 256
+    Returns:
+        float
+    """
+    return 360.0 / (tile_size * 2 ** zoom)
+
+def tile_bounds(zoom, x, y):
+    """ Bounding box of a tile
+
+    Args:
+        zoom (int)
+        x (int)
+        y (int)
+    Returns:
+        (float, float, float, float): min latitude, min longitude, max latitude
+            and max longitude
+    """
+    n_tiles = 2 ** zoom
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2.0 * row / n_tiles))))
+
+    return (
+        latitude(y + 1),
+        x * 360.0 / n_tiles - 180.0,
+        latitude(y),
+        (x + 1) * 360.0 / n_tiles - 180.0
+    )
+
+def covering_tiles(bounds, max_zoom, max_tiles):
+    """ Tiles that cover a bounding box, at the deepest zoom level that needs at most
+        `max_tiles` of them
+
+    Args:
+        bounds ((float, float, float, float)): min latitude, min longitude, max latitude
+            and max longitude
+        max_zoom (int)
+        max_tiles (int)
+    Returns:
+        :obj:`list` of (int, int, int): zoom, x and y of each tile
+    """
+    for zoom in range(max_zoom, -1, -1):
+        min_x, min_y, max_x, max_y = tiles_in_bounds(bounds, zoom, 0)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) <= max_tiles or zoom == 0:
+            return [(zoom, x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+def is_valid_tile(zoom, x, y):
+    """ Checks if a tile exists
+
+    Args:
+        zoom (int)
+        x (int)
+        y (int)
+    Returns:
+        bool
+    """
+    return 0 <= zoom <= MAX_ZOOM and 0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom
+
+class TileCache(object):
+    """ On-disk cache of rendered tiles
+
+    A tile rendered while its layer is invalidated may have been read before the
+    change, so it's only cached if the layer's generation didn't change since the
+    tile started being rendered. See `generation` and `put`
+
+    Arguments:
+        path: Root folder of the cache
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def tile_path(self, layer, zoom, x, y):
+        """ Path of a cached tile
+
+        Args:
+            layer (str)
+            zoom (int)
+            x (int)
+            y (int)
+        Returns:
+            str
+        """
+        return join(self.path, layer, str(zoom), str(x), '%d.mvt' % y)
+
+    def generation(self, layer):
+        """ Number of times a layer was invalidated
+
+        Shared by every cache of the same path, in this process. Clearing the whole
+        cache counts for every layer
+
+        Args:
+            layer (str)
+        Returns:
+            int
+        """
+        with GENERATIONS_LOCK:
+            return self.current_generation(layer)
+
+    def current_generation(self, layer):
+        """ See `generation`. Must hold `GENERATIONS_LOCK`
+
+        Args:
+            layer (str)
+        Returns:
+            int
+        """
+        return GENERATIONS.get((self.path, layer), 0) + GENERATIONS.get((self.path, None), 0)
+
+    def next_generation(self, layer):
+        """ Marks the tiles of a layer that are being rendered as outdated
+
+        Args:
+            layer (str or None): None for every layer
+        """
+        with GENERATIONS_LOCK:
+            key = (self.path, layer)
+            GENERATIONS[key] = GENERATIONS.get(key, 0) + 1
+
+    def get(self, layer, zoom, x, y):
+        """ Reads a cached tile
+
+        Args:
+            layer (str)
+            zoom (int)
+            x (int)
+            y (int)
+        Returns:
+            bytes or None: None if the tile isn't cached
+        """
+        path = self.tile_path(layer, zoom, x, y)
+        if not isfile(path):
+            return None
+
+        try:
+            with open(path, 'rb') as tile_file:
+                return tile_file.read()
+        except OSError:
+            return None
+
+    def put(self, layer, zoom, x, y, tile, generation=None):
+        """ Caches a tile
+
+        The tile is written to a temporary file first, so readers never see it partially written
+
+        Args:
+            layer (str)
+            zoom (int)
+            x (int)
+            y (int)
+            tile (bytes)
+            generation (int, optional): generation of the layer when the tile started
+                being rendered, see `generation`. Defaults to None, to always cache it
+        Returns:
+            bool: False if the layer was invalidated meanwhile, and the tile wasn't cached
+        """
+        path = self.tile_path(layer, zoom, x, y)
+        makedirs(join(self.path, layer, str(zoom), str(x)), exist_ok=True)
+
+        tmp_path = '%s.%d.%d.tmp' % (path, getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as tile_file:
+            tile_file.write(tile)
+
+        # Invalidations change the generation before removing tiles, so a tile is either
+        # discarded here, or written before it can be removed
+        with GENERATIONS_LOCK:
+            if generation is None or generation == self.current_generation(layer):
+                replace(tmp_path, path)
+                return True
+
+        remove(tmp_path)
+        return False
+
+    def invalidate(self, layer, bounds):
+        """ Removes the cached tiles of a layer that intersect some bounding boxes
+
+        Only zoom levels and columns present in the cache are visited
+
+        Args:
+            layer (str)
+            bounds (:obj:`list` of (float, float, float, float)): min latitude, min longitude,
+                max latitude and max longitude of each changed geometry
+        Returns:
+            int: number of removed tiles
+        """
+        if len(bounds) == 0:
+            return 0
+
+        self.next_generation(layer)
+        layer_path = join(self.path, layer)
+        if not isdir(layer_path):
+            return 0
+
+        removed = 0
+        for zoom in listdir(layer_path):
+            if not zoom.isdigit():
+                continue
+            zoom_path = join(layer_path, zoom)
+            ranges = [tiles_in_bounds(bbox, int(zoom)) for bbox in bounds]
+
+            for x in listdir(zoom_path):
+                if not x.isdigit():
+                    continue
+                rows = [(min_y, max_y) for min_x, min_y, max_x, max_y in ranges if min_x <= int(x) <= max_x]
+                if len(rows) == 0:
+                    continue
+
+                for tile in listdir(join(zoom_path, x)):
+                    y = tile.split('.')[0]
+                    if not tile.endswith('.mvt') or not y.isdigit():
+                        continue
+                    if any(min_y <= int(y) <= max_y for min_y, max_y in rows):
+                        try:
+                            remove(join(zoom_path, x, tile))
+                            removed += 1
+                        except OSError:
+                            pass
+
+        return removed
+
+    def clear(self, layer=None):
+        """ Removes every cached tile, or the ones of a layer
+
+        Args:
+            layer (str, optional)
+        """
+        self.next_generation(layer)
+        path = join(self.path, layer) if layer else self.path
+        if isdir(path):
+            rmtree(path, ignore_errors=True)
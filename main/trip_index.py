@@ -0,0 +1,150 @@
+"""
+In-process spatial index of canonical trips
+
+Keeps every canonical trip, decoded once, in an R-tree of their bounding boxes, so
+that matching a trip (see `db.match_canonical_trip`) needs no database round trip.
+"""
+from rtreelib import RTree, Rect
+from main import db
+
+# Slack added to rectangles, since the R-tree doesn't report the ones that only touch,
+# or that have no area
+EPSILON = 1e-9
+
+def intersects(bounds_a, bounds_b):
+    """ Checks if two bounding boxes intersect, including their edges
+
+    Args:
+        bounds_a ((float, float, float, float)): min latitude, min longitude, max latitude
+            and max longitude
+        bounds_b ((float, float, float, float))
+    Returns:
+        bool
+    """
+    return bounds_a[0] <= bounds_b[2] and bounds_b[0] <= bounds_a[2] and \
+        bounds_a[1] <= bounds_b[3] and bounds_b[1] <= bounds_a[3]
+
+def to_rect(bounds):
+    """ R-tree rectangle of a bounding box, expanded by `EPSILON`
+
+    Args:
+        bounds ((float, float, float, float)): min latitude, min longitude, max latitude
+            and max longitude
+    Returns:
+        :obj:`rtreelib.Rect`
+    """
+    return Rect(bounds[0] - EPSILON, bounds[1] - EPSILON, bounds[2] + EPSILON, bounds[3] + EPSILON)
+
+class CanonicalTripIndex(object):
+    """ R-tree of canonical trips
+
+    rtreelib can't remove entries, so updated trips are inserted again and their old
+    entries are ignored, until they outnumber the trips and the tree is rebuilt. The
+    index must be kept up to date with every write to the canonical_trips table, see
+    `insert` and `update`.
+
+    Arguments:
+        trips: Dictionary with the segment and the bounds of each canonical trip id
+        tree: R-tree, whose entries are (canonical trip id, bounds)
+        stale: Number of outdated entries in the tree
+    """
+    def __init__(self, debug = False):
+        self.debug = debug
+        self.trips = {}
+        self.tree = RTree()
+        self.stale = 0
+
+    def load(self, cur):
+        """ Reads every canonical trip from the database
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+        Returns:
+            :obj:`CanonicalTripIndex`: self
+        """
+        cur.execute("SELECT canonical_id, points FROM canonical_trips ORDER BY canonical_id")
+        for canonical_id, points in cur.fetchall():
+            self.add(canonical_id, db.to_segment(points, debug=self.debug))
+
+        return self
+
+    def add(self, canonical_id, segment):
+        """ Adds, or replaces, a canonical trip
+
+        Args:
+            canonical_id (int)
+            segment (:obj:`tracktotrip3.Segment`)
+        """
+        if canonical_id in self.trips:
+            self.stale += 1
+
+        bounds = segment.bounds()
+        self.trips[canonical_id] = (segment, bounds)
+        self.tree.insert((canonical_id, bounds), to_rect(bounds))
+
+        if self.stale > len(self.trips):
+            self.rebuild()
+
+    def rebuild(self):
+        """ Rebuilds the tree without outdated entries
+        """
+        self.tree = RTree()
+        self.stale = 0
+        for canonical_id, (_, bounds) in sorted(self.trips.items()):
+            self.tree.insert((canonical_id, bounds), to_rect(bounds))
+
+    def snapshot(self, segment):
+        """ Copy of a segment, as it's read back from the database
+
+        Only coordinates are stored, so points have no timestamps
+
+        Args:
+            segment (:obj:`tracktotrip3.Segment`)
+        Returns:
+            :obj:`db.LazySegment`
+        """
+        return db.to_segment(db.segment_to_ewkb(segment), debug=self.debug)
+
+    def insert(self, canonical_id, segment):
+        """ Registers a canonical trip that was inserted in the database
+
+        See `db.insert_canonical_trip`
+
+        Args:
+            canonical_id (int)
+            segment (:obj:`tracktotrip3.Segment`)
+        """
+        self.add(canonical_id, self.snapshot(segment))
+
+    def update(self, canonical_id, segment):
+        """ Registers a canonical trip that was updated in the database
+
+        See `db.update_canonical_trip`
+
+        Args:
+            canonical_id (int)
+            segment (:obj:`tracktotrip3.Segment`)
+        """
+        self.add(canonical_id, self.snapshot(segment))
+
+    def match(self, trip, distance):
+        """ Canonical trips with bounding boxes that intersect the bounding box of a trip
+
+        Equivalent to `db.match_canonical_trip`. Segments are returned as they are
+            stored, since `learn_trip` only changes the one it then updates
+
+        Args:
+            trip (:obj:`tracktotrip3.Segment`): Trip to match
+            distance (float): Distance, in degrees, to expand the trip's bounds
+        Returns:
+            :obj:`list` of (int, :obj:`tracktotrip3.Segment`)
+        """
+        bounds = trip.bounds(thr=distance)
+        matches = set()
+        for entry in self.tree.query(to_rect(bounds)):
+            canonical_id, entry_bounds = entry.data
+            current_bounds = self.trips[canonical_id][1]
+            if entry_bounds is current_bounds and intersects(bounds, current_bounds):
+                matches.add(canonical_id)
+
+        return [(canonical_id, self.trips[canonical_id][0]) for canonical_id in sorted(matches)]
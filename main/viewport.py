@@ -0,0 +1,106 @@
+"""
+Viewport loading state of each client
+
+Trips are sent to clients tile by tile (see `tiles.covering_tiles`). Each client
+session remembers the tiles it already loaded, and the trips it was sent, so that
+panning and zooming only fetches the uncovered tiles, and never resends a trip.
+"""
+import threading
+
+from collections import OrderedDict
+
+class Viewport(object):
+    """ Tiles and trips already sent to a client
+
+    Arguments:
+        tiles: Set of loaded tiles, as (zoom, x, y)
+        trips: Set of ids of the trips sent
+    """
+    def __init__(self):
+        self.tiles = set()
+        self.trips = set()
+
+    def is_loaded(self, tile):
+        """ Checks if a tile, or one of its ancestors, was loaded
+
+        Args:
+            tile ((int, int, int)): zoom, x and y
+        Returns:
+            bool
+        """
+        zoom, x, y = tile
+        for level in range(zoom, -1, -1):
+            shift = zoom - level
+            if (level, x >> shift, y >> shift) in self.tiles:
+                return True
+        return False
+
+    def uncovered(self, tiles):
+        """ Filters tiles that weren't loaded yet
+
+        Args:
+            tiles (:obj:`list` of (int, int, int))
+        Returns:
+            :obj:`list` of (int, int, int)
+        """
+        return [tile for tile in tiles if not self.is_loaded(tile)]
+
+    def load(self, tiles, trips):
+        """ Marks tiles as loaded, and trips as sent
+
+        Args:
+            tiles (:obj:`list` of (int, int, int))
+            trips (:obj:`list` of int): trip ids
+        """
+        self.tiles.update(tiles)
+        self.trips.update(trips)
+
+class ViewportSessions(object):
+    """ Viewports of the client sessions, one for each layer a client loads
+
+    The least recently used sessions are evicted when there are more than `max_sessions`
+
+    Arguments:
+        max_sessions: Maximum number of sessions kept
+        sessions: Ordered dictionary, from the least to the most recently used, of
+            the viewports of each (session, layer) pair
+    """
+    def __init__(self, max_sessions):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session, layer):
+        """ Gets the viewport of a session, creating it if needed
+
+        Args:
+            session (str): session id
+            layer (str): e.g. trips, or canonical trips, at a level of detail
+        Returns:
+            :obj:`Viewport`
+        """
+        key = (session, layer)
+        with self.lock:
+            viewport = self.sessions.get(key)
+            if viewport is None:
+                viewport = Viewport()
+                self.sessions[key] = viewport
+            self.sessions.move_to_end(key)
+
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+        return viewport
+
+    def reset(self, session, layer):
+        """ Starts a new, empty, viewport for a session
+
+        Args:
+            session (str): session id
+            layer (str): e.g. trips, or canonical trips, at a level of detail
+        Returns:
+            :obj:`Viewport`
+        """
+        with self.lock:
+            self.sessions.pop((session, layer), None)
+        return self.get(session, layer)
@@ -0,0 +1,39 @@
+"""
+Applies pending database migrations
+
+    $ python migrate.py --config config.json
+    $ python migrate.py --config config.json --status
+"""
+import argparse
+from main import db, migrations
+from utils import Manager
+
+def main():
+    parser = argparse.ArgumentParser(description='Applies pending database migrations')
+    parser.add_argument('--config', '-c', dest='config', metavar='c', type=str,
+            default='config.json', help='configuration file')
+    parser.add_argument('--status', dest='status', action='store_true',
+            default=False, help='only list pending migrations')
+    parser.add_argument('--debug', dest='debug', action='store_true',
+            default=False, help='print debug information')
+    args = parser.parse_args()
+
+    manager = Manager(args.config, args.debug)
+    conn, cur = manager.db_connect()
+    if not cur:
+        print("Could not connect to the database")
+        return
+
+    if args.status:
+        pending = migrations.pending_migrations(cur)
+        for _, name, _ in pending:
+            print("pending: %s" % name)
+        print("%d pending migrations" % len(pending))
+    else:
+        for name in migrations.migrate(conn, cur, manager.config, args.debug):
+            print("applied: %s" % name)
+
+    db.dispose(conn, cur)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Bounded location representation
+
+Adds the running statistics columns to the locations table and rebuilds, for
+every location that doesn't have them yet, its centroid, statistics and sample
+by replaying its old point cluster.
+
+The computation is a frozen copy of `db.update_location`, as it was when this
+migration was written, so that later changes to it don't change what the
+migration does. Geometries are read and written as text, without `db`'s adapters
+"""
+import math
+
+ADD_COLUMNS = """
+    ALTER TABLE locations ADD COLUMN IF NOT EXISTS n_points INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE locations ADD COLUMN IF NOT EXISTS n_inliers INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE locations ADD COLUMN IF NOT EXISTS m2 DOUBLE PRECISION NOT NULL DEFAULT 0;
+"""
+
+UINT64_MASK = (1 << 64) - 1
+# Meters of 0.000001 degrees, as estimated by `tracktotrip3.utils.estimate_meters_to_deg`
+METERS_PER_MICRODEGREE = 0.043496
+
+def reservoir_slot(n_points):
+    """ Pseudo-random slot of a location's sample, see `db.reservoir_slot`
+
+    Args:
+        n_points (int)
+    Returns:
+        int
+    """
+    z = (n_points * 0x9E3779B97F4A7C15) & UINT64_MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & UINT64_MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & UINT64_MASK
+    return (z ^ (z >> 31)) % n_points
+
+def replay_points(points, max_distance, min_samples, sample_size):
+    """ Builds a location from its points, see `db.update_location`
+
+    Args:
+        points (:obj:`list` of (float, float)): latitude and longitude of each point
+        max_distance (float): Max distance, in meters, of a point to the centroid
+        min_samples (int): Number of points accepted before outliers are rejected
+        sample_size (int): Maximum size of the sample
+    Returns:
+        :obj:`dict`: centroid, as (lat, lon), n_points, n_inliers, m2 and sample
+    """
+    lat, lon = points[0]
+    n_points = 0
+    n_inliers = 0
+    m2 = 0.0
+    sample = []
+    max_deg = max_distance / METERS_PER_MICRODEGREE * 0.000001
+
+    for point in points:
+        n_points += 1
+        if len(sample) < sample_size:
+            sample.append(point)
+        else:
+            i = reservoir_slot(n_points)
+            if i < sample_size:
+                sample[i] = point
+
+        d_lat = point[0] - lat
+        d_lon = point[1] - lon
+        spread = math.sqrt(m2 / n_inliers) if n_inliers > 0 else 0
+        threshold = max(max_deg, 3 * spread)
+
+        if n_inliers < min_samples or math.hypot(d_lat, d_lon) <= threshold:
+            n_inliers += 1
+            lat += d_lat / n_inliers
+            lon += d_lon / n_inliers
+            m2 += d_lat * (point[0] - lat) + d_lon * (point[1] - lon)
+
+    return {
+        'centroid': (lat, lon),
+        'n_points': n_points,
+        'n_inliers': n_inliers,
+        'm2': m2,
+        'sample': sample
+    }
+
+def to_ewkt(points):
+    """ EWKT of a point, or of a linestring, with SRID 4326 and no elevation
+
+    Args:
+        points (:obj:`list` of (float, float)): latitude and longitude of each point. A
+            single one is a point
+    Returns:
+        str
+    """
+    coords = ', '.join('%r %r 0' % (lon, lat) for lat, lon in points)
+    return 'SRID=4326;%s(%s)' % ('POINT' if len(points) == 1 else 'LINESTRING', coords)
+
+def migrate_location(cur, location_id, c_loc, debug = False):
+    """ Rebuilds a location from its old point cluster
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        location_id (int)
+        c_loc (:obj:`dict`): location settings
+        debug (bool, optional): activates debug mode.
+            Defaults to False
+    """
+    cur.execute("""
+        SELECT ST_Y(dump.geom), ST_X(dump.geom)
+        FROM locations, ST_DumpPoints(point_cluster::geometry) AS dump
+        WHERE location_id=%s
+        ORDER BY dump.path
+        """, (location_id,))
+    points = [(lat, lon) for lat, lon in cur.fetchall()]
+
+    # New locations were stored with their first point twice
+    if len(points) > 1 and points[0] == points[1]:
+        points = points[1:]
+
+    location = replay_points(points, c_loc['max_distance'], c_loc['min_samples'], c_loc['sample_size'])
+    sample = location['sample']
+    # Linestrings need at least two points
+    sample = sample if len(sample) > 1 else sample * 2
+
+    cur.execute("""
+        UPDATE locations
+        SET centroid=ST_GeogFromText(%s), point_cluster=ST_GeogFromText(%s),
+            n_points=%s, n_inliers=%s, m2=%s
+        WHERE location_id=%s
+        """, (
+            to_ewkt([location['centroid']]),
+            to_ewkt(sample),
+            location['n_points'],
+            location['n_inliers'],
+            location['m2'],
+            location_id
+        ))
+
+def migrate(cur, config, debug = False):
+    """ Adds the statistics columns and migrates every location that isn't migrated yet
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        config (:obj:`dict`)
+        debug (bool, optional): activates debug mode.
+            Defaults to False
+    """
+    cur.execute(ADD_COLUMNS)
+    cur.execute("SELECT location_id FROM locations WHERE n_points = 0 ORDER BY location_id")
+    location_ids = [row[0] for row in cur.fetchall()]
+
+    for location_id in location_ids:
+        migrate_location(cur, location_id, config['location'], debug)
+
+    if debug:
+        print(f"{len(location_ids)} locations migrated")
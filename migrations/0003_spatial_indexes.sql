@@ -0,0 +1,7 @@
+-- Bounding box filters (&&) in db.get_trips, db.match_canonical_trip and viewport loading
+CREATE INDEX IF NOT EXISTS trips_bounds_idx ON trips USING GIST (bounds);
+CREATE INDEX IF NOT EXISTS canonical_trips_bounds_idx ON canonical_trips USING GIST (bounds);
+
+-- ST_DWithin on route queries and on location suggestions
+CREATE INDEX IF NOT EXISTS trips_points_idx ON trips USING GIST (points);
+CREATE INDEX IF NOT EXISTS locations_centroid_idx ON locations USING GIST (centroid);
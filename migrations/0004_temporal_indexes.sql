@@ -0,0 +1,7 @@
+-- Date filters of queries and of day edits/deletions
+CREATE INDEX IF NOT EXISTS trips_start_date_idx ON trips (start_date);
+CREATE INDEX IF NOT EXISTS stays_start_date_idx ON stays (start_date);
+
+-- Label lookups in db.LocationCache and in queries
+CREATE INDEX IF NOT EXISTS stays_location_label_idx ON stays (location_label);
+CREATE INDEX IF NOT EXISTS locations_label_idx ON locations (label);
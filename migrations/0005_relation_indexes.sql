@@ -0,0 +1,3 @@
+-- Canonical trip lookups, and the ON DELETE CASCADE from trips
+CREATE INDEX IF NOT EXISTS canonical_trips_relations_idx ON canonical_trips_relations (canonical_trip, trip);
+CREATE INDEX IF NOT EXISTS canonical_trips_relations_trip_idx ON canonical_trips_relations (trip);
@@ -0,0 +1,6 @@
+-- Day of trips and stays, so day filters can use an index instead of casting start_date
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS day DATE GENERATED ALWAYS AS (start_date::date) STORED;
+ALTER TABLE stays ADD COLUMN IF NOT EXISTS day DATE GENERATED ALWAYS AS (start_date::date) STORED;
+
+CREATE INDEX IF NOT EXISTS trips_day_idx ON trips (day);
+CREATE INDEX IF NOT EXISTS stays_day_idx ON stays (day);
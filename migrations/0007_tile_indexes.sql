@@ -0,0 +1,2 @@
+-- Tile envelope filters (&&) on canonical trips, in db.get_tile
+CREATE INDEX IF NOT EXISTS canonical_trips_points_idx ON canonical_trips USING GIST (points);
@@ -0,0 +1,18 @@
+-- Simplified geometries of trips and canonical trips, served at lower zoom levels.
+-- Tolerances, in degrees, must match db.LOD_COLUMNS. Being generated columns, they
+-- are computed for each row when it's inserted or its points are updated
+ALTER TABLE trips
+  ADD COLUMN IF NOT EXISTS points_lod1 geography(LINESTRINGZ, 4326)
+    GENERATED ALWAYS AS (ST_Simplify(points::geometry, 0.0002, true)::geography) STORED,
+  ADD COLUMN IF NOT EXISTS points_lod2 geography(LINESTRINGZ, 4326)
+    GENERATED ALWAYS AS (ST_Simplify(points::geometry, 0.002, true)::geography) STORED,
+  ADD COLUMN IF NOT EXISTS points_lod3 geography(LINESTRINGZ, 4326)
+    GENERATED ALWAYS AS (ST_Simplify(points::geometry, 0.02, true)::geography) STORED;
+
+ALTER TABLE canonical_trips
+  ADD COLUMN IF NOT EXISTS points_lod1 geography(LINESTRINGZ, 4326)
+    GENERATED ALWAYS AS (ST_Simplify(points::geometry, 0.0002, true)::geography) STORED,
+  ADD COLUMN IF NOT EXISTS points_lod2 geography(LINESTRINGZ, 4326)
+    GENERATED ALWAYS AS (ST_Simplify(points::geometry, 0.002, true)::geography) STORED,
+  ADD COLUMN IF NOT EXISTS points_lod3 geography(LINESTRINGZ, 4326)
+    GENERATED ALWAYS AS (ST_Simplify(points::geometry, 0.02, true)::geography) STORED;
@@ -0,0 +1,11 @@
+-- Days whose database writes were committed, and the file operations that complete them.
+-- See db.journal_day and ProcessingManager.resume_journal
+CREATE TABLE IF NOT EXISTS bulk_journal (
+    journal_id SERIAL PRIMARY KEY,
+    day DATE NOT NULL,
+    files JSONB,
+    stored_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    done_at TIMESTAMP WITHOUT TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS bulk_journal_pending_idx ON bulk_journal (journal_id) WHERE done_at IS NULL;
@@ -8,6 +8,7 @@ import datetime
 import math
 import psycopg2
 import queries.utils as utils 
+from main import db
 from utils import Manager
 
 class QueryManager(Manager):
@@ -35,7 +36,10 @@ class QueryManager(Manager):
 
         items = self.parse_items(payload["data"])
         self.generate_queries(items)
-        return self.fetch_from_db(cur, items, payload["loadAll"], self.debug)
+        results = self.fetch_from_db(cur, items, payload["loadAll"], self.debug)
+
+        db.dispose(conn, cur)
+        return results
 
     def fetch_from_db(self, cur, items, loadAll, debug = False):
         """ Composes the SQL query based on the number of items on the query object and formats the results
@@ -487,7 +491,7 @@ class Range:
         if date != "--/--/----":
             date = datetime.datetime.strptime(date,  "%d/%m/%Y")
             date = datetime.datetime.strftime(date, "%Y-%m-%d")
-            where_chunks.append(f" start_date::date = '{date}' ")
+            where_chunks.append(f" day = '{date}' ")
 
         return tables, with_chunks, where_chunks        
 
@@ -725,7 +729,7 @@ class Interval:
         if date != "--/--/----":
             date = datetime.datetime.strptime(date,  "%d/%m/%Y")
             date = datetime.datetime.strftime(date, "%Y-%m-%d")
-            where_chunks.append(f" start_date::date = '{date}' ")
+            where_chunks.append(f" day = '{date}' ")
 
         return tables, with_chunks, where_chunks        
 
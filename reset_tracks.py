@@ -2,7 +2,7 @@ from dataclasses import replace
 import json
 from os import listdir, replace, remove
 from os.path import join, expanduser, isfile
-from main import db
+from main import db, migrations
 
 from main.default_config import CONFIG
 
@@ -115,20 +115,16 @@ class TracksReset(object):
         self.reset_db()
 
     def reset_db(self):
-        """ Drops all tables in database and recreates them
+        """ Brings the database schema up to date and removes all its data
         """
         conn, cur = self.db_connect()
 
-        drop_sql = open('drop.sql', 'r')
-        schema_sql = open('schema.sql', 'r')
-
-
-        drop_query = drop_sql.read()
-        schema_query = schema_sql.read()
-
         if cur:
-            db.execute_query(cur, drop_query)
-            db.execute_query(cur, schema_query)
+            migrations.migrate(conn, cur, self.config)
+            db.execute_query(cur, """
+                TRUNCATE trips, stays, locations, canonical_trips, canonical_trips_relations, bulk_journal
+                RESTART IDENTITY CASCADE
+            """)
 
         db.dispose(conn, cur)
 
@@ -3,13 +3,17 @@
 Entry point
 Spawns a server that coodinates the operations
 """
+import json
+import math
 import argparse
+from functools import wraps
 from urllib import response
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, abort
 from tracktotrip3 import Point
 from queries.query_manager import QueryManager
-from trackprocessing.process_manager import ProcessingManager
+from trackprocessing.process_manager import ProcessingManager, BulkProcessingError
 from main.main_manager import MainManager
+from main import tiles
 
 parser = argparse.ArgumentParser(description='Starts the server that manages/processes tracks')
 parser.add_argument('-p', '--port', dest='port', metavar='p', type=int,
@@ -38,6 +42,42 @@ manager = MainManager(args.config, args.debug)
 processing_manager = ProcessingManager(args.config, args.metrics, args.debug)
 query_manager = QueryManager(args.config, args.debug)
 
+pending_migrations = manager.pending_migrations()
+if pending_migrations:
+    print("Database has %d pending migrations, run migrate.py to apply them: %s" % (len(pending_migrations), ', '.join(pending_migrations)))
+else:
+    # Completes the days of an interrupted bulk processing run
+    resumed_days = processing_manager.resume_journal()
+    if resumed_days:
+        print("Resumed %d days stored by an interrupted run: %s" % (len(resumed_days), ', '.join(resumed_days)))
+        processing_manager.reload_queue()
+
+def unless_bulk_processing(handler):
+    """ Decorates a route that changes the processing state
+
+    While bulk processing runs, the route isn't handled, and responds with 409 Conflict
+    and the bulk processing job instead. See `ProcessingManager.interactive`
+
+    Args:
+        handler (function)
+    Returns:
+        function
+    """
+    @wraps(handler)
+    def guarded(*args, **kwargs):
+        try:
+            with processing_manager.interactive():
+                return handler(*args, **kwargs)
+        except BulkProcessingError as error:
+            response = jsonify({
+                'error': str(error),
+                'job': error.job.to_json() if error.job else None
+            })
+            response.status_code = 409
+            return set_headers(response)
+
+    return guarded
+
 
 # ROUTES
 
@@ -65,17 +105,17 @@ def get_locations():
 
 @app.route('/canonicalTrips', methods=['GET'])
 def get_canonical_trips():
-    """ Gets canonical trips
+    """ Gets canonical trips, simplified according to the `zoom` or `tolerance` parameters
     Returns:
         :obj:`flask.response`
     """
 
-    response = jsonify(manager.get_canonical_trips())
+    response = jsonify(manager.get_canonical_trips(get_tolerance()))
     return set_headers(response)
 
 @app.route('/trips', methods=['GET'])
 def get_trips():
-    """ Gets trips in bounds 
+    """ Gets trips in bounds, simplified according to the `zoom` or `tolerance` parameters
     Returns:
         :obj:`flask.response`
     """
@@ -86,7 +126,7 @@ def get_trips():
     lonMax = request.args.get('lonMax')
     canonical = request.args.get('canonical') == 'true'
     
-    response = jsonify(manager.get_trips(latMin, lonMin, latMax, lonMax, canonical))
+    response = jsonify(manager.get_trips(get_session(), latMin, lonMin, latMax, lonMax, canonical, get_tolerance()))
     return set_headers(response)
 
 @app.route('/hasMoreTrips', methods=['GET'])
@@ -102,13 +142,13 @@ def can_get_more_trips():
     lonMax = request.args.get('lonMax')
     canonical = request.args.get('canonical') == 'true'
     
-    response =  jsonify(manager.can_get_more_trips(latMin, lonMin, latMax, lonMax, canonical))
+    response =  jsonify(manager.can_get_more_trips(get_session(), latMin, lonMin, latMax, lonMax, canonical, get_tolerance()))
 
     return set_headers(response)
 
 @app.route('/moreTrips', methods=['GET'])
 def get_more_trips():
-    """ Loads more trips in bounds
+    """ Loads more trips in bounds, simplified according to the `zoom` or `tolerance` parameters
     Returns:
         :obj:`flask.response`
     """
@@ -119,10 +159,11 @@ def get_more_trips():
     lonMax = request.args.get('lonMax')
     canonical = request.args.get('canonical') == 'true'
     
-    response = jsonify(manager.get_more_trips(latMin, lonMin, latMax, lonMax, canonical))
+    response = jsonify(manager.get_more_trips(get_session(), latMin, lonMin, latMax, lonMax, canonical, get_tolerance()))
     return set_headers(response)
 
 @app.route('/uploadFile', methods=['POST'])
+@unless_bulk_processing
 def upload_file():
     """ Receives file name and data to create file in input
     Returns:
@@ -136,16 +177,44 @@ def upload_file():
 
 @app.route('/allTrips', methods=['GET'])
 def get_all_trips():    
-    """ Loads all trips
+    """ Streams all trips, as JSON or, with `format=ndjson`, as newline delimited JSON
     Returns:
         :obj:`flask.response`
     """
-    
-    response = jsonify(manager.get_all_trips())
+
+    ndjson = request.args.get('format') == 'ndjson'
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    response = Response(stream_with_context(manager.stream_all_trips(ndjson)), mimetype=mimetype)
     return set_headers(response)
 
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def get_tile(layer, z, x, y):
+    """ Gets a Mapbox Vector Tile of trips, canonical_trips or locations
+
+    Returns:
+        :obj:`flask.response`
+    """
+
+    tile = manager.get_tile(layer, z, x, y)
+    if tile is None:
+        return set_headers(Response(status=404))
+
+    response = Response(tile, mimetype='application/vnd.mapbox-vector-tile')
+    return set_headers(response)
+
+@app.route('/poolStats', methods=['GET'])
+def get_pool_stats():
+    """ Gets database connection pool usage counters
+
+    Returns:
+        :obj:`flask.response`
+    """
+
+    response = jsonify(manager.get_pool_stats())
+    return set_headers(response)
 
 @app.route('/config', methods=['POST'])
+@unless_bulk_processing
 def set_configuration():
     """ Sets the current configuration, and returns it
 
@@ -189,6 +258,7 @@ def get_global_life():
     return set_headers(response)
 
 @app.route('/deleteDay', methods=['POST'])
+@unless_bulk_processing
 def delete_day():
     """ Deletes a day from the database and existing files
     Returns:
@@ -203,6 +273,7 @@ def delete_day():
 # Track Processing
 
 @app.route('/process/previous', methods=['GET'])
+@unless_bulk_processing
 def previous():
     """Restores a previous state
 
@@ -213,6 +284,7 @@ def previous():
     return send_state()
 
 @app.route('/process/next', methods=['POST'])
+@unless_bulk_processing
 def next():
     """Advances the progress
 
@@ -245,6 +317,7 @@ def complete_trip():
     return set_headers(jsonify(processing_manager.complete_trip(from_point, to_point)))
 
 @app.route('/process/changeDay', methods=['POST'])
+@unless_bulk_processing
 def change_day():
     """ Changes the current day
 
@@ -256,6 +329,7 @@ def change_day():
     return send_state()
 
 @app.route('/process/reloadQueue', methods=['GET'])
+@unless_bulk_processing
 def reload_queue():
     """ Changes the current day
 
@@ -278,15 +352,62 @@ def bulk_progress():
 
 @app.route('/process/bulk', methods=['GET'])
 def bulk_process():
-    """ Starts bulk processing
+    """ Starts bulk processing in the background
+
+    If it's already running, the running job is returned instead
+
+    Returns:
+        :obj:`flask.response`: the job, see `/process/jobs/<job_id>`
+    """
+    job, started = processing_manager.start_bulk_process()
+    response = jsonify(job.to_json())
+    response.status_code = 202 if started else 200
+    return set_headers(response)
+
+@app.route('/process/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """ Returns the status and progress of a background job
 
     Returns:
         :obj:`flask.response`
     """
-    processing_manager.bulk_process(raw=False)
-    return send_state()
+    job = processing_manager.get_job(job_id)
+    if job is None:
+        return set_headers(Response(status=404))
+
+    return set_headers(jsonify(job.to_json()))
+
+@app.route('/process/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """ Asks a background job to stop
+
+    Returns:
+        :obj:`flask.response`
+    """
+    job = processing_manager.cancel_job(job_id)
+    if job is None:
+        return set_headers(Response(status=404))
+
+    return set_headers(jsonify(job.to_json()))
+
+@app.route('/process/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """ Streams the changes of a background job, as Server-Sent Events
+
+    Returns:
+        :obj:`flask.response`
+    """
+    job = processing_manager.get_job(job_id)
+    if job is None:
+        return set_headers(Response(status=404))
+
+    response = Response(stream_with_context(send_job_events(job)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return set_headers(response)
 
 @app.route('/process/loadLIFE', methods=['POST'])
+@unless_bulk_processing
 def load_life():
     """ Loads a life formated string into the database
 
@@ -310,6 +431,7 @@ def location_suggestion():
     return set_headers(response)
 
 @app.route('/process/dismissDay', methods=['POST'])
+@unless_bulk_processing
 def dismiss_day():
     """ Ignores day in queue
     Returns:
@@ -321,6 +443,7 @@ def dismiss_day():
     return send_state()
 
 @app.route('/process/removeDay', methods=['POST'])
+@unless_bulk_processing
 def remove_day():
     """ Removes day from input
     Returns:
@@ -332,6 +455,7 @@ def remove_day():
     return send_state()
 
 @app.route('/process/skipDay', methods=['POST'])
+@unless_bulk_processing
 def skip_day():
     """ Skips day in queue
     Returns:
@@ -341,6 +465,7 @@ def skip_day():
     return send_state()
 
 @app.route('/process/copyDayToInput', methods=['POST'])
+@unless_bulk_processing
 def copy_day_to_input():
     """ Copies GPX file from day from output to input folder
     Returns:
@@ -386,6 +511,57 @@ def set_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
     return response
 
+def get_session():
+    """ Identifies the client session of the request
+
+    Clients send their own id, as the `session` parameter, to keep the loading state
+    of each map apart. Otherwise, the client address is used
+
+    Returns:
+        str
+    """
+    return request.args.get('session', request.remote_addr)
+
+def get_non_negative(name):
+    """ Reads a parameter of the request that's a finite, non negative, number
+
+    Responds with 400 Bad Request if it isn't one
+
+    Args:
+        name (str)
+    Returns:
+        float or None: None if it isn't given
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+
+    try:
+        number = float(value)
+    except ValueError:
+        number = float('nan')
+    if not math.isfinite(number) or number < 0:
+        abort(set_headers(Response('Invalid %s: %s' % (name, value), status=400)))
+
+    return number
+
+def get_tolerance():
+    """ Reads the geometry simplification tolerance of the request
+
+    It's either given, in degrees, by the `tolerance` parameter, or is the size of a
+    pixel at the `zoom` parameter's level. See `get_non_negative`
+
+    Returns:
+        float or None: None for the full resolution
+    """
+    tolerance = get_non_negative('tolerance')
+    zoom = get_non_negative('zoom')
+    if tolerance is not None:
+        return tolerance
+    elif zoom is not None:
+        return tiles.pixel_size(zoom)
+    return None
+
 def send_state():
     """ Helper function to send state
 
@@ -397,6 +573,31 @@ def send_state():
     response = jsonify(processing_manager.current_state())
     return set_headers(response)
 
+def send_job_events(job, keep_alive=15):
+    """ Generates the Server-Sent Events of a job
+
+    An event, named after the job's status, is sent with the job every time it changes,
+    until it finishes
+
+    Args:
+        job (:obj:`jobs.Job`)
+        keep_alive (float, optional): seconds without changes before sending a comment,
+            so that the connection isn't closed. Defaults to 15
+    Returns:
+        generator of str
+    """
+    version = None
+    while True:
+        current = job.wait(version, keep_alive)
+        if current == version:
+            yield ': keep-alive\n\n'
+            continue
+
+        version = current
+        yield 'event: %s\ndata: %s\n\n' % (job.status, json.dumps(job.to_json()))
+        if job.is_finished():
+            break
+
 def undo_step():
     """ Undo current state
     """
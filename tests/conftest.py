@@ -0,0 +1,8 @@
+"""
+Makes the repository's packages importable by the tests, however pytest is run
+"""
+import sys
+
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
@@ -0,0 +1,85 @@
+"""
+Tests of `trackprocessing.day_queue`
+"""
+from datetime import datetime
+
+from trackprocessing.day_queue import DayQueue
+
+def gpx(name, start):
+    """ File details of a GPX file, see `process_manager.file_details`
+    """
+    date = datetime.fromisoformat(start)
+    return {
+        'name': name,
+        'path': '/input/' + name,
+        'size': 1,
+        'start': date,
+        'date': date.date().isoformat()
+    }
+
+def test_days_are_sorted():
+    queue = DayQueue([
+        gpx('c.gpx', '2020-01-03T10:00:00'),
+        gpx('a.gpx', '2020-01-01T10:00:00'),
+        gpx('b.gpx', '2020-01-02T10:00:00')
+    ])
+
+    assert list(queue) == ['2020-01-01', '2020-01-02', '2020-01-03']
+    assert [day for day, _ in queue.items()] == list(queue)
+    assert len(queue) == 3
+
+def test_files_of_a_day_are_sorted_by_start_and_name():
+    queue = DayQueue()
+    queue.add(gpx('late.gpx', '2020-01-01T18:00:00'))
+    queue.add(gpx('b.gpx', '2020-01-01T09:00:00'))
+    queue.add(gpx('a.gpx', '2020-01-01T09:00:00'))
+
+    assert [f['name'] for f in queue['2020-01-01']] == ['a.gpx', 'b.gpx', 'late.gpx']
+
+def test_adding_a_file_again_replaces_it():
+    queue = DayQueue([gpx('a.gpx', '2020-01-01T10:00:00')])
+    queue.add(gpx('a.gpx', '2020-01-05T10:00:00'))
+
+    assert list(queue) == ['2020-01-05']
+    assert len(queue.paths) == 1
+
+def test_discard():
+    queue = DayQueue([
+        gpx('a.gpx', '2020-01-01T10:00:00'),
+        gpx('b.gpx', '2020-01-01T12:00:00'),
+        gpx('c.gpx', '2020-01-02T10:00:00')
+    ])
+
+    assert queue.discard('/input/a.gpx') == '2020-01-01'
+    assert [f['name'] for f in queue['2020-01-01']] == ['b.gpx']
+
+    assert queue.discard('/input/b.gpx') == '2020-01-01'
+    assert '2020-01-01' not in queue
+    assert list(queue) == ['2020-01-02']
+
+    assert queue.discard('/input/missing.gpx') is None
+
+def test_mapping_interface():
+    queue = DayQueue([gpx('a.gpx', '2020-01-02T10:00:00')])
+    queue['2020-01-01'] = [gpx('b.gpx', '2020-01-03T10:00:00')]
+
+    # Files are moved to the day they're set to
+    assert list(queue) == ['2020-01-01', '2020-01-02']
+    assert queue['2020-01-01'][0]['date'] == '2020-01-01'
+
+    del queue['2020-01-02']
+    assert list(queue) == ['2020-01-01']
+    assert '/input/a.gpx' not in queue.paths
+
+    assert queue.pop('2020-01-01')[0]['name'] == 'b.gpx'
+    assert len(queue) == 0
+
+def test_iterating_a_snapshot():
+    queue = DayQueue([gpx('a.gpx', '2020-01-01T10:00:00'), gpx('b.gpx', '2020-01-02T10:00:00')])
+
+    days = []
+    for day in queue:
+        days.append(day)
+        queue.pop(day)
+
+    assert days == ['2020-01-01', '2020-01-02']
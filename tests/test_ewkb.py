@@ -0,0 +1,83 @@
+"""
+Tests of the EWKB encoding of geometries, see `db.point_to_ewkb` and `db.ewkb_to_array`
+"""
+import struct
+import numpy as np
+import pytest
+
+from tracktotrip3 import Point, Segment
+
+from main.db import point_to_ewkb, segment_to_ewkb, ewkb_to_array, to_point, to_segment, \
+    LazySegment, SRID
+
+def segment():
+    return Segment([Point(38.7 + i * 0.001, -9.1 - i * 0.002, None) for i in range(5)])
+
+def test_point_round_trip():
+    point = Point(38.7223, -9.1393, None)
+    decoded = to_point(point_to_ewkb(point))
+
+    assert (decoded.lat, decoded.lon) == (point.lat, point.lon)
+    assert decoded.time is None
+
+def test_point_header():
+    ewkb = point_to_ewkb(Point(1.5, 2.5, None))
+
+    # Little endian, point with Z and SRID
+    assert ewkb[0] == 1
+    assert struct.unpack_from('<II', ewkb, 1) == (0xA0000001, SRID)
+    assert len(ewkb) == 9 + 3 * 8
+
+def test_segment_round_trip():
+    original = segment()
+    decoded = to_segment(segment_to_ewkb(original))
+
+    assert isinstance(decoded, LazySegment)
+    assert [(p.lat, p.lon) for p in decoded.points] == [(p.lat, p.lon) for p in original.points]
+
+def test_segment_timestamps():
+    original = segment()
+    timestamps = list(range(len(original.points)))
+    decoded = to_segment(segment_to_ewkb(original), timestamps)
+
+    assert [p.time for p in decoded.points] == timestamps
+
+def test_hex_encoded():
+    ewkb = segment_to_ewkb(segment())
+    expected = ewkb_to_array(ewkb)
+
+    np.testing.assert_array_equal(ewkb_to_array(ewkb.hex()), expected)
+    np.testing.assert_array_equal(ewkb_to_array(ewkb.hex().upper().encode()), expected)
+
+def test_array_layout():
+    coords = ewkb_to_array(segment_to_ewkb(segment()))
+
+    assert coords.shape == (5, 3)
+    np.testing.assert_array_equal(coords[:, 2], 0)
+    assert coords[0, :2].tolist() == [-9.1, 38.7]
+
+def test_big_endian_2d_without_srid():
+    ewkb = struct.pack('>BII4d', 0, 2, 2, -9.1, 38.7, -9.2, 38.8)
+    coords = ewkb_to_array(ewkb)
+
+    assert coords.tolist() == [[-9.1, 38.7, 0], [-9.2, 38.8, 0]]
+
+def test_measured_coordinates_are_dropped():
+    # Point with Z and M
+    ewkb = struct.pack('<BI4d', 1, 0xC0000001, -9.1, 38.7, 100, 5)
+
+    assert ewkb_to_array(ewkb).tolist() == [[-9.1, 38.7, 100]]
+
+def test_unsupported_geometry():
+    polygon = struct.pack('<BII', 1, 3, 0)
+
+    with pytest.raises(TypeError):
+        ewkb_to_array(polygon)
+
+def test_lazy_bounds():
+    original = segment()
+    decoded = to_segment(segment_to_ewkb(original))
+
+    assert decoded.bounds(0.01) == pytest.approx(original.bounds(0.01))
+    # Points aren't created to compute the bounds
+    assert decoded._points is None
@@ -0,0 +1,108 @@
+"""
+Tests of `trackprocessing.gpx_cache`
+"""
+import io
+import json
+import time
+import pytest
+
+from datetime import datetime
+
+import trackprocessing.gpx_cache as gpx_cache
+from trackprocessing.gpx_cache import predict_start_date, GPXMetadataCache, CHUNK_SIZE
+
+def gpx(*times, padding=0):
+    """ GPX-like content with some dates, and padding between them
+    """
+    return ''.join('%s<time>%s</time>' % (' ' * padding, t) for t in times) + '</gpx>'
+
+def write(tmp_path, content, name='track.gpx'):
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+def test_second_date(tmp_path):
+    path = write(tmp_path, gpx('2020-01-01T08:00:00Z', '2020-01-02T10:00:00Z', '2020-01-02T11:00:00Z'))
+    assert predict_start_date(path) == datetime(2020, 1, 2, 10)
+
+def test_single_date(tmp_path):
+    path = write(tmp_path, gpx('2020-01-02T10:00:00Z', padding=3 * CHUNK_SIZE))
+    assert predict_start_date(path) == datetime(2020, 1, 2, 10)
+
+@pytest.mark.parametrize('offset', [-40, -33, -20, -10, -1, 0, 10])
+def test_dates_split_between_chunks(tmp_path, offset):
+    first = '<time>2020-01-01T08:00:00Z</time>'
+    # The second date ends around the end of the first chunk
+    padding = CHUNK_SIZE - len(first) - len('<time>2020-01-02T10:00:00Z</time>') + offset
+    path = write(tmp_path, first + ' ' * padding + '<time>2020-01-02T10:00:00Z</time>' + gpx('2020-01-03T10:00:00Z'))
+
+    assert predict_start_date(path) == datetime(2020, 1, 2, 10)
+
+def test_reads_until_the_second_date(tmp_path, monkeypatch):
+    path = write(tmp_path, gpx('2020-01-01T08:00:00Z', '2020-01-02T10:00:00Z', padding=CHUNK_SIZE) + ' ' * 100 * CHUNK_SIZE)
+    reads = []
+
+    class CountingFile(io.StringIO):
+        def read(self, size=-1):
+            reads.append(size)
+            return super().read(size)
+
+    content = open(path).read()
+    monkeypatch.setattr(gpx_cache, 'open', lambda *args, **kwargs: CountingFile(content), raising=False)
+
+    assert predict_start_date(path) == datetime(2020, 1, 2, 10)
+    assert len(reads) == 3
+
+def test_cache_hits_while_the_file_is_the_same(tmp_path, monkeypatch):
+    path = write(tmp_path, gpx('2020-01-01T08:00:00Z', '2020-01-02T10:00:00Z'))
+    cache = GPXMetadataCache()
+    assert cache.start_date(path, 10, 1) == datetime(2020, 1, 2, 10)
+
+    monkeypatch.setattr(gpx_cache, 'predict_start_date', lambda *args: pytest.fail('read again'))
+    assert cache.start_date(path, 10, 1) == datetime(2020, 1, 2, 10)
+
+    monkeypatch.setattr(gpx_cache, 'predict_start_date', lambda *args: datetime(2021, 1, 1))
+    assert cache.start_date(path, 10, 2) == datetime(2021, 1, 1)
+    assert cache.start_date(path, 11, 2) == datetime(2021, 1, 1)
+
+def test_cache_retain():
+    cache = GPXMetadataCache()
+    cache.entries = {'a': [1, 1, '2020-01-01T00:00:00'], 'b': [1, 1, '2020-01-02T00:00:00']}
+
+    cache.retain(['b', 'c'])
+    assert list(cache.entries) == ['b']
+    assert cache.changed
+
+def test_cache_is_saved_and_loaded(tmp_path):
+    path = write(tmp_path, gpx('2020-01-01T08:00:00Z', '2020-01-02T10:00:00Z'))
+    cache_path = str(tmp_path / 'cache.json')
+
+    cache = GPXMetadataCache(cache_path)
+    cache.start_date(path, 10, 1)
+    cache.save()
+    assert not cache.changed
+
+    assert GPXMetadataCache(cache_path).entries == cache.entries
+
+def test_corrupted_cache_is_rebuilt(tmp_path):
+    cache_path = tmp_path / 'cache.json'
+    cache_path.write_text('{not json')
+
+    assert GPXMetadataCache(str(cache_path)).entries == {}
+
+def test_save_later_saves_changes_together(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / 'cache.json')
+    cache = GPXMetadataCache(cache_path)
+    writes = []
+    replace = gpx_cache.replace
+    monkeypatch.setattr(gpx_cache, 'replace', lambda *args: (writes.append(args), replace(*args)))
+
+    for i in range(10):
+        cache.entries['gpx%d' % i] = [1, 1, '2020-01-01T00:00:00']
+        cache.changed = True
+        cache.save_later(0.1)
+
+    time.sleep(0.5)
+    assert len(writes) == 1
+    with open(cache_path) as cache_file:
+        assert len(json.load(cache_file)) == 10
@@ -0,0 +1,111 @@
+"""
+Tests of `main.location_index`
+"""
+import numpy as np
+import pytest
+
+from tracktotrip3 import Point
+
+import main.location_index as location_index
+from main.location_index import LocationIndex, distances, chord_length, to_xyz, MAX_PENDING
+
+class FakeCursor(object):
+    """ Cursor that returns the given location rows
+    """
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, args=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+def random_rows(count, seed=0, start=0):
+    """ Locations around Lisbon
+    """
+    generator = np.random.default_rng(seed)
+    lats = 38.72 + generator.uniform(-0.05, 0.05, count)
+    lons = -9.14 + generator.uniform(-0.05, 0.05, count)
+    return [(start + i, 'location %d' % (start + i), lats[i], lons[i]) for i in range(count)]
+
+def brute_force(rows, lat, lon, radius):
+    """ Labels of the locations within 4 times the radius of a point, closest first
+    """
+    meters = distances(lat, lon, np.array([row[2] for row in rows]), np.array([row[3] for row in rows]))
+    return [rows[i][1] for i in np.argsort(meters, kind='stable') if meters[i] <= radius * 4]
+
+def labels(results):
+    return [label for label, _, _ in results]
+
+def test_chord_length_matches_distances():
+    a = to_xyz(38.72, -9.14)
+    b = to_xyz(38.73, -9.13)
+    meters = distances(38.72, -9.14, np.array([38.73]), np.array([-9.13]))[0]
+
+    assert np.linalg.norm(a - b) == pytest.approx(chord_length(meters))
+
+def test_query_matches_brute_force():
+    rows = random_rows(2000)
+    index = LocationIndex().load(FakeCursor(rows))
+    generator = np.random.default_rng(1)
+
+    for lat, lon, radius in zip(38.72 + generator.uniform(-0.06, 0.06, 50),
+                                -9.14 + generator.uniform(-0.06, 0.06, 50),
+                                generator.uniform(10, 500, 50)):
+        assert labels(index.query(lat, lon, radius)) == brute_force(rows, lat, lon, radius)
+
+def test_query_results():
+    index = LocationIndex().load(FakeCursor([(1, 'home', 38.72, -9.14)]))
+
+    [(label, centroid, points)] = index.query(38.72, -9.14, 10)
+    assert (label, centroid.lat, centroid.lon, points) == ('home', 38.72, -9.14, None)
+    assert index.query(0, 0, 10) == []
+    assert LocationIndex().load(FakeCursor([])).query(38.72, -9.14, 10) == []
+
+def test_pending_locations_are_searched():
+    rows = random_rows(100)
+    index = LocationIndex().load(FakeCursor(rows))
+
+    added = random_rows(10, seed=2, start=100)
+    for location_id, label, lat, lon in added:
+        index.update(location_id, label, Point(lat, lon, None))
+    # Moves a location of the tree
+    moved = (5, 'moved', 38.70, -9.10)
+    index.update(moved[0], moved[1], Point(moved[2], moved[3], None))
+
+    assert len(index.pending) == 11
+    expected = [row for row in rows if row[0] != 5] + added + [moved]
+    for location_id, label, lat, lon in expected[::7]:
+        assert labels(index.query(lat, lon, 300)) == brute_force(expected, lat, lon, 300)
+    assert 'location 5' not in labels(index.query(rows[5][2], rows[5][3], 1))
+    assert labels(index.query(38.70, -9.10, 1)) == ['moved']
+
+def test_tree_is_rebuilt_with_many_pending(monkeypatch):
+    monkeypatch.setattr(location_index, 'MAX_PENDING', 4)
+    rows = random_rows(20)
+    index = LocationIndex().load(FakeCursor(rows[:10]))
+
+    for location_id, label, lat, lon in rows[10:15]:
+        index.update(location_id, label, Point(lat, lon, None))
+    assert len(index.pending) == 0
+    assert index.ids == list(range(15))
+
+    for location_id, label, lat, lon in rows[15:19]:
+        index.update(location_id, label, Point(lat, lon, None))
+    assert len(index.pending) == 4
+    for _, _, lat, lon in rows[:19]:
+        assert labels(index.query(lat, lon, 300)) == brute_force(rows[:19], lat, lon, 300)
+
+def test_updates_before_loading_win():
+    index = LocationIndex()
+    for _ in range(MAX_PENDING + 1):
+        index.update(1, 'new', Point(38.70, -9.10, None))
+    # Not rebuilt before loading
+    assert index.tree is None
+
+    index.load(FakeCursor([(1, 'old', 38.72, -9.14), (2, 'other', 38.72, -9.14)]))
+
+    assert index.ready
+    assert labels(index.query(38.70, -9.10, 1)) == ['new']
+    assert labels(index.query(38.72, -9.14, 1)) == ['other']
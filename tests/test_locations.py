@@ -0,0 +1,91 @@
+"""
+Tests of the running statistics of locations, see `db.update_location`
+"""
+import random
+import numpy as np
+import pytest
+
+from tracktotrip3 import Point
+
+from main.db import new_location, update_location, reservoir_slot, sample_segment
+
+MAX_DISTANCE = 20
+MIN_SAMPLES = 3
+
+def location_of(points, sample_size=50):
+    location = new_location(points[0])
+    for point in points:
+        update_location(location, point, MAX_DISTANCE, MIN_SAMPLES, sample_size)
+    return location
+
+def cluster(n_points, lat=38.7, lon=-9.1, spread=0.00005, seed=0):
+    rng = random.Random(seed)
+    return [Point(lat + rng.gauss(0, spread), lon + rng.gauss(0, spread), None) for _ in range(n_points)]
+
+def test_new_location():
+    location = new_location(Point(38.7, -9.1, None))
+
+    assert location['n_points'] == 0
+    assert location['sample'] == []
+    assert location['changed']
+    assert (location['centroid'].lat, location['centroid'].lon) == (38.7, -9.1)
+
+def test_centroid_and_spread_of_inliers():
+    points = cluster(30)
+    location = location_of(points)
+
+    coords = np.array([(p.lat, p.lon) for p in points])
+    assert location['n_points'] == 30
+    assert location['n_inliers'] == 30
+    assert location['centroid'].lat == pytest.approx(coords[:, 0].mean())
+    assert location['centroid'].lon == pytest.approx(coords[:, 1].mean())
+    # Sum of the squared distances to the centroid
+    assert location['m2'] == pytest.approx(((coords - coords.mean(axis=0)) ** 2).sum())
+
+def test_outliers_are_rejected():
+    points = cluster(10)
+    outlier = Point(38.8, -9.0, None)
+    location = location_of(points)
+    centroid = location['centroid']
+
+    update_location(location, outlier, MAX_DISTANCE, MIN_SAMPLES)
+
+    assert location['n_points'] == 11
+    assert location['n_inliers'] == 10
+    assert location['centroid'] is centroid
+    # Outliers are still sampled
+    assert location['sample'][-1] is outlier
+
+def test_first_points_are_inliers():
+    far = [Point(38.7, -9.1, None), Point(38.8, -9.0, None), Point(38.9, -8.9, None)]
+    location = location_of(far)
+
+    assert location['n_inliers'] == MIN_SAMPLES
+    assert location['centroid'].lat == pytest.approx(38.8)
+
+def test_sample_is_bounded_and_deterministic():
+    points = cluster(500)
+    location = location_of(points, sample_size=20)
+
+    assert location['n_points'] == 500
+    assert len(location['sample']) == 20
+    assert all(point in points for point in location['sample'])
+    # Later points replace some of the first ones
+    assert location['sample'] != points[:20]
+    assert location['sample'] == location_of(points, sample_size=20)['sample']
+
+def test_reservoir_slot():
+    slots = [reservoir_slot(n) for n in range(1, 10001)]
+
+    assert all(0 <= slot < n for n, slot in enumerate(slots, 1))
+    # Roughly uniform: the nth point replaces one of 50 slots with probability 50/n
+    replaced = sum(1 for n, slot in enumerate(slots, 1) if n > 50 and slot < 50)
+    expected = sum(50.0 / n for n in range(51, 10001))
+    assert abs(replaced - expected) < 4 * np.sqrt(expected)
+
+def test_sample_segment():
+    single = location_of([Point(38.7, -9.1, None)])
+    assert len(sample_segment(single).points) == 2
+
+    location = location_of(cluster(5))
+    assert sample_segment(location).points == location['sample']
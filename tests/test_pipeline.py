@@ -0,0 +1,106 @@
+"""
+Tests of `trackprocessing.pipeline`
+"""
+import random
+import threading
+import time
+import pytest
+
+from trackprocessing.pipeline import Pipeline, Stage
+
+def jitter(function):
+    """ Makes a function take a random, short, time, so that workers finish out of order
+    """
+    def delayed(value):
+        time.sleep(random.uniform(0, 0.005))
+        return function(value)
+    return delayed
+
+def test_keeps_order_with_several_workers():
+    pipeline = Pipeline([
+        Stage('double', jitter(lambda x: x * 2), workers=4),
+        Stage('increment', jitter(lambda x: x + 1), workers=3),
+        Stage('identity', lambda x: x)
+    ])
+
+    assert pipeline.run(range(50)) == [x * 2 + 1 for x in range(50)]
+
+def test_stats():
+    pipeline = Pipeline([Stage('first', lambda x: x, workers=2), Stage('second', lambda x: x)])
+    pipeline.run(range(10))
+
+    stats = pipeline.stats()
+    assert [stage['stage'] for stage in stats] == ['first', 'second']
+    assert [stage['processed'] for stage in stats] == [10, 10]
+    assert stats[0]['workers'] == 2
+
+def test_no_items():
+    assert Pipeline([Stage('identity', lambda x: x, workers=2)]).run([]) == []
+
+def test_failure_stops_new_items():
+    def convert(value):
+        if value == 3:
+            raise ValueError('bad day')
+        return value
+
+    pipeline = Pipeline([Stage('convert', jitter(convert), workers=3), Stage('store', lambda x: x)])
+
+    with pytest.raises(ValueError, match='bad day'):
+        pipeline.run(range(1000))
+
+    assert pipeline.stages[0].processed < 100
+
+def test_items_past_the_failure_finish():
+    converted = []
+    exported = []
+
+    def convert(value):
+        converted.append(value)
+        return value
+
+    def annotate(value):
+        if value == 3:
+            raise ValueError('bad day')
+        return value
+
+    pipeline = Pipeline([
+        Stage('convert', jitter(convert), workers=3),
+        Stage('annotate', jitter(annotate)),
+        Stage('export', exported.append)
+    ])
+
+    with pytest.raises(ValueError, match='bad day'):
+        pipeline.run(range(20))
+
+    # Every converted item but the failed one is exported, in order
+    assert exported == [value for value in sorted(converted) if value != 3]
+    assert exported[:3] == [0, 1, 2]
+
+def test_first_error_is_raised():
+    def fail(value):
+        raise KeyError(value)
+
+    pipeline = Pipeline([Stage('fail', fail), Stage('store', lambda x: x)])
+    with pytest.raises(KeyError) as error:
+        pipeline.run(range(5))
+    assert error.value.args == (0,)
+
+def test_cancellation_finishes_started_items():
+    # Bulk processing is cancelled by no longer feeding days to the pipeline
+    cancelled = threading.Event()
+
+    def items():
+        for i in range(100):
+            if cancelled.is_set():
+                return
+            yield i
+
+    def store(value):
+        if value == 5:
+            cancelled.set()
+        return value
+
+    results = Pipeline([Stage('convert', lambda x: x, workers=2), Stage('store', store)]).run(items())
+
+    assert results == list(range(len(results)))
+    assert 5 < len(results) < 100
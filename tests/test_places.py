@@ -0,0 +1,136 @@
+"""
+Tests of `main.places`
+"""
+import pytest
+
+from tracktotrip3 import Point
+from tracktotrip3.location import Location
+
+from main.places import PlaceProvider, GazetteerProvider, CachedProvider, add_places
+
+GAZETTEER = """name,lat,lon,types
+Praça do Comércio,38.7075,-9.1364,square|landmark
+Sé de Lisboa,38.7098,-9.1331,church
+Castelo de São Jorge,38.7139,-9.1335,
+Torre de Belém,38.6916,-9.2160,landmark
+"""
+
+class FixedProvider(PlaceProvider):
+    """ Provider with the same places for every point, that counts its searches
+    """
+    def __init__(self, places):
+        self.places = places
+        self.searches = []
+
+    def search(self, point, radius):
+        self.searches.append((point.lat, point.lon, radius))
+        return [dict(place) for place in self.places]
+
+def place(label, distance):
+    return {'label': label, 'distance': distance, 'types': [], 'suggestion_type': 'TEST'}
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    path = tmp_path / 'gazetteer.csv'
+    path.write_text(GAZETTEER, encoding='utf8')
+    return GazetteerProvider(str(path))
+
+def test_gazetteer_search(gazetteer):
+    places = gazetteer.search(Point(38.7080, -9.1360, None), 500)
+
+    assert [p['label'] for p in places] == ['Praça do Comércio', 'Sé de Lisboa']
+    assert places[0]['distance'] < places[1]['distance'] <= 500
+    assert places[0]['types'] == ['square', 'landmark']
+    assert places[0]['suggestion_type'] == 'GAZETTEER'
+
+def test_gazetteer_radius(gazetteer):
+    point = Point(38.7080, -9.1360, None)
+
+    assert len(gazetteer.search(point, 1000)) == 3
+    assert gazetteer.search(Point(0, 0, None), 1000) == []
+    # Places without types
+    assert [p['types'] for p in gazetteer.search(Point(38.7139, -9.1335, None), 10)] == [[]]
+
+def test_missing_gazetteer(tmp_path):
+    gazetteer = GazetteerProvider(str(tmp_path / 'missing.csv'))
+
+    assert gazetteer.search(Point(38.7080, -9.1360, None), 500) == []
+    # It isn't read again
+    assert gazetteer.places == []
+
+@pytest.mark.parametrize('content', [
+    'name,lat,lon\nPraça do Comércio,north,-9.1364\n',
+    'name,latitude,longitude\nPraça do Comércio,38.7075,-9.1364\n',
+    'name,lat,lon\nPraça do Comércio,38.7075\n'
+])
+def test_malformed_gazetteer(tmp_path, content):
+    path = tmp_path / 'gazetteer.csv'
+    path.write_text(content, encoding='utf8')
+
+    assert GazetteerProvider(str(path)).search(Point(38.7080, -9.1360, None), 500) == []
+
+def test_cache_rounds_points():
+    provider = FixedProvider([place('a', 10)])
+    cached = CachedProvider(provider, precision=3)
+
+    first = cached.search(Point(38.70751, -9.13641, None), 100)
+    second = cached.search(Point(38.70790, -9.13620, None), 100)
+
+    assert first == second == [place('a', 10)]
+    assert provider.searches == [(38.708, -9.136, 100)]
+
+    # Other radiuses aren't shared
+    cached.search(Point(38.70751, -9.13641, None), 200)
+    assert len(provider.searches) == 2
+
+def test_cache_returns_copies():
+    cached = CachedProvider(FixedProvider([place('a', 10)]))
+    cached.search(Point(1, 1, None), 100)[0]['label'] = 'changed'
+
+    assert cached.search(Point(1, 1, None), 100)[0]['label'] == 'a'
+
+def test_cache_evicts_least_recently_used():
+    provider = FixedProvider([place('a', 10)])
+    cached = CachedProvider(provider, precision=0, max_entries=2)
+
+    cached.search(Point(1, 1, None), 100)
+    cached.search(Point(2, 2, None), 100)
+    cached.search(Point(1, 1, None), 100)
+    cached.search(Point(3, 3, None), 100)
+    assert len(provider.searches) == 3
+
+    # (2, 2) was evicted, (1, 1) wasn't
+    cached.search(Point(1, 1, None), 100)
+    assert len(provider.searches) == 3
+    cached.search(Point(2, 2, None), 100)
+    assert len(provider.searches) == 4
+
+def test_cache_skips_empty_results():
+    provider = FixedProvider([])
+    cached = CachedProvider(provider)
+
+    cached.search(Point(1, 1, None), 100)
+    cached.search(Point(1, 1, None), 100)
+    assert len(provider.searches) == 2
+
+def test_add_places_after_stored_locations():
+    stored = [{'label': 'home', 'distance': 50}]
+    location = Location('home', Point(1, 1, None), list(stored))
+    providers = [FixedProvider([place('far', 300), place('near', 20)]), FixedProvider([place('middle', 100)])]
+
+    location = add_places(location, providers, 500, 3)
+    assert [p['label'] for p in location.other] == ['home', 'near', 'middle']
+
+def test_add_places_without_stored_locations():
+    location = Location(None, Point(1, 1, None), [])
+
+    location = add_places(location, [FixedProvider([place('far', 300), place('near', 20)])], 500, 1)
+    # The limit only applies when there are stored locations
+    assert [p['label'] for p in location.other] == ['near', 'far']
+
+def test_add_places_when_there_is_no_room():
+    provider = FixedProvider([place('near', 20)])
+    location = Location('home', Point(1, 1, None), [{'label': 'home'}, {'label': 'work'}])
+
+    assert add_places(location, [provider], 500, 2).other == [{'label': 'home'}, {'label': 'work'}]
+    assert provider.searches == []
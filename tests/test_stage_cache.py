@@ -0,0 +1,120 @@
+"""
+Tests of `trackprocessing.stage_cache`
+"""
+import copy
+import pytest
+
+from main.default_config import CONFIG
+from trackprocessing.stage_cache import STAGE_CONFIG, StageCache, stage_key, files_hash
+
+def changed(config, *path):
+    """ Copy of the settings, with a nested setting changed
+    """
+    config = copy.deepcopy(config)
+    parent = config
+    for key in path[:-1]:
+        parent = parent[key]
+    value = parent[path[-1]]
+    parent[path[-1]] = not value if isinstance(value, bool) else (value or 0) + 1
+    return config
+
+@pytest.mark.parametrize('stage, path', [
+    ('track', ['trip_name_format']),
+    ('trip', ['default_timezone']),
+    ('trip', ['smoothing', 'noise']),
+    ('trip', ['segmentation', 'use']),
+    ('trip', ['simplification', 'max_dist_error']),
+    ('annotated', ['location', 'max_distance']),
+    ('annotated', ['location', 'use'])
+])
+def test_key_changes_with_the_settings_read(stage, path):
+    config = copy.deepcopy(CONFIG)
+    if path == ['trip_name_format']:
+        changed_config = dict(config, trip_name_format='%d-%m-%Y')
+    else:
+        changed_config = changed(config, *path)
+
+    assert stage_key(stage, 'source', config) != stage_key(stage, 'source', changed_config)
+
+@pytest.mark.parametrize('stage, path', [
+    ('track', ['smoothing', 'noise']),
+    ('track', ['location', 'max_distance']),
+    ('trip', ['location', 'max_distance']),
+    ('annotated', ['smoothing', 'noise']),
+    ('annotated', ['default_timezone']),
+    ('trip', ['multiple_gpxs_for_day'])
+])
+def test_key_ignores_other_settings(stage, path):
+    config = copy.deepcopy(CONFIG)
+    assert stage_key(stage, 'source', config) == stage_key(stage, 'source', changed(config, *path))
+
+def test_key_is_stable():
+    config = copy.deepcopy(CONFIG)
+    reordered = {key: config[key] for key in reversed(list(config))}
+    reordered['location'] = {key: value for key, value in reversed(list(config['location'].items()))}
+
+    for stage in STAGE_CONFIG:
+        assert stage_key(stage, 'source', config) == stage_key(stage, 'source', reordered)
+
+def test_key_changes_with_the_stage_source_and_extra():
+    keys = {
+        stage_key('trip', 'source', CONFIG),
+        stage_key('trip', 'other source', CONFIG),
+        stage_key('track', 'source', CONFIG),
+        stage_key('trip', 'source', CONFIG, 'extra'),
+        stage_key('trip', 'source', CONFIG, 'other extra')
+    }
+    assert len(keys) == 5
+
+def test_files_hash(tmp_path):
+    first = tmp_path / 'first.gpx'
+    second = tmp_path / 'second.gpx'
+    first.write_text('<gpx>first</gpx>')
+    second.write_text('<gpx>second</gpx>')
+    paths = [str(first), str(second)]
+
+    original = files_hash(paths)
+    assert files_hash(paths) == original
+    assert files_hash(list(reversed(paths))) != original
+
+    second.write_text('<gpx>changed</gpx>')
+    assert files_hash(paths) != original
+
+def test_from_config(tmp_path):
+    assert StageCache.from_config(CONFIG) is None
+    assert StageCache.from_config(dict(CONFIG, stage_cache_path=str(tmp_path))).path == str(tmp_path)
+
+def test_put_and_get(tmp_path):
+    cache = StageCache(str(tmp_path))
+    key = stage_key('trip', 'source', CONFIG)
+
+    assert cache.get('trip', key) is None
+    cache.put('trip', key, {'points': [1, 2, 3]})
+    assert cache.get('trip', key) == {'points': [1, 2, 3]}
+    assert cache.get('annotated', key) is None
+
+def test_unreadable_output_is_a_miss(tmp_path):
+    cache = StageCache(str(tmp_path))
+    key = stage_key('trip', 'source', CONFIG)
+    cache.put('trip', key, [1])
+
+    with open(cache.output_path('trip', key), 'wb') as output_file:
+        output_file.write(b'not a pickle')
+    assert cache.get('trip', key) is None
+
+def test_cached_computes_once(tmp_path):
+    cache = StageCache(str(tmp_path))
+    key = stage_key('trip', 'source', CONFIG)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 'output'
+
+    assert cache.cached('trip', key, compute) == 'output'
+    assert cache.cached('trip', key, compute) == 'output'
+    assert len(calls) == 1
+
+    assert cache.cached('trip', None, compute) == 'output'
+    assert cache.cached('trip', None, compute) == 'output'
+    assert len(calls) == 3
@@ -0,0 +1,98 @@
+"""
+Tests of `main.tiles`
+"""
+import pytest
+
+from main.tiles import tile_coordinates, tile_bounds, tiles_in_bounds, covering_tiles, \
+    is_valid_tile, pixel_size, TileCache, MAX_ZOOM
+
+def shrink(bounds, amount=1e-9):
+    """ Bounding box inside another one, that doesn't touch its edges
+    """
+    return (bounds[0] + amount, bounds[1] + amount, bounds[2] - amount, bounds[3] - amount)
+
+def test_tile_coordinates():
+    assert tile_coordinates(0, 0, 0) == pytest.approx((0.5, 0.5))
+    assert tile_coordinates(0, -180, 1) == pytest.approx((0, 1))
+    # Latitudes out of the projection are clamped
+    assert tile_coordinates(90, 180, 2) == pytest.approx((4, 0))
+    assert tile_coordinates(-90, 0, 2)[1] == pytest.approx(4)
+
+@pytest.mark.parametrize('zoom, x, y', [(0, 0, 0), (3, 5, 2), (12, 1953, 1556), (MAX_ZOOM, 2 ** 21, 2 ** 20)])
+def test_tile_bounds_match_tile_coordinates(zoom, x, y):
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(zoom, x, y)
+
+    assert tile_coordinates(max_lat, min_lon, zoom) == pytest.approx((x, y))
+    assert tile_coordinates(min_lat, max_lon, zoom) == pytest.approx((x + 1, y + 1))
+    assert tiles_in_bounds(shrink(tile_bounds(zoom, x, y)), zoom, 0) == (x, y, x, y)
+
+def test_tiles_in_bounds_buffer():
+    bounds = shrink(tile_bounds(4, 7, 9))
+
+    assert tiles_in_bounds(bounds, 4, 0.5) == (6, 8, 8, 10)
+    assert tiles_in_bounds(bounds, 4) == (6, 8, 8, 10)
+
+def test_tiles_in_bounds_are_clamped():
+    assert tiles_in_bounds((-90, -180, 90, 180), 2) == (0, 0, 3, 3)
+
+def test_covering_tiles():
+    bounds = shrink(tile_bounds(10, 300, 400))
+
+    assert covering_tiles(bounds, 10, 1) == [(10, 300, 400)]
+    assert covering_tiles(bounds, 14, 1) == [(10, 300, 400)]
+    assert len(covering_tiles(bounds, 14, 256)) == 256
+    assert covering_tiles((-80, -170, 80, 170), 5, 1) == [(0, 0, 0)]
+
+def test_is_valid_tile():
+    assert is_valid_tile(0, 0, 0)
+    assert is_valid_tile(3, 7, 7)
+    assert not is_valid_tile(3, 8, 0)
+    assert not is_valid_tile(3, 0, -1)
+    assert not is_valid_tile(MAX_ZOOM + 1, 0, 0)
+
+def test_pixel_size():
+    assert pixel_size(0) == pytest.approx(360.0 / 256)
+    assert pixel_size(1) == pytest.approx(pixel_size(0) / 2)
+
+def test_tile_cache(tmp_path):
+    cache = TileCache(str(tmp_path))
+
+    assert cache.get('trips', 10, 300, 400) is None
+    cache.put('trips', 10, 300, 400, b'tile')
+    cache.put('trips', 10, 310, 400, b'far')
+    cache.put('locations', 10, 300, 400, b'other layer')
+    assert cache.get('trips', 10, 300, 400) == b'tile'
+
+    assert cache.invalidate('trips', [shrink(tile_bounds(10, 300, 400))]) == 1
+    assert cache.get('trips', 10, 300, 400) is None
+    assert cache.get('trips', 10, 310, 400) == b'far'
+    assert cache.get('locations', 10, 300, 400) == b'other layer'
+
+    cache.clear('trips')
+    assert cache.get('trips', 10, 310, 400) is None
+    assert cache.get('locations', 10, 300, 400) == b'other layer'
+
+def test_tiles_rendered_before_an_invalidation_are_not_cached(tmp_path):
+    cache = TileCache(str(tmp_path))
+    bounds = [shrink(tile_bounds(10, 300, 400))]
+
+    generation = cache.generation('trips')
+    cache.invalidate('trips', bounds)
+    assert not cache.put('trips', 10, 300, 400, b'old', generation)
+    assert cache.get('trips', 10, 300, 400) is None
+    assert len(list(tmp_path.rglob('*.tmp'))) == 0
+
+    # Other caches of the same path share the generation
+    other = TileCache(str(tmp_path))
+    assert other.put('trips', 10, 300, 400, b'new', other.generation('trips'))
+    assert cache.get('trips', 10, 300, 400) == b'new'
+
+    # Other layers aren't affected
+    generation = cache.generation('locations')
+    cache.invalidate('trips', bounds)
+    assert cache.put('locations', 10, 300, 400, b'tile', generation)
+
+    generation = cache.generation('locations')
+    cache.clear()
+    assert not cache.put('locations', 10, 300, 400, b'tile', generation)
+
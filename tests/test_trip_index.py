@@ -0,0 +1,78 @@
+"""
+Tests of `main.trip_index`
+"""
+from rtreelib import Rect
+from tracktotrip3 import Point, Segment
+
+from main.trip_index import CanonicalTripIndex, intersects
+
+def segment(*coords):
+    """ Segment through some (lat, lon) coordinates
+    """
+    return Segment([Point(lat, lon, None) for lat, lon in coords])
+
+def trip_near(lat, lon):
+    """ Short trip, whose bounds are around a position
+    """
+    return segment((lat, lon), (lat + 0.01, lon + 0.01), (lat + 0.02, lon + 0.02))
+
+def matched_ids(index, trip, distance=0.001):
+    return [canonical_id for canonical_id, _ in index.match(trip, distance)]
+
+def test_intersects():
+    assert intersects((0, 0, 1, 1), (0.5, 0.5, 2, 2))
+    # Touching edges
+    assert intersects((0, 0, 1, 1), (1, 1, 2, 2))
+    assert not intersects((0, 0, 1, 1), (1.1, 0, 2, 1))
+
+def test_match():
+    index = CanonicalTripIndex()
+    index.insert(2, trip_near(38.70, -9.10))
+    index.insert(1, trip_near(38.70, -9.10))
+    index.insert(3, trip_near(40.00, -8.00))
+
+    assert matched_ids(index, trip_near(38.705, -9.095)) == [1, 2]
+    assert matched_ids(index, trip_near(41.00, -7.00)) == []
+
+def test_match_uses_distance():
+    index = CanonicalTripIndex()
+    index.insert(1, trip_near(38.70, -9.10))
+    # Bounds of the trip end at 38.71, -9.09, since the last point isn't included
+    trip = trip_near(38.72, -9.08)
+
+    assert matched_ids(index, trip, 0.001) == []
+    assert matched_ids(index, trip, 0.02) == [1]
+
+def test_updated_trips_ignore_stale_entries():
+    index = CanonicalTripIndex()
+    index.insert(1, trip_near(38.70, -9.10))
+    index.insert(2, trip_near(38.70, -9.10))
+    index.update(1, trip_near(40.00, -8.00))
+
+    assert index.stale == 1
+    # The old entry of trip 1 is still in the tree, but doesn't match
+    assert matched_ids(index, trip_near(38.70, -9.10)) == [2]
+    assert matched_ids(index, trip_near(40.00, -8.00)) == [1]
+
+def test_rebuild_drops_stale_entries():
+    index = CanonicalTripIndex()
+    index.insert(1, trip_near(38.70, -9.10))
+    index.update(1, trip_near(39.00, -9.00))
+    assert index.stale == 1
+
+    # More stale entries than trips
+    index.update(1, trip_near(40.00, -8.00))
+    assert index.stale == 0
+    assert len(list(index.tree.query(Rect(-90, -180, 90, 180)))) == 1
+    assert matched_ids(index, trip_near(40.00, -8.00)) == [1]
+    assert matched_ids(index, trip_near(38.70, -9.10)) == []
+
+def test_snapshots_are_stored():
+    index = CanonicalTripIndex()
+    trip = trip_near(38.70, -9.10)
+    index.insert(1, trip)
+    trip.points[0].lat = 0
+
+    stored = index.match(trip_near(38.70, -9.10), 0.001)[0][1]
+    assert stored.points[0].lat == 38.70
+    assert stored.points[0].time is None
@@ -0,0 +1,112 @@
+"""
+Queue of days to process
+
+Keeps the GPX files of the input folder grouped by day, with the days sorted, so that
+files can be added and removed one at a time, without sorting the whole queue again.
+"""
+import threading
+
+from bisect import bisect_left, insort
+from collections.abc import MutableMapping
+
+class DayQueue(MutableMapping):
+    """ Sorted dictionary with the GPX files of each day
+
+    Behaves like the `OrderedDict` of days it replaces: iterating it yields the days in
+    order, and each day maps to the details of its GPX files (see `file_details`),
+    sorted by start date. It's safe to use from several threads.
+
+    Arguments:
+        days: Sorted list of days
+        gpxs: Dictionary with the list of GPX file details of each day
+        paths: Dictionary with the day of each GPX file path
+    """
+    def __init__(self, gpxs=()):
+        self.days = []
+        self.gpxs = {}
+        self.paths = {}
+        self.lock = threading.RLock()
+
+        for gpx in gpxs:
+            self.add(gpx)
+
+    def __getitem__(self, day):
+        with self.lock:
+            return self.gpxs[day]
+
+    def __setitem__(self, day, gpxs):
+        with self.lock:
+            if day in self.gpxs:
+                del self[day]
+            for gpx in gpxs:
+                self.add(dict(gpx, date=day))
+
+    def __delitem__(self, day):
+        with self.lock:
+            for gpx in self.gpxs.pop(day):
+                del self.paths[gpx['path']]
+            del self.days[bisect_left(self.days, day)]
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.days))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.days)
+
+    def __contains__(self, day):
+        with self.lock:
+            return day in self.gpxs
+
+    def items(self):
+        """ Days and their GPX files, in order
+
+        Returns:
+            :obj:`list` of (str, :obj:`list` of :obj:`dict`)
+        """
+        with self.lock:
+            return [(day, list(self.gpxs[day])) for day in self.days]
+
+    def add(self, gpx):
+        """ Adds, or replaces, a GPX file
+
+        Args:
+            gpx (:obj:`dict`): file details, see `file_details`
+        """
+        with self.lock:
+            self.discard(gpx['path'])
+
+            day = gpx['date']
+            if day not in self.gpxs:
+                insort(self.days, day)
+                self.gpxs[day] = []
+
+            day_gpxs = self.gpxs[day]
+            keys = [(other['start'], other['name']) for other in day_gpxs]
+            day_gpxs.insert(bisect_left(keys, (gpx['start'], gpx['name'])), gpx)
+            self.paths[gpx['path']] = day
+
+    def discard(self, path):
+        """ Removes a GPX file, if it's queued
+
+        Days without files are removed
+
+        Args:
+            path (str)
+        Returns:
+            str or None: day of the file
+        """
+        with self.lock:
+            day = self.paths.pop(path, None)
+            if day is None:
+                return None
+
+            day_gpxs = [gpx for gpx in self.gpxs[day] if gpx['path'] != path]
+            if len(day_gpxs) > 0:
+                self.gpxs[day] = day_gpxs
+            else:
+                del self.gpxs[day]
+                del self.days[bisect_left(self.days, day)]
+
+            return day
@@ -0,0 +1,163 @@
+"""
+Cache of GPX file metadata
+
+Predicting the start date of a GPX file means reading it, so the dates are kept,
+and optionally saved to disk, for as long as the file's size and modification time
+don't change.
+"""
+import re
+import json
+import threading
+import tracktotrip3 as tt
+
+from os import replace, getpid
+from os.path import isfile, expanduser
+from datetime import datetime
+
+TIME_RX = re.compile(r'\<time\>([^\<]+)\<\/time\>')
+# Bytes read at a time when looking for the start date
+CHUNK_SIZE = 4096
+# Bytes kept from the previous chunk, to match a date split between chunks. Longer than
+# any <time> element
+CHUNK_OVERLAP = 128
+# Seconds to wait for more changes before saving, see `GPXMetadataCache.save_later`
+SAVE_DELAY = 5
+
+def predict_start_date(filename, debug = False):
+    """ Predicts the start date of a GPX file
+
+    Reads the second date, since the first one is usually the file's creation date,
+    by matching TIME_RX regular expression. If there's only one, it's used instead.
+    The file is only read until the second date, and each chunk is searched once
+
+    Args:
+        filename (str): file path
+        debug (bool, optional): activates debug mode.
+            Defaults to False
+    Returns:
+        :obj:`datetime.datetime`
+    """
+    result = []
+    with open(filename, 'r') as opened_file:
+        content = ''
+        while len(result) < 2:
+            chunk = opened_file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            content += chunk
+            end = 0
+            for match in TIME_RX.finditer(content):
+                result.append(match.group(1))
+                end = match.end()
+            content = content[max(end, len(content) - CHUNK_OVERLAP):]
+
+    if len(result) > 1:
+        date = result[1]
+    else:
+        date = result[0]
+
+    return tt.utils.isostr_to_datetime(date, debug)
+
+class GPXMetadataCache(object):
+    """ Start dates of GPX files, by path
+
+    An entry is valid while the file keeps the same size and modification time
+
+    Arguments:
+        path: File where the cache is saved, None to keep it only in memory
+        entries: Dictionary with the size, modification time (in nanoseconds) and
+            start date (in ISO format) of each file
+        changed: True if there are entries that weren't saved yet
+        timer: Pending save, see `save_later`
+    """
+    def __init__(self, path=None, debug=False):
+        self.path = expanduser(path) if path else None
+        self.debug = debug
+        self.entries = {}
+        self.changed = False
+        self.timer = None
+        self.lock = threading.Lock()
+
+        if self.path and isfile(self.path):
+            try:
+                with open(self.path, 'r') as cache_file:
+                    self.entries = json.load(cache_file)
+            except (OSError, ValueError):
+                # A corrupted cache is rebuilt
+                self.entries = {}
+
+    def start_date(self, path, size, mtime):
+        """ Start date of a GPX file, see `predict_start_date`
+
+        Args:
+            path (str)
+            size (int): size of the file, in bytes
+            mtime (int): modification time of the file, in nanoseconds
+        Returns:
+            :obj:`datetime.datetime`
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+
+        if entry and entry[0] == size and entry[1] == mtime:
+            return datetime.fromisoformat(entry[2])
+
+        date = predict_start_date(path, self.debug)
+        with self.lock:
+            self.entries[path] = [size, mtime, date.isoformat()]
+            self.changed = True
+
+        return date
+
+    def retain(self, paths):
+        """ Forgets every file, but the given ones
+
+        Args:
+            paths (:obj:`list` of str): paths of the files to keep
+        """
+        paths = set(paths)
+        with self.lock:
+            removed = [path for path in self.entries if path not in paths]
+            for path in removed:
+                del self.entries[path]
+            self.changed = self.changed or len(removed) > 0
+
+    def save(self):
+        """ Saves the cache, if it changed
+
+        The cache is written to a temporary file first, so it's never left partially written
+        """
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            if not self.path or not self.changed:
+                return
+            content = json.dumps(self.entries)
+            self.changed = False
+
+        tmp_path = '%s.%d.tmp' % (self.path, getpid())
+        try:
+            with open(tmp_path, 'w') as cache_file:
+                cache_file.write(content)
+            replace(tmp_path, self.path)
+        except OSError:
+            if self.debug:
+                print("Could not save the GPX metadata cache to %s" % self.path)
+
+    def save_later(self, delay=SAVE_DELAY):
+        """ Saves the cache after a while, if it changed
+
+        Changes made meanwhile are saved together, instead of rewriting the cache for
+        each one. See `save`
+
+        Args:
+            delay (float, optional): seconds to wait. Defaults to `SAVE_DELAY`
+        """
+        with self.lock:
+            if not self.path or not self.changed or self.timer:
+                return
+            self.timer = threading.Timer(delay, self.save)
+            self.timer.daemon = True
+            self.timer.start()
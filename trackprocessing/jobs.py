@@ -0,0 +1,198 @@
+"""
+Background jobs
+
+Long running tasks, like bulk processing, run in their own thread, so that requests
+return right away. Clients follow a job through its id, either by polling its status
+or by listening to its events.
+"""
+import threading
+import traceback
+
+from uuid import uuid4
+from datetime import datetime
+from collections import OrderedDict
+
+class Status(object):
+    """ Job status enumeration
+    """
+    pending = 'pending'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+    cancelled = 'cancelled'
+
+    finished = [done, failed, cancelled]
+
+class Job(object):
+    """ Task running in the background
+
+    Every change to a job increments its version, and wakes up the threads waiting for it.
+    See `wait`
+
+    Arguments:
+        id: Unique identifier
+        name: Kind of job, e.g. bulk
+        status: See `Status`
+        progress: Dictionary with the progress reported by the task
+        error: Message of the exception that made the job fail
+        version: Number of changes to the job
+    """
+    def __init__(self, name):
+        self.id = uuid4().hex
+        self.name = name
+        self.status = Status.pending
+        self.progress = {}
+        self.error = None
+        self.created = datetime.now()
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self.cancel_requested = threading.Event()
+        self.changed = threading.Condition()
+
+    def is_finished(self):
+        """ Checks if the job is no longer running
+
+        Returns:
+            bool
+        """
+        return self.status in Status.finished
+
+    def is_cancelled(self):
+        """ Checks if the job was asked to stop
+
+        Tasks should check it regularly, and return as soon as it's safe to
+
+        Returns:
+            bool
+        """
+        return self.cancel_requested.is_set()
+
+    def cancel(self):
+        """ Asks the job to stop
+        """
+        if not self.is_finished() and not self.is_cancelled():
+            self.cancel_requested.set()
+            self.update()
+
+    def update(self, status=None, **progress):
+        """ Changes the job, and notifies the threads waiting for it
+
+        Args:
+            status (str, optional): See `Status`
+            **progress: Progress values to set
+        """
+        with self.changed:
+            if status:
+                self.status = status
+            self.progress.update(progress)
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait(self, version, timeout=None):
+        """ Waits for the job to change
+
+        Args:
+            version (int): last version seen by the caller
+            timeout (float, optional): seconds to wait. Defaults to waiting forever
+        Returns:
+            int: current version, the same as `version` if the wait timed out
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def to_json(self):
+        """ Converts the job to a JSON serializable dictionary
+
+        Returns:
+            :obj:`dict`
+        """
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'cancelRequested': self.is_cancelled(),
+            'progress': self.progress,
+            'error': self.error,
+            'created': self.created.isoformat(),
+            'started': self.started.isoformat() if self.started else None,
+            'finished': self.finished.isoformat() if self.finished else None
+        }
+
+class JobRunner(object):
+    """ Runs jobs in background threads, and keeps the latest ones
+
+    Arguments:
+        jobs: Ordered dictionary of jobs, by id
+        max_jobs: Number of jobs kept, finished jobs are forgotten first
+    """
+    def __init__(self, max_jobs=20, debug=False):
+        self.jobs = OrderedDict()
+        self.max_jobs = max_jobs
+        self.debug = debug
+        self.lock = threading.Lock()
+
+    def submit(self, name, function):
+        """ Starts a job
+
+        Args:
+            name (str): kind of job
+            function (function): task, receives the `Job` as its only argument
+        Returns:
+            :obj:`Job`
+        """
+        job = Job(name)
+        with self.lock:
+            self.jobs[job.id] = job
+            finished = [key for key, old_job in self.jobs.items() if old_job.is_finished()]
+            for key in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+                del self.jobs[key]
+
+        thread = threading.Thread(target=self.run, args=(job, function), name='job-%s' % job.id, daemon=True)
+        thread.start()
+        return job
+
+    def run(self, job, function):
+        """ Runs a job's task, and records how it ended
+
+        Args:
+            job (:obj:`Job`)
+            function (function)
+        """
+        job.started = datetime.now()
+        job.update(Status.running)
+
+        try:
+            function(job)
+            status = Status.cancelled if job.is_cancelled() else Status.done
+        except Exception as error:
+            if self.debug:
+                traceback.print_exc()
+            job.error = str(error)
+            status = Status.failed
+
+        job.finished = datetime.now()
+        job.update(status)
+
+    def get(self, job_id):
+        """ Gets a job
+
+        Args:
+            job_id (str)
+        Returns:
+            :obj:`Job` or None
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def running(self, name):
+        """ Gets the unfinished job of a kind
+
+        Args:
+            name (str)
+        Returns:
+            :obj:`Job` or None
+        """
+        with self.lock:
+            return next((job for job in self.jobs.values() if job.name == name and not job.is_finished()), None)
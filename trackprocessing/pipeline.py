@@ -0,0 +1,210 @@
+"""
+Staged producer/consumer pipeline
+
+Each stage runs in its own threads, and is connected to the next one by a bounded
+queue, so that a stage works on an item while the following stage works on the
+previous one. Items leave every stage in the order they entered the pipeline.
+"""
+import threading
+import time
+
+from queue import Queue
+
+# Marks the end of the items
+END = object()
+# Result of an item that wasn't processed, and is skipped by the following stages
+SKIPPED = object()
+
+class Stage(object):
+    """ Step of a pipeline
+
+    Arguments:
+        name: Name of the stage
+        function: Function applied to each item, its result is passed to the next stage
+        workers: Number of threads of the stage
+        processed: Number of items processed
+        busy_time: Seconds spent processing items, summed over the threads
+        idle_time: Seconds spent waiting for items, summed over the threads
+        blocked_time: Seconds spent handing results over, waiting for the previous items
+            or for room in the next stage's queue
+        queue_depth: Sum of the input queue depths, sampled before each item is taken
+        max_queue_depth: Largest sampled input queue depth
+    """
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = workers
+
+        self.processed = 0
+        self.busy_time = 0.0
+        self.idle_time = 0.0
+        self.blocked_time = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.samples = 0
+
+        self.input = None
+        self.output = None
+        self.running = 0
+        self.next_item = 0
+        self.turn = threading.Condition()
+
+    def stats(self, elapsed):
+        """ Throughput and queue depth of the stage
+
+        Args:
+            elapsed (float): seconds since the pipeline started
+        Returns:
+            :obj:`dict`
+        """
+        return {
+            'stage': self.name,
+            'workers': self.workers,
+            'processed': self.processed,
+            'throughput': self.processed / elapsed if elapsed > 0 else 0,
+            'busy': self.busy_time,
+            'idle': self.idle_time,
+            'blocked': self.blocked_time,
+            'utilization': self.busy_time / (elapsed * self.workers) if elapsed > 0 else 0,
+            'queue_depth': self.input.qsize() if self.input else 0,
+            'avg_queue_depth': self.queue_depth / self.samples if self.samples > 0 else 0,
+            'max_queue_depth': self.max_queue_depth
+        }
+
+class Pipeline(object):
+    """ Runs items through a sequence of stages
+
+    If a stage fails, no more items enter the pipeline, and the error is raised by
+    `run` once the items already in it are done. Those items go through every stage,
+    unless a stage fails on them, so that none is left half processed
+
+    Arguments:
+        stages: List of `Stage`
+        queue_size: Capacity of the queue in front of each stage
+        error: First exception raised by a stage
+    """
+    def __init__(self, stages, queue_size=2):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.error = None
+        self.failed = threading.Event()
+        self.lock = threading.Lock()
+        self.started = None
+
+    def run(self, items):
+        """ Feeds items to the pipeline, and waits for every stage to finish
+
+        Args:
+            items (iterable)
+        Returns:
+            :obj:`list`: results of the last stage, in order
+        """
+        results = []
+        for stage in self.stages:
+            stage.input = Queue(self.queue_size)
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.output = next_stage.input
+
+        threads = []
+        for stage in self.stages:
+            stage.running = stage.workers
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=self.work, args=(stage, results), name=stage.name, daemon=True)
+                threads.append(thread)
+
+        self.started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        first = self.stages[0].input
+        for i, item in enumerate(items):
+            if self.failed.is_set():
+                break
+            first.put((i, item))
+        first.put(END)
+
+        for thread in threads:
+            thread.join()
+
+        if self.error:
+            raise self.error
+        return results
+
+    def work(self, stage, results):
+        """ Processes items of a stage until the end of the items
+
+        Args:
+            stage (:obj:`Stage`)
+            results (:obj:`list`): results of the last stage
+        """
+        while True:
+            depth = stage.input.qsize()
+            waiting = time.perf_counter()
+            item = stage.input.get()
+
+            if item is END:
+                # Lets the other threads of the stage know
+                stage.input.put(END)
+                break
+
+            index, value = item
+            started = time.perf_counter()
+            result = SKIPPED
+            # Items that weren't started yet don't enter the pipeline after a failure
+            entering = stage is self.stages[0]
+            if value is not SKIPPED and not (entering and self.failed.is_set()):
+                try:
+                    result = stage.function(value)
+                except Exception as error:
+                    self.fail(error)
+            finished = time.perf_counter()
+
+            with stage.turn:
+                # Hands results over in order
+                while stage.next_item != index:
+                    stage.turn.wait()
+
+                stage.idle_time += started - waiting
+                stage.busy_time += finished - started
+                stage.queue_depth += depth
+                stage.max_queue_depth = max(stage.max_queue_depth, depth)
+                stage.samples += 1
+
+                if result is not SKIPPED:
+                    stage.processed += 1
+                # Skipped items are handed over too, so that the next stage keeps the order
+                if stage.output is not None:
+                    stage.output.put((index, result))
+                elif result is not SKIPPED:
+                    results.append(result)
+                stage.blocked_time += time.perf_counter() - finished
+
+                stage.next_item += 1
+                stage.turn.notify_all()
+
+        with stage.turn:
+            stage.running -= 1
+            if stage.running == 0 and stage.output is not None:
+                stage.output.put(END)
+
+    def fail(self, error):
+        """ Stops the pipeline, keeping the first error
+
+        Args:
+            error (:obj:`Exception`)
+        """
+        with self.lock:
+            if not self.failed.is_set():
+                self.error = error
+                self.failed.set()
+
+    def stats(self):
+        """ Throughput and queue depth of each stage
+
+        See `Stage.stats`
+
+        Returns:
+            :obj:`list` of :obj:`dict`
+        """
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        return [stage.stats(elapsed) for stage in self.stages]
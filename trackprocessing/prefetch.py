@@ -0,0 +1,115 @@
+"""
+Speculative loading of queued days
+
+While a day is being processed, the following ones are loaded and converted into trips
+in a worker process, so that changing days and leaving the preview step don't wait
+for them. Results are only used if neither the day's files nor the configuration
+changed since they were computed.
+"""
+import json
+import threading
+
+from os import stat
+from concurrent.futures import ProcessPoolExecutor
+
+# Configuration used to load and convert a day, see `prepare_day`
+PREFETCH_CONFIG = ['trip_name_format', 'default_timezone', 'smoothing', 'segmentation', 'simplification']
+
+def day_key(paths, config):
+    """ Identifies a day's files, as they are now, and the configuration used to convert them
+
+    Args:
+        paths (:obj:`list` of str): GPX file paths
+        config (:obj:`dict`)
+    Returns:
+        str or None: None if a file no longer exists
+    """
+    files = []
+    for path in paths:
+        try:
+            file_stat = stat(path)
+        except OSError:
+            return None
+        files.append([path, file_stat.st_size, file_stat.st_mtime_ns])
+
+    return json.dumps([files, [config[key] for key in PREFETCH_CONFIG]], sort_keys=True)
+
+class DayPrefetcher(object):
+    """ Loads and converts days in a worker process, ahead of time
+
+    Arguments:
+        function: Function that loads and converts a day, called with the GPX file paths,
+            the configuration and the debug flag. See `prepare_day`
+        entries: Dictionary with the key (see `day_key`) and future result of each day
+        pool: Worker process, started on first use
+    """
+    def __init__(self, function, debug=False):
+        self.function = function
+        self.debug = debug
+        self.entries = {}
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def schedule(self, days, config):
+        """ Starts loading days, and forgets the other ones
+
+        Days that are already loaded, or loading, with the same files and configuration
+        aren't loaded again
+
+        Args:
+            days (:obj:`list` of (str, :obj:`list` of str)): day and GPX file paths,
+                in the order to load them
+            config (:obj:`dict`)
+        """
+        with self.lock:
+            wanted = dict(days)
+            for day in list(self.entries.keys()):
+                if day not in wanted:
+                    self.entries.pop(day)[1].cancel()
+
+            for day, paths in days:
+                key = day_key(paths, config)
+                entry = self.entries.get(day)
+                if key is None or (entry and entry[0] == key):
+                    continue
+                if entry:
+                    entry[1].cancel()
+
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=1)
+                self.entries[day] = (key, self.pool.submit(self.function, paths, config, self.debug))
+
+    def take(self, day, paths, config):
+        """ Result of a day, if it was loaded with the same files and configuration
+
+        Waits for the day if it's still loading
+
+        Args:
+            day (str)
+            paths (:obj:`list` of str): GPX file paths
+            config (:obj:`dict`)
+        Returns:
+            The function's result, or None
+        """
+        with self.lock:
+            entry = self.entries.pop(day, None)
+
+        if entry is None or entry[0] != day_key(paths, config):
+            if entry:
+                entry[1].cancel()
+            return None
+
+        try:
+            return entry[1].result()
+        except Exception as error:
+            if self.debug:
+                print("Could not prefetch %s: %s" % (day, error))
+            return None
+
+    def clear(self):
+        """ Forgets every day
+        """
+        with self.lock:
+            for _, future in self.entries.values():
+                future.cancel()
+            self.entries = {}
@@ -2,22 +2,35 @@
 """
 Contains class that orchestrates processing
 """
-import re
+import sys
 import json
+import threading
 import glob 
 import tracktotrip3 as tt
 
 from os import listdir, stat, rename, replace, remove
 from shutil import copyfile
 from datetime import datetime
-from os.path import join, expanduser, isfile
-from collections import OrderedDict
+from os.path import join, expanduser, isfile, isdir
+from bisect import insort
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from tracktotrip3.utils import estimate_meters_to_deg
 from tracktotrip3.location import infer_location
 from tracktotrip3.learn_trip import learn_trip, complete_trip
 from main import db
+from main.trip_index import CanonicalTripIndex
+from main.location_index import LocationIndex
+from main.places import place_providers, add_places
 from life.life import Life
 from utils import Manager
+from trackprocessing.pipeline import Pipeline, Stage
+from trackprocessing.jobs import JobRunner
+from trackprocessing.gpx_cache import GPXMetadataCache, predict_start_date
+from trackprocessing.day_queue import DayQueue
+from trackprocessing.watcher import watch
+from trackprocessing.prefetch import DayPrefetcher
+from trackprocessing.stage_cache import StageCache, files_hash, stage_key
 
 def gte_time(small, big, debug = False):
     """ Determines if time is greater or equal to another 
@@ -64,27 +77,7 @@ def save_to_file(path, content, mode="w"):
     with open(path, mode) as dest_file:
         dest_file.write(content)
 
-TIME_RX = re.compile(r'\<time\>([^\<]+)\<\/time\>')
-def predict_start_date(filename, debug = False):
-    """ Predicts the start date of a GPX file
-
-    Reads the first valid date, by matching TIME_RX regular expression
-
-    Args:
-        filename (str): file path
-    Returns:
-        :obj:`datetime.datetime`
-    """
-    with open(filename, 'r') as opened_file:
-        result = TIME_RX.findall(opened_file.read())
-        if len(result) > 1:
-            date = result[1]
-        else:
-            date = result[0]
-
-        return tt.utils.isostr_to_datetime(date, debug)
-
-def file_details(base_path, filepath, debug = False):
+def file_details(base_path, filepath, debug = False, cache = None):
     """ Returns file details
 
     Example:
@@ -93,6 +86,7 @@ def file_details(base_path, filepath, debug = False):
             'name': '25072016.gpx',
             'path': '/users/username/tracks/25072016.gpx',
             'size': 39083,
+            'mtime': 1469432452000000000,
             'start': <datetime.datetime>,
             'date': '2016-07-25t07:40:52z'
         }
@@ -100,22 +94,155 @@ def file_details(base_path, filepath, debug = False):
     Args:
         base_path (str): Base path
         filename (str): Filename
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+        cache (:obj:`GPXMetadataCache`, optional): cache of start dates
     Returns:
         :obj:`dict`: See example
     """
     complete_path = join(base_path, filepath)
-    (_, _, _, _, _, _, size, _, _, _) = stat(complete_path)
+    file_stat = stat(complete_path)
+    size = file_stat.st_size
 
-    date = predict_start_date(complete_path, debug)
+    if cache:
+        date = cache.start_date(complete_path, size, file_stat.st_mtime_ns)
+    else:
+        date = predict_start_date(complete_path, debug)
 
     return {
         'name': filepath,
         'path': complete_path,
         'size': size,
+        'mtime': file_stat.st_mtime_ns,
         'start': date,
         'date': date.date().isoformat()
     }
 
+def is_unchanged(gpx):
+    """ Checks if a GPX file is still as it was when its details were read
+
+    Args:
+        gpx (:obj:`dict`): file details, see `file_details`
+    Returns:
+        bool: False if it was changed or removed since
+    """
+    try:
+        file_stat = stat(gpx['path'])
+    except OSError:
+        return False
+    return file_stat.st_size == gpx['size'] and file_stat.st_mtime_ns == gpx['mtime']
+
+def load_day_track(paths, name_format, debug = False):
+    """ Loads the GPX files of a day into a single track
+
+    Args:
+        paths (:obj:`list` of str): GPX file paths
+        name_format (str): format of the track's name. See `tracktotrip3.Track.generate_name`
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        :obj:`tracktotrip3.Track`
+    """
+    gpxs = [tt.Track.from_gpx(path, debug)[0] for path in paths]
+
+    segs = []
+    for gpx in gpxs:
+        segs.extend(gpx.segments)
+
+    track = tt.Track('', segments=segs, debug=debug)
+    track.name = track.generate_name(name_format)
+    return track
+
+def track_to_trip(track, config):
+    """ Processes a track so that it becomes a trip
+
+    More information in `tracktotrip3.Track`'s `to_trip` method
+
+    Args:
+        track (:obj:`tracktotrip3.Track`)
+        config (:obj:`dict`)
+    Returns:
+        :obj:`tracktotrip3.Track`
+    """
+    if not track.name or len(track.name) == 0:
+        track.name = track.generate_name(config['trip_name_format'])
+
+    track.timezone(timezone=float(config['default_timezone']))
+    track = track.to_trip(
+        smooth=config['smoothing']['use'],
+        # tracktotrip3 compares strategies by identity, which strings read from
+        # JSON or received from another process don't keep
+        smooth_strategy=sys.intern(config['smoothing']['algorithm']),
+        smooth_noise=config['smoothing']['noise'],
+        seg=config['segmentation']['use'],
+        seg_eps=config['segmentation']['epsilon'],
+        seg_min_time=config['segmentation']['min_time'],
+        simplify=config['simplification']['use'],
+        simplify_max_dist_error=config['simplification']['max_dist_error'],
+        simplify_max_speed_error=config['simplification']['max_speed_error']
+    )
+
+    return track
+
+def cached_stage(config, stage, key, compute, debug = False):
+    """ Reads a stage's output from the stage cache, or computes it
+
+    See `trackprocessing.stage_cache`
+
+    Args:
+        config (:obj:`dict`)
+        stage (str)
+        key (str or None): key of the output, None to compute it without caching
+        compute (function): computes the output
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        The stage's output
+    """
+    cache = StageCache.from_config(config, debug)
+    if cache is None:
+        return compute()
+    return cache.cached(stage, key, compute)
+
+def load_day(paths, config, debug = False):
+    """ Loads the GPX files of a day into a single track, see `load_day_track`
+
+    Args:
+        paths (:obj:`list` of str): GPX file paths
+        config (:obj:`dict`)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        (:obj:`tracktotrip3.Track`, str): the track and its stage key, None if the
+            stage cache isn't used
+    """
+    key = None
+    if StageCache.from_config(config):
+        key = stage_key('track', files_hash(paths), config)
+
+    track = cached_stage(config, 'track', key, lambda: load_day_track(paths, config['trip_name_format'], debug), debug)
+    return track, key
+
+def prepare_day(paths, config, debug = False):
+    """ Runs the CPU bound stages of a day, to be used in a worker process
+
+    Loads the day's track, like `ProcessingManager.change_day`, and converts a copy of it
+    into a trip, like `ProcessingManager.preview_to_adjust`
+
+    Args:
+        paths (:obj:`list` of str): GPX file paths
+        config (:obj:`dict`)
+        debug (bool, optional): activates debug mode. 
+            Defaults to False
+    Returns:
+        (:obj:`tracktotrip3.Track`, :obj:`tracktotrip3.Track`, str): the track, the trip
+            and the track's stage key, see `load_day`
+    """
+    track, key = load_day(paths, config, debug)
+    trip_key = stage_key('trip', key, config) if key else None
+    trip = cached_stage(config, 'trip', trip_key, lambda: track_to_trip(track.copy(), config), debug)
+    return track, trip, key
+
 class Step(object):
     """ Step enumeration
     """
@@ -147,6 +274,16 @@ class Step(object):
         """
         return (current - 1) % Step._len
 
+class BulkProcessingError(Exception):
+    """ Raised when the processing state would be changed while bulk processing runs
+
+    Arguments:
+        job: The bulk processing job, or None if it doesn't run in the background
+    """
+    def __init__(self, job=None):
+        super().__init__('Bulk processing is running')
+        self.job = job
+
 class ProcessingManager(Manager):
     """ Manages the processing phases
 
@@ -155,6 +292,8 @@ class ProcessingManager(Manager):
             processed. Doesn't include the current file
         currentFile: String with the current file being
             processed
+        current_gpxs: Details of the current day's GPX files, as they
+            were when it was loaded. See `file_details`
         history: Array of TrackToTrip.Track. Must always
             have length greater or equal to ONE. The
             last element is the current state of the system
@@ -170,12 +309,27 @@ class ProcessingManager(Manager):
 
         self.is_bulk_processing = False
         self.bulk_progress = -1
-        self.queue = {}
+        self.canonical_index = None
+        self.location_index = None
+        self.location_index_lock = threading.Lock()
+        self.place_providers = None
+        self.pipeline = None
+        self.jobs = JobRunner(debug=debug)
+        self.state_lock = threading.Lock()
+        self.gpx_cache = GPXMetadataCache(self.config['gpx_cache_path'], debug)
+        self.queue = DayQueue()
+        self.queue_lock = threading.RLock()
+        self.watcher = None
+        self.prefetcher = DayPrefetcher(prepare_day, debug)
+        self.prefetched_trip = None
+        self.current_key = None
         self.life_queue = []
         self.current_step = None
         self.history = []
         self.current_day = None
+        self.current_gpxs = []
         self.debug = debug
+        self.watch_input()
         self.reset()
 
         self.use_metrics = metrics
@@ -185,7 +339,7 @@ class ProcessingManager(Manager):
         """ Lists gpx files from the input path, and some details
 
         Result is sorted by start date
-        See `file_details`
+        See `file_details`. Start dates are cached, see `GPXMetadataCache`
 
         Returns:
             :obj:`list` of :obj:`dict`
@@ -197,8 +351,11 @@ class ProcessingManager(Manager):
         files = listdir(input_path)
         files = [f for f in files if f.split('.')[-1] == 'gpx']
 
-        files = [file_details(input_path, f) for f in files]
+        files = [file_details(input_path, f, self.debug, self.gpx_cache) for f in files]
         files = sorted(files, key=lambda f: f['date'])
+
+        self.gpx_cache.retain([f['path'] for f in files])
+        self.gpx_cache.save()
         return files
 
     def list_lifes(self):
@@ -228,10 +385,12 @@ class ProcessingManager(Manager):
             self.current_step = Step.preview
             self.load_days()
         else:
-            self.queue = {}
+            self.queue = DayQueue()
             self.current_day = None
+            self.current_gpxs = []
             self.current_step = Step.done
             self.history = []
+            self.current_key = None
 
         return self
 
@@ -241,54 +400,115 @@ class ProcessingManager(Manager):
         Args:
             day (:obj:`datetime.date`): Only loads if it's an existing key in queue
         """
+        with self.queue_lock:
+            if day in list(self.queue.keys()):
+                key_to_use = day
+                gpxs = list(self.queue[key_to_use])
+                paths = [gpx['path'] for gpx in gpxs]
+                prepared = None if self.is_bulk_processing else self.prefetcher.take(key_to_use, paths, self.config)
+
+                if prepared:
+                    # Already loaded, and converted, see `prefetch`
+                    track, self.prefetched_trip, self.current_key = prepared
+                else:
+                    track, self.current_key = load_day(paths, self.config, self.debug)
+                    self.prefetched_trip = None
 
-        if day in list(self.queue.keys()):
-            key_to_use = day
-            gpxs_to_use = self.queue[key_to_use]
-            gpxs_to_use = [tt.Track.from_gpx(gpx['path'], self.debug)[0] for gpx in gpxs_to_use]
-
-
-            self.current_day = key_to_use
-
-            segs = []
-            for gpx in gpxs_to_use:
-                segs.extend(gpx.segments)
-
-            track = tt.Track('', segments=segs, debug=self.debug)
-            track.name = track.generate_name(self.config['trip_name_format'])
+                self.current_day = key_to_use
+                self.current_gpxs = gpxs
 
-            self.history = [track]
-            self.current_step = Step.preview
-        else:
-            raise TypeError('Cannot find any track for day: %s' % day)
+                self.history = [track]
+                self.current_step = Step.preview
+                self.prefetch()
+            else:
+                raise TypeError('Cannot find any track for day: %s' % day)
 
     def reload_queue(self):
         """ Reloads the current queue, filling it with the current file's details existing
             in the input folder
+
+        Lists the whole input folder. While it's watched, the queue is already kept up to
+        date, see `input_changed`
         """
-        queue = {}
-        current_day_in_queue = False
+        with self.queue_lock:
+            self.queue = DayQueue(self.list_gpxs())
+            self.life_queue = sorted(self.list_lifes())
+            self.sync_current_day()
 
-        gpxs = self.list_gpxs()
-        lifes = self.list_lifes()
-        for gpx in gpxs:
-            day = gpx['date']
-            current_day_in_queue = current_day_in_queue or day == self.current_day
-            if day in queue:
-                queue[day].append(gpx)
-            else:
-                queue[day] = [gpx]
+    def prefetch(self):
+        """ Starts loading, and converting, the days that follow the current one
 
-        self.queue = OrderedDict(sorted(queue.items()))
-        self.life_queue = lifes
+        See `DayPrefetcher`. They are used by `change_day`, and the trip by `process`
+        """
+        if self.is_bulk_processing or self.config['prefetch_days'] <= 0:
+            return
 
-        if len(list(self.queue.items())) == 0:
+        days = [(day, [gpx['path'] for gpx in gpxs]) for day, gpxs in self.queue.items() if day != self.current_day]
+        self.prefetcher.schedule(days[:self.config['prefetch_days']], self.config)
+
+    def sync_current_day(self):
+        """ Changes to the first queued day, if the current one is no longer queued
+        """
+        if len(self.queue) == 0:
             self.current_day = None
+            self.current_gpxs = []
             self.current_step = Step.done
-        elif not current_day_in_queue:
-            self.current_day = list(self.queue.items())[0][0]
+        elif self.current_day not in self.queue:
+            self.current_day = next(iter(self.queue))
             self.change_day(self.current_day)
 
+    def input_changed(self, name):
+        """ Updates the queue after a file of the input folder was written, moved or removed
+
+        See `watcher.Watcher`
+
+        Args:
+            name (str or None): file name, None if unknown files changed
+        """
+        if name is None or not self.config['input_path']:
+            self.reload_queue()
+            return
+
+        input_path = expanduser(self.config['input_path'])
+        path = join(input_path, name)
+        extension = name.split('.')[-1]
+
+        with self.queue_lock:
+            if extension == 'gpx':
+                self.queue.discard(path)
+                if isfile(path):
+                    try:
+                        self.queue.add(file_details(input_path, name, self.debug, self.gpx_cache))
+                        self.gpx_cache.save_later()
+                    except (OSError, IndexError, ValueError):
+                        # Not a GPX file with dates, or removed meanwhile
+                        pass
+            elif extension == 'life':
+                if name in self.life_queue:
+                    self.life_queue.remove(name)
+                if isfile(path):
+                    insort(self.life_queue, name)
+            else:
+                return
+
+            # Bulk processing changes days itself, and resets when it's done
+            if not self.is_bulk_processing:
+                self.sync_current_day()
+                self.prefetch()
+
+    def watch_input(self):
+        """ Starts watching the input folder, see `input_changed`
+
+        Stops watching the previous input folder, if any
+        """
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+        input_path = self.config['input_path']
+        if self.config['watch_input'] and input_path and isdir(expanduser(input_path)):
+            self.watcher = watch(input_path, self.input_changed, self.config['watch_interval'], self.debug)
+
     def next_day(self, delete=True):
         """ Advances a day (to next existing one)
 
@@ -298,7 +518,8 @@ class ProcessingManager(Manager):
         """
         
         if delete:
-            del self.queue[self.current_day]
+            # It may have been removed already, if its files were moved
+            self.queue.pop(self.current_day, None)
         existing_days = list(self.queue.keys())
         if self.current_day in existing_days:
             index = existing_days.index(self.current_day)
@@ -321,9 +542,11 @@ class ProcessingManager(Manager):
     def restore(self):
         """ Backs down a pass
         """
-        if self.current_step != Step.done and self.current_step != Step.preview:
-            self.current_step = Step.prev(self.current_step)
-            self.history.pop()
+        with self.queue_lock:
+            if self.current_step != Step.done and self.current_step != Step.preview:
+                self.current_step = Step.prev(self.current_step)
+                self.history.pop()
+                self.current_key = None
 
     def process(self, data, calculate_canonical=True):
         """ Processes the current step
@@ -333,39 +556,50 @@ class ProcessingManager(Manager):
         Returns:
             :obj:`tracktotrip3.Track`
         """
-        step = self.current_step
+        # The watcher can't change the day while it's processed, see `input_changed`
+        with self.queue_lock:
+            step = self.current_step
 
-        if 'changes' in list(data.keys()):
-            changes = data['changes']
-        else:
-            changes = []
+            if 'changes' in list(data.keys()):
+                changes = data['changes']
+            else:
+                changes = []
 
-        if 'LIFE' in list(data.keys()):
-            life = data['LIFE']
-        else:
-            life = ''
-
-        if len(changes) > 0:
-            track = tt.Track.from_json(data['track'], self.debug)
-            self.history[-1] = track
-        track = self.current_track().copy()
-
-        if step == Step.preview:
-            result = self.preview_to_adjust(track)#, changes)
-        elif step == Step.adjust:
-            result = self.adjust_to_annotate(track)
-        elif step == Step.annotate:
-            if not life or len(life) == 0:
-                life = track.to_life(self.config["trip_annotations"])
-            return self.annotate_to_next(track, life, calculate_canonical)
-        else:
-            return None
+            if 'LIFE' in list(data.keys()):
+                life = data['LIFE']
+            else:
+                life = ''
+
+            if len(changes) > 0:
+                track = tt.Track.from_json(data['track'], self.debug)
+                self.history[-1] = track
+                self.prefetched_trip = None
+                # Edited tracks aren't cached
+                self.current_key = None
+            track = self.current_track().copy()
+            key = None
+
+            if step == Step.preview and self.prefetched_trip:
+                result = self.prefetched_trip.copy()
+                key = stage_key('trip', self.current_key, self.config) if self.current_key else None
+            elif step == Step.preview:
+                key = stage_key('trip', self.current_key, self.config) if self.current_key else None
+                result = self.preview_to_adjust(track, key)#, changes)
+            elif step == Step.adjust:
+                result = self.adjust_to_annotate(track, self.current_key)
+            elif step == Step.annotate:
+                if not life or len(life) == 0:
+                    life = track.to_life(self.config["trip_annotations"])
+                return self.annotate_to_next(track, life, calculate_canonical)
+            else:
+                return None
 
-        if result:
-            self.current_step = Step.next(self.current_step)
-            self.history.append(result)
+            if result:
+                self.current_step = Step.next(self.current_step)
+                self.history.append(result)
+                self.current_key = key
 
-        return result
+            return result
     
     def edit_latest_metrics(self, key, value):
         """ Adds a new key/value pair to the latest metrics object in the metrics array
@@ -379,18 +613,97 @@ class ProcessingManager(Manager):
             self.metrics[-1][key] = value
 
     def get_bulk_progress(self):
-        """ Returns bulk processing progress status
+        """ Returns bulk processing progress status, the throughput and queue depth
+            of each stage (see `pipeline.Pipeline.stats`) and the id of the running job
         """
 
-        return {"progress": self.bulk_progress}
+        job = self.jobs.running('bulk')
+        return {
+            "progress": self.bulk_progress,
+            "stages": self.pipeline.stats() if self.pipeline else [],
+            "job": job.id if job else None
+        }
+
+    def start_bulk_process(self):
+        """ Starts bulk processing in the background, unless it's already running
+
+        See `bulk_process`
+
+        Returns:
+            (:obj:`jobs.Job`, bool): the bulk processing job, and whether it was started now
+        """
+        with self.state_lock:
+            job = self.jobs.running('bulk')
+            if job:
+                return job, False
+            return self.jobs.submit('bulk', lambda job: self.bulk_process(False, job)), True
+
+    @contextmanager
+    def interactive(self):
+        """ Guards an interactive change of the processing state
+
+        Bulk processing changes the current day, its history and step, so they can't be
+        changed while it runs, and it isn't started while they're being changed.
+        Interactive changes are made one at a time
+
+        Raises:
+            :obj:`BulkProcessingError`: if bulk processing is running
+        """
+        with self.state_lock:
+            job = self.jobs.running('bulk')
+            if job or self.is_bulk_processing:
+                raise BulkProcessingError(job)
+            yield
+
+    def get_job(self, job_id):
+        """ Gets a background job
+
+        Args:
+            job_id (str)
+        Returns:
+            :obj:`jobs.Job` or None
+        """
+        return self.jobs.get(job_id)
+
+    def cancel_job(self, job_id):
+        """ Asks a background job to stop
+
+        Bulk processing stops after the days already being processed are stored
+
+        Args:
+            job_id (str)
+        Returns:
+            :obj:`jobs.Job` or None
+        """
+        job = self.jobs.get(job_id)
+        if job:
+            job.cancel()
+        return job
 
-    def bulk_process(self, raw):
+    def bulk_process(self, raw, job=None):
         """ Starts bulk processing all GPXs queued
+
+        Days go through a pipeline (see `pipeline.Pipeline`), so that a day is loaded
+        while the previous ones are stored:
+            + convert: loads the GPX files and converts them into a trip, see `prepare_day`.
+                With more than one `bulk_workers`, it runs in a process pool
+            + annotate: infers locations and stores the day in the database. Days
+                are stored in order, by a single thread, like in `annotate_to_next`
+            + export: writes the GPX and LIFE files and backs up the input files
+
+        Each day is journaled, see `commit_day`. Days that were stored by an interrupted
+        run are completed first, and aren't processed again
+
+        Args:
+            raw (bool)
+            job (:obj:`jobs.Job`, optional): job to report progress to. When it's
+                cancelled, no more days are started
         """
 
+        self.prefetcher.clear()
+        self.resume_journal()
         self.reload_queue()
 
-        processed = 1
         total_num_days = len(list(self.queue.values()))
         self.is_bulk_processing = True
         self.bulk_progress = 0
@@ -404,82 +717,190 @@ class ProcessingManager(Manager):
         lifes = Life()
         lifes.from_string(all_lifes)
 
+        # Canonical trips stay in memory for the whole run, see `annotate_to_next`
+        if self.config['bulk_calculate_canonical']:
+            self.canonical_index = self.load_canonical_index()
+
+        # Days are processed from the current one onwards, see `next_day`
+        days = list(self.queue.keys())
+        if self.current_day in days:
+            index = days.index(self.current_day)
+            days = days[index:] + days[:index]
+
+        workers = self.config['bulk_workers']
+        pool = ProcessPoolExecutor(workers) if workers > 1 else None
         start_time = datetime.now().timestamp()
-        while len(list(self.queue.values())) > 0:
+        processed = [0]
+
+        def queued_days():
+            """ Days to process, until the job is cancelled
+            """
+            for day in days:
+                if job and job.is_cancelled():
+                    return
+                yield day
+
+        def convert(day):
+            """ Loads a day, and converts it into a trip
+
+            Args:
+                day (str)
+            Returns:
+                (str, :obj:`list` of :obj:`dict`, :obj:`tracktotrip3.Track`, :obj:`tracktotrip3.Track`,
+                    str, float): day, details of its GPX files, track, trip, the trip's
+                    stage key and seconds since bulk processing started, when the day was started
+            """
             start = datetime.now().timestamp() - start_time
-            
-            if self.use_metrics:
-                self.metrics.append({})
-            
-            life = next((day for day in lifes if day.date == self.current_day.replace("-", "_")), "")
-            # preview -> adjust
-            self.process({'changes': [], 'LIFE': ''})
-            # adjust -> annotate
-            self.process({'changes': [], 'LIFE': ''})
-            # annotate -> store
-            self.process({'changes': [], 'LIFE': str(life)}, self.config["bulk_calculate_canonical"])
+            gpxs = list(self.queue[day])
+            paths = [gpx['path'] for gpx in gpxs]
+            if pool:
+                track, trip, key = pool.submit(prepare_day, paths, self.config, self.debug).result()
+            else:
+                track, trip, key = prepare_day(paths, self.config, self.debug)
+            key = stage_key('trip', key, self.config) if key else None
+            return day, gpxs, track, trip, key, start
+
+        def annotate(converted):
+            """ Infers the locations of a day, and stores it in the database
+
+            Args:
+                converted (tuple): see `convert`
+            Returns:
+                (str, :obj:`list` of :obj:`dict`, :obj:`dict`, int): day, details of the
+                    GPX files it was stored from, its file operations and journal entry id.
+                    See `commit_day`
+            """
+            day, gpxs, track, trip, key, start = converted
+
+            self.current_day = day
+            annotated = self.adjust_to_annotate(trip.copy(), key)
+            self.history = [track, trip, annotated]
+            self.current_step = Step.annotate
+
+            life = next((l for l in lifes if l.date == day.replace("-", "_")), "")
+            life = str(life)
+            if not life or len(life) == 0:
+                life = annotated.to_life(self.config["trip_annotations"])
+
+            track = annotated.copy()
+            if not track.name or len(track.name) == 0:
+                track.name = track.generate_name(self.config['trip_name_format'])
+            is_edit = self.is_edit(track)
+
+            # Like in `annotate_to_next`
+            gpxs = [gpx for gpx in gpxs if is_unchanged(gpx)]
+            files = self.day_files(day, gpxs, track, life, is_edit)
+            journal_id = self.store_day(day, track, life, is_edit, self.config["bulk_calculate_canonical"], files)
 
             # Register metrics
             if self.use_metrics:
-                self.edit_latest_metrics("start", start) # start represents seconds since bulk processing started
-                self.edit_latest_metrics("day", processed)
-                self.edit_latest_metrics("duration", (datetime.now().timestamp() - start_time) - start)
+                self.metrics.append({
+                    "segments": len(track.segments),
+                    "points": sum([len(segment.points) for segment in track.segments]),
+                    "start": start, # start represents seconds since bulk processing started
+                    "day": len(self.metrics) + 1,
+                    "duration": (datetime.now().timestamp() - start_time) - start
+                })
 
-            print(f"{processed}/{total_num_days} days processed")
-            self.bulk_progress = (processed / total_num_days) * 100
-            processed += 1
+            return day, gpxs, files, journal_id
 
-        for life_file in self.life_queue:
-            life_path = join(expanduser(self.config['input_path']), life_file)
-            backup_path = join(expanduser(self.config['backup_path']), life_file)
-            rename(life_path, backup_path)
+        def export(stored):
+            """ Writes the files of a day, and backs up its input files
 
-        self.life_queue = []
+            Args:
+                stored ((str, :obj:`dict`, int)): see `annotate`
+            """
+            day, gpxs, files, journal_id = stored
+            self.apply_day_files(files)
+            self.finish_day(journal_id)
+            for gpx in gpxs:
+                self.queue.discard(gpx['path'])
+
+            processed[0] += 1
+            print(f"{processed[0]}/{total_num_days} days processed")
+            self.bulk_progress = (processed[0] / total_num_days) * 100
+
+            if job:
+                job.update(
+                    progress=self.bulk_progress,
+                    processed=processed[0],
+                    total=total_num_days,
+                    day=day,
+                    stages=self.pipeline.stats()
+                )
+
+        self.pipeline = Pipeline([
+            Stage('convert', convert, workers),
+            Stage('annotate', annotate),
+            Stage('export', export)
+        ], self.config['bulk_queue_size'])
+
+        if job:
+            job.update(progress=0, processed=0, total=total_num_days)
+
+        try:
+            self.pipeline.run(queued_days())
+        finally:
+            stats = self.pipeline.stats()
+            if self.debug or self.use_metrics:
+                for stage in stats:
+                    print(stage)
+
+            self.canonical_index = None
+            self.pipeline = None
+            self.is_bulk_processing = False
+            self.bulk_progress = -1
+            if pool:
+                pool.shutdown(cancel_futures=True)
+            # Stored days whose files weren't written, e.g. when exporting failed, are
+            # completed before they're queued again
+            try:
+                self.resume_journal()
+            except Exception as error:
+                if self.debug:
+                    print(f"Could not resume the bulk journal: {error}")
+            self.reset()
+
+        # LIFE files are kept while some of their days weren't processed
+        if processed[0] == total_num_days:
+            for life_file in self.life_queue:
+                life_path = join(expanduser(self.config['input_path']), life_file)
+                backup_path = join(expanduser(self.config['backup_path']), life_file)
+                rename(life_path, backup_path)
+
+            self.life_queue = []
 
         if self.use_metrics:
             with open('metrics.json', 'w') as metrics_file:
                 json.dump(self.metrics, metrics_file)
+            with open('metrics_stages.json', 'w') as metrics_file:
+                json.dump(stats, metrics_file)
             self.metrics = []
-
-        self.is_bulk_processing = False
-        self.bulk_progress = -1
  
-    def preview_to_adjust(self, track):
+    def preview_to_adjust(self, track, key=None):
         """ Processes a track so that it becomes a trip
 
-        More information in `tracktotrip3.Track`'s `to_trip` method
+        See `track_to_trip`
 
         Args:
             track (:obj:`tracktotrip3.Track`)
-            changes (:obj:`list` of :obj:`dict`): Details of, user made, changes
+            key (str, optional): stage key of the trip, see `prepare_day`.
+                Defaults to None, to not use the stage cache
         Returns:
             :obj:`tracktotrip3.Track`
         """
-        config = self.config
-
-        if not track.name or len(track.name) == 0:
-            track.name = track.generate_name(config['trip_name_format'])
-
-        track.timezone(timezone=float(config['default_timezone']))
-        track = track.to_trip(
-            smooth=config['smoothing']['use'],
-            smooth_strategy=config['smoothing']['algorithm'],
-            smooth_noise=config['smoothing']['noise'],
-            seg=config['segmentation']['use'],
-            seg_eps=config['segmentation']['epsilon'],
-            seg_min_time=config['segmentation']['min_time'],
-            simplify=config['simplification']['use'],
-            simplify_max_dist_error=config['simplification']['max_dist_error'],
-            simplify_max_speed_error=config['simplification']['max_speed_error']
-        )
-
-        return track
+        return cached_stage(self.config, 'trip', key, lambda: track_to_trip(track, self.config), self.debug)
 
-    def adjust_to_annotate(self, track):
+    def adjust_to_annotate(self, track, key=None):
         """ Extracts location from track
 
+        Inferred locations depend on the stored ones, so their stage key includes the
+        locations table's fingerprint, see `db.locations_version`
+
         Args:
             track (:obj:`tracktotrip3.Track`)
+            key (str, optional): stage key of the trip, see `prepare_day`.
+                Defaults to None, to not use the stage cache
         Returns:
             :obj:`tracktotrip3.Track`
         """
@@ -488,33 +909,58 @@ class ProcessingManager(Manager):
         c_loc = config['location']
 
         conn, cur = self.db_connect()
+        # Nearest locations of each segment's endpoints, see `infer`
+        nearby = {}
 
         def get_locations(point, radius):
             """ Gets locations within a radius of a point
 
-            See `db.query_locations`
+            Endpoints use the locations fetched with the rest of the day's, see
+            `db.query_nearest_locations`. Otherwise see `db.query_locations`
 
             Args:
                 point (:obj:`tracktotrip3.Point`)
                 radius (float): Radius, in meters
             Returns:
-                :obj:`list` of (str, ?, ?)
+                :obj:`list` of (str, :obj:`tracktotrip3.Point`, ?)
             """
-            if cur:
+            if (point.lat, point.lon) in nearby:
+                labels, centroids = nearby[(point.lat, point.lon)]
+                return [(label, tt.Point(lat, lon, None), None) for label, (lat, lon) in zip(labels, centroids.tolist())]
+            elif cur:
                 return db.query_locations(cur, point.lat, point.lon, radius, self.debug)
             else:
                 return []
 
-        # Does not use APIs to infer location in annotate step
-        track.infer_location(
-            get_locations,
-            max_distance=c_loc['max_distance'],
-            use_google=False,
-            google_key=c_loc['google_key'],
-            use_foursquare=False,
-            foursquare_key=c_loc['foursquare_key'],
-            limit=c_loc['limit']
-        )
+        def infer():
+            """ Infers the locations of the track
+
+            Returns:
+                :obj:`tracktotrip3.Track`
+            """
+            if cur:
+                # Locations are inferred for the first and last point of each segment,
+                # so they're all fetched in one query
+                endpoints = [point for segment in track.segments for point in (segment.points[0], segment.points[-1])]
+                nearest = db.query_nearest_locations(cur, endpoints, c_loc['max_distance'], c_loc['limit'], self.debug)
+                nearby.update(((point.lat, point.lon), locations) for point, locations in zip(endpoints, nearest))
+
+            # Does not use APIs to infer location in annotate step
+            track.infer_location(
+                get_locations,
+                max_distance=c_loc['max_distance'],
+                use_google=False,
+                google_key=c_loc['google_key'],
+                use_foursquare=False,
+                foursquare_key=c_loc['foursquare_key'],
+                limit=c_loc['limit']
+            )
+            return track
+
+        if key and StageCache.from_config(config):
+            version = db.locations_version(cur, self.debug) if cur else None
+            key = stage_key('annotated', key, config, version)
+        track = cached_stage(config, 'annotated', key, infer, self.debug)
 
         db.dispose(conn, cur)
 
@@ -538,9 +984,7 @@ class ProcessingManager(Manager):
         if not track.name or len(track.name) == 0:
             track.name = track.generate_name(self.config['trip_name_format'])
         
-        # Is editing if a file exists in output with the day's date
-        output_files = glob.glob(self.config['output_path'] + f'{track.name}*')
-        is_edit = len(output_files) > 0
+        is_edit = self.is_edit(track)
 
         # Metrics
 
@@ -550,6 +994,80 @@ class ProcessingManager(Manager):
             self.edit_latest_metrics("segments", len(track.segments))
             self.edit_latest_metrics("points", n_points)
 
+        # Keeps the watcher from changing the day, while its files are moved
+        with self.queue_lock:
+            # Files added, or rewritten, since the day was loaded weren't processed, so
+            # they're kept in the input folder, and queued
+            gpxs = [gpx for gpx in self.current_gpxs if is_unchanged(gpx)]
+            self.commit_day(self.current_day, gpxs, track, life, is_edit, calculate_canonical)
+            for gpx in gpxs:
+                self.queue.discard(gpx['path'])
+            self.next_day(delete=False)
+
+        if (self.current_day == None):
+            self.current_step = Step.done
+        else:
+            self.current_step = Step.preview
+
+        return self.current_track()
+
+    def is_edit(self, track):
+        """ Checks if a day was already processed before
+
+        Is editing if a file exists in output with the day's date
+
+        Args:
+            track (:obj:`tracktotrip3.Track`): named track of the day
+        Returns:
+            bool
+        """
+        output_files = glob.glob(self.config['output_path'] + f'{track.name}*')
+        return len(output_files) > 0
+
+    def commit_day(self, day, gpxs, track, life, is_edit, calculate_canonical=True):
+        """ Stores a day in the database, and then exports and backs up its files
+
+        The file operations are journaled with the database writes, so that, if they
+            are interrupted, they are done by `resume_journal`
+
+        Args:
+            day (str)
+            gpxs (:obj:`list` of :obj:`dict`): details of the GPX files the day was
+                loaded from, see `file_details`
+            track (:obj:`tracktotrip3.Track`): named, annotated, track of the day
+            life (str): LIFE of the day
+            is_edit (bool): if the day was already processed before. See `is_edit`
+            calculate_canonical (bool): If true, calculates canonical trips and locations 
+        """
+        files = self.day_files(day, gpxs, track, life, is_edit)
+        journal_id = self.store_day(day, track, life, is_edit, calculate_canonical, files)
+        self.apply_day_files(files)
+        self.finish_day(journal_id)
+
+    def day_files(self, day, gpxs, track, life, is_edit):
+        """ File operations that complete a day: exporting it as GPX and LIFE files,
+            and moving its GPX files from the input path to the backup path
+
+        Example:
+            >>> manager.day_files('2016-07-25', gpxs, track, life, False)
+            {
+                'writes': [['/users/username/output/2016-07-25.gpx', '<?xml ...']],
+                'life_all': {'path': '/users/username/life/all.life', 'date': '2016_07_25', 'life': '--2016_07_25 ...', 'is_edit': False},
+                'moves': [['/users/username/input/25072016.gpx', '/users/username/backup/25072016.gpx']]
+            }
+
+        Args:
+            day (str)
+            gpxs (:obj:`list` of :obj:`dict`): details of the GPX files to back up, see
+                `file_details`
+            track (:obj:`tracktotrip3.Track`): named track of the day
+            life (str): LIFE of the day
+            is_edit (bool): if the day was already processed before. See `is_edit`
+        Returns:
+            :obj:`dict`: See example. It's JSON serializable, to be journaled
+        """
+        files = {'writes': [], 'life_all': None, 'moves': []}
+
         # Export trip to GPX
         if self.config['output_path']:
             if self.config['multiple_gpxs_for_day']:
@@ -559,48 +1077,115 @@ class ProcessingManager(Manager):
                     name = track.name.split('.')[0] 
                     output_path = join(expanduser(self.config['output_path']), name + f'_{i}.gpx')
                     i += 1
-                    save_to_file(output_path, seg.to_gpx())
+                    files['writes'].append([output_path, seg.to_gpx()])
             else:
                 output_path = join(expanduser(self.config['output_path']), track.name)
-                save_to_file(output_path, track.to_gpx())
+                files['writes'].append([output_path, track.to_gpx()])
 
         # To LIFE
         if self.config['life_path']:
             name = '.'.join(track.name.split('.')[:-1])
-            save_to_file(join(expanduser(self.config['life_path']), name + '.life'), life)
+            files['writes'].append([join(expanduser(self.config['life_path']), name + '.life'), life])
 
             if self.config['life_all']:
                 life_all_file = expanduser(self.config['life_all'])
             else:
                 life_all_file = join(expanduser(self.config['life_path']), 'all.life')
 
-            if is_edit:
-                all_lifes = open(life_all_file, 'r').read()
+            files['life_all'] = {
+                'path': life_all_file,
+                'date': day.replace('-','_'),
+                'life': life,
+                'is_edit': is_edit
+            }
+
+        # Backup
+        if self.config['backup_path']:
+            for gpx in gpxs:
+                files['moves'].append([gpx['path'], join(expanduser(self.config['backup_path']), gpx['name'])])
+
+        return files
+
+    def apply_day_files(self, files, resumed=False):
+        """ Does the file operations of a day
+
+        See `day_files`
+
+        Args:
+            files (:obj:`dict`)
+            resumed (bool, optional): True if they may have been partially done before.
+                Defaults to False
+        """
+        for path, content in files['writes']:
+            save_to_file(path, content)
+
+        life_all = files['life_all']
+        if life_all:
+            lifes = None
+            if life_all['is_edit'] or resumed:
                 lifes = Life()
-                lifes.from_string(all_lifes)
-                life_date = self.current_day.replace('-','_')
+                if isfile(life_all['path']):
+                    lifes.from_string(open(life_all['path'], 'r').read())
 
-                lifes.update_day_from_string(life_date, life)
-                save_to_file(life_all_file, repr(lifes))
+            if lifes and lifes.day_at_date(life_all['date']):
+                lifes.update_day_from_string(life_all['date'], life_all['life'])
+                save_to_file(life_all['path'], repr(lifes))
             else:
-                save_to_file(life_all_file, "%s\n\n" % life, mode='a+')
+                save_to_file(life_all['path'], "%s\n\n" % life_all['life'], mode='a+')
 
+        for from_path, to_path in files['moves']:
+            # Already moved, if resumed
+            if not isfile(from_path):
+                continue
+
+            if isfile(to_path):
+                replace(from_path, to_path)
+            else:
+                rename(from_path, to_path)
+
+    def store_day(self, day, track, life, is_edit, calculate_canonical=True, files=None):
+        """ Stores a day in the database
+
+        Stores its trips, locations and, optionally, canonical trips, in a single
+        transaction, and invalidates the cached tiles they cover
+
+        Args:
+            day (str)
+            track (:obj:`tracktotrip3.Track`): annotated track of the day
+            life (str): LIFE of the day
+            is_edit (bool): if the day was already processed before. See `is_edit`
+            calculate_canonical (bool): If true, calculates canonical trips and locations 
+            files (:obj:`dict`, optional): file operations to journal with the day.
+                See `day_files`
+        Returns:
+            int or None: journal entry id, None if there's no database or nothing to journal
+        """
         conn, cur = self.db_connect()
+        # Scoped to this transaction, see `db.LocationCache`
+        location_cache = self.new_location_cache()
+
+        if not (conn and cur):
+            return None
+
+        try:
+            # Bounding boxes of changed geometries, to invalidate cached tiles
+            changed_bounds = {'trips': [], 'canonical_trips': [], 'locations': []}
 
-        if conn and cur:
             if is_edit:
                 if self.debug:
-                    print(f"updating day: {self.current_day}")
-                db.remove_trips_from_day(cur, self.current_day, self.debug)
+                    print(f"updating day: {day}")
+                changed_bounds['trips'].extend(db.get_day_bounds(cur, day, self.debug)['trips'])
+                db.remove_trips_from_day(cur, day, self.debug)
 
             db.load_from_segments_annotated(
                 cur,
-                self.current_track(),
+                track,
                 life,
                 self.config['location']['max_distance'],
                 self.config['location']['min_samples'],
                 True,
-                self.debug
+                self.debug,
+                location_cache
             )
 
             def insert_can_trip(can_trip, mother_trip_id):
@@ -615,7 +1200,11 @@ class ProcessingManager(Manager):
                 Returns:
                     int: Canonical trip id
                 """
-                return db.insert_canonical_trip(cur, can_trip, mother_trip_id, self.debug)
+                changed_bounds['canonical_trips'].append(can_trip.bounds())
+                can_id = db.insert_canonical_trip(cur, can_trip, mother_trip_id, self.debug)
+                if self.canonical_index:
+                    self.canonical_index.insert(can_id, can_trip)
+                return can_id
 
             def update_can_trip(can_id, trip, mother_trip_id):
                 """ Updates a cannonical trip on the database
@@ -628,7 +1217,13 @@ class ProcessingManager(Manager):
                     mother_trip_id (int): Id of the trip that originated the canonical
                         representation
                 """
+                changed_bounds['canonical_trips'].append(trip.bounds())
+                changed_bounds['canonical_trips'].extend(
+                    [can_trip.bounds() for i, can_trip in canonical_trips if i == can_id]
+                )
                 db.update_canonical_trip(cur, can_id, trip, mother_trip_id, self.debug)
+                if self.canonical_index:
+                    self.canonical_index.update(can_id, trip)
 
             trips_ids = []
             for trip in track.segments:
@@ -641,11 +1236,15 @@ class ProcessingManager(Manager):
                     self.debug
                 )
                 trips_ids.append(trip_id)
+                changed_bounds['trips'].append(trip.bounds())
 
                 if calculate_canonical:
                     d_latlon = estimate_meters_to_deg(self.config['location']['max_distance'], debug=self.debug)
                     # Build/learn canonical trip
-                    canonical_trips = db.match_canonical_trip(cur, trip, d_latlon, self.debug)
+                    if self.canonical_index:
+                        canonical_trips = self.canonical_index.match(trip, d_latlon)
+                    else:
+                        canonical_trips = db.match_canonical_trip(cur, trip, d_latlon, self.debug)
 
                     if self.debug:
                         print("canonical_trips # = %d" % len(canonical_trips))
@@ -661,28 +1260,61 @@ class ProcessingManager(Manager):
                         debug=self.debug
                     )
 
+            moved = location_cache.flush(cur, self.location_index)
+            changed_bounds['locations'] = [(p.lat, p.lon, p.lat, p.lon) for p in moved]
+            journal_id = db.journal_day(cur, day, files, self.debug) if files else None
+        except Exception:
+            # The transaction is rolled back by the pool, and the location and canonical
+            # trip indexes may have its changes
+            self.location_index = None
+            self.canonical_index = None
+            cur.close()
+            db.release(conn)
+            raise
+
+        self.commit_indexed(conn, cur)
+        self.invalidate_tiles(changed_bounds)
+        return journal_id
+
+    def finish_day(self, journal_id):
+        """ Marks the file operations of a day as done
+
+        Args:
+            journal_id (int or None): See `store_day`
+        """
+        if journal_id is None:
+            return
+
+        conn, cur = self.db_connect()
+        if conn and cur:
+            db.finish_journal_entry(cur, journal_id, self.debug)
             db.dispose(conn, cur)
 
-        # Backup
-        if self.config['backup_path']:
-            for gpx in self.queue[self.current_day]:
-                from_path = gpx['path']
-                to_path = join(expanduser(self.config['backup_path']), gpx['name'])
-                
-                if isfile(to_path):
-                    replace(from_path, to_path)
-                else:
-                    rename(from_path, to_path)
+    def resume_journal(self):
+        """ Completes the days whose database writes were committed, but whose file
+            operations may have been interrupted, e.g. by a crash during bulk processing
 
-        self.next_day()
+        Their GPX files are moved to the backup path, so they are no longer queued
 
-        if (self.current_day == None):
-            self.current_step = Step.done
-        else:
-            self.current_step = Step.preview
+        Returns:
+            :obj:`list` of str: resumed days
+        """
+        conn, cur = self.db_connect()
+        if not (conn and cur):
+            return []
 
-        return self.current_track()
+        try:
+            entries = db.pending_journal_entries(cur, self.debug)
+        finally:
+            db.dispose(conn, cur)
+
+        for journal_id, day, files in entries:
+            if self.debug:
+                print(f"resuming day: {day}")
+            self.apply_day_files(files, resumed=True)
+            self.finish_day(journal_id)
 
+        return [day for _, day, _ in entries]
 
     def current_track(self):
         """ Gets the current trip/track
@@ -763,18 +1395,117 @@ class ProcessingManager(Manager):
             content (str): LIFE formated string
         """
         conn, cur = self.db_connect()
+        location_cache = self.new_location_cache()
 
-        if conn and cur:
+        if not (conn and cur):
+            return
+
+        try:
             db.load_from_segments_annotated(
                 cur,
                 tt.Track('', [], debug=self.debug),
                 str(content, 'utf-8'),
                 self.config['location']['max_distance'],
                 self.config['location']['min_samples'],
-                debug=self.debug
+                debug=self.debug,
+                location_cache=location_cache
             )
+            moved = location_cache.flush(cur, self.location_index)
+        except Exception:
+            # See `store_day`
+            self.location_index = None
+            cur.close()
+            db.release(conn)
+            raise
+
+        self.commit_indexed(conn, cur)
+        self.invalidate_tiles({'locations': [(p.lat, p.lon, p.lat, p.lon) for p in moved]})
+
+    def commit_indexed(self, conn, cur):
+        """ Commits a transaction that changed locations, or canonical trips, and
+            disposes its connection
+
+        The location and canonical trip indexes already have the changes, so they're
+        dropped if the commit fails. The location index is loaded again when needed,
+        see `loaded_location_index`, and canonical trips are matched in the database
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+            cur (:obj:`psycopg2.cursor`)
+        """
+        try:
+            db.dispose(conn, cur)
+        except Exception:
+            self.location_index = None
+            self.canonical_index = None
+            raise
+
+    def new_location_cache(self):
+        """ Creates a location cache with the current location settings
+
+        See `db.LocationCache`
+
+        Returns:
+            :obj:`db.LocationCache`
+        """
+        c_loc = self.config['location']
+        return db.LocationCache(c_loc['max_distance'], c_loc['min_samples'], c_loc['sample_size'], self.debug)
+
+    def loaded_location_index(self):
+        """ In-process spatial index of locations, if it's loaded
+
+        The first call starts loading it in the background, see `load_location_index`
+
+        Returns:
+            :obj:`location_index.LocationIndex` or None: None while it's loading
+        """
+        with self.location_index_lock:
+            index = self.location_index
+            if index is None:
+                index = self.location_index = LocationIndex(self.debug)
+                threading.Thread(target=self.load_location_index, args=(index,), name='location-index', daemon=True).start()
+
+        return index if index.ready else None
+
+    def load_location_index(self, index):
+        """ Loads every location into an in-process spatial index
+
+        Locations written meanwhile are registered in it as well. If the database is
+        unreachable, the index is dropped, so that it's loaded again later
+
+        Args:
+            index (:obj:`location_index.LocationIndex`)
+        """
+        conn, cur = self.db_connect()
+        try:
+            if conn and cur:
+                index.load(cur)
+        except Exception as error:
+            if self.debug:
+                print("Could not load the location index: %s" % error)
+        finally:
+            db.dispose(conn, cur)
+
+        if not index.ready:
+            with self.location_index_lock:
+                if self.location_index is index:
+                    self.location_index = None
+
+    def load_canonical_index(self):
+        """ Loads every canonical trip into an in-process spatial index
+
+        See `trip_index.CanonicalTripIndex`
+
+        Returns:
+            :obj:`trip_index.CanonicalTripIndex` or None: None if the database is unreachable
+        """
+        conn, cur = self.db_connect()
+        index = None
+        if conn and cur:
+            index = CanonicalTripIndex(self.debug).load(cur)
 
         db.dispose(conn, cur)
+        return index
 
     def update_config(self, new_config):
         """ Updates the config object by overlapping with the new config object
@@ -783,17 +1514,28 @@ class ProcessingManager(Manager):
             new_config (obj): JSON object that contains configuration changes 
         """
         super().update_config(new_config)
+        self.prefetcher.clear()
+        self.prefetched_trip = None
+        if 'gpx_cache_path' in new_config:
+            self.gpx_cache = GPXMetadataCache(self.config['gpx_cache_path'], self.debug)
+        if 'location' in new_config:
+            self.place_providers = None
+        if 'input_path' in new_config or 'watch_input' in new_config or 'watch_interval' in new_config:
+            self.watch_input()
         if self.current_step is Step.done:
             self.load_days()
+        self.prefetch()
 
     def location_suggestion(self, point):
         c_loc = self.config['location']
-        conn, cur = self.db_connect()
+        index = self.loaded_location_index()
+        # The database is only used until the location index is loaded
+        conn, cur = self.db_connect() if index is None else (None, None)
 
         def get_locations(point, radius):
             """ Gets locations within a radius of a point
 
-            See `db.query_locations`
+            See `location_index.LocationIndex.query` and `db.query_locations`
 
             Args:
                 point (:obj:`tracktotrip3.Point`)
@@ -801,24 +1543,31 @@ class ProcessingManager(Manager):
             Returns:
                 :obj:`list` of (str, ?, ?)
             """
-            if cur:
+            if index:
+                return index.query(point.lat, point.lon, radius)
+            elif cur:
                 return db.query_locations(cur, point.lat, point.lon, radius, self.debug)
             else:
                 return []
 
+        # Places are added from the providers, see `main.places`
         locs = infer_location(
             point,
             get_locations,
             max_distance=c_loc['max_distance'],
-            use_google=c_loc['use'] and c_loc['use_google'],
+            use_google=False,
             google_key=c_loc['google_key'],
-            use_foursquare=c_loc['use'] and c_loc['use_foursquare'],
+            use_foursquare=False,
             foursquare_key=c_loc['foursquare_key'],
             limit=c_loc['limit'],
             debug=self.debug
         )
         db.dispose(conn, cur)
 
+        if self.place_providers is None:
+            self.place_providers = place_providers(c_loc, self.debug)
+        add_places(locs, self.place_providers, c_loc['max_distance'], c_loc['limit'])
+
         return locs.to_json()
 
     def get_canonical_trips(self):
@@ -833,7 +1582,7 @@ class ProcessingManager(Manager):
         conn, cur = self.db_connect()
         result = []
         if conn and cur:
-            result = db.get_canonical_trips(cur, self.debug)
+            result = db.get_canonical_trips(cur, debug=self.debug)
         for val in result:
             val['points'] = val['points'].to_json()
             val['points']['id'] = val['id']
@@ -871,12 +1620,13 @@ class ProcessingManager(Manager):
                 if len(existing_days) > 1:
                     self.next_day()
                 else:
-                    self.queue = {}
+                    self.queue = DayQueue()
                     self.current_day = None
+                    self.current_gpxs = []
                     self.current_step = Step.done
                     self.history = []
             else:
-                del self.queue[day]
+                self.queue.pop(day, None)
 
     def remove_day(self, files):
         """ Removes a day from the queue and deletes the corresponding input files
@@ -884,9 +1634,10 @@ class ProcessingManager(Manager):
         Args:
             files (:obj:`list` of :obj:`dict`)
         """
-        for file in files:
-            self.dismiss_day(file["date"])
-            remove(file["path"])
+        with self.queue_lock:
+            for file in files:
+                self.dismiss_day(file["date"])
+                remove(file["path"])
 
     def copy_day_to_input(self, day):
         """ Copies an already processed day from the output folder to the input folder to be edited 
@@ -903,12 +1654,13 @@ class ProcessingManager(Manager):
         # Get all files with day's date
         output_files = glob.glob(self.config['output_path'] + f'{date}*')
 
-        for day_gpx_path in output_files:
-            file_name = day_gpx_path.replace(expanduser(self.config['output_path']), '') 
-            copyfile(day_gpx_path, join(expanduser(self.config['input_path']), file_name))
-        
-        self.reload_queue()
-        self.change_day(day)
+        with self.queue_lock:
+            for day_gpx_path in output_files:
+                file_name = day_gpx_path.replace(expanduser(self.config['output_path']), '') 
+                copyfile(day_gpx_path, join(expanduser(self.config['input_path']), file_name))
+                self.input_changed(file_name)
+
+            self.change_day(day)
 
     def update_day(self, filename):
         """ Updates current day if a GPX file with the same date is inputted
@@ -919,12 +1671,13 @@ class ProcessingManager(Manager):
             filename (str): name of the inputted GPX file
         """
 
-        self.reload_queue()
-        date = predict_start_date(self.config["input_path"] + filename)
-        day = date.strftime(self.config['trip_name_format'])
+        with self.queue_lock:
+            self.input_changed(filename)
+            date = predict_start_date(self.config["input_path"] + filename)
+            day = date.strftime(self.config['trip_name_format'])
 
-        if day == self.current_day:
-            self.change_day(date.strftime(self.config['trip_name_format']))
+            if day == self.current_day:
+                self.change_day(date.strftime(self.config['trip_name_format']))
         
         
         
@@ -0,0 +1,163 @@
+"""
+Content-addressed cache of processing stage outputs
+
+Each stage's output is stored on disk, as `<cache path>/<stage>/<xx>/<key>.pickle`,
+where `xx` are the key's first characters. The key hashes everything the stage depends
+on: the contents of the day's GPX files and the settings the stage reads. A changed
+setting only misses the cache of the stages that read it, and of the ones after them.
+"""
+import json
+import pickle
+import hashlib
+
+from os import makedirs, replace, getpid
+from os.path import join, isfile, expanduser
+from importlib.metadata import version, PackageNotFoundError
+
+# Settings read by each stage. See `load_day_track`, `track_to_trip` and
+# `ProcessingManager.adjust_to_annotate`
+STAGE_CONFIG = {
+    'track': ['trip_name_format'],
+    'trip': ['trip_name_format', 'default_timezone', 'smoothing', 'segmentation', 'simplification'],
+    'annotated': ['location']
+}
+
+try:
+    # Outputs of another version may differ
+    TRACKTOTRIP_VERSION = version('tracktotrip3')
+except PackageNotFoundError:
+    TRACKTOTRIP_VERSION = None
+
+def files_hash(paths):
+    """ Hashes the contents of some files
+
+    Args:
+        paths (:obj:`list` of str): file paths, in order
+    Returns:
+        str
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        file_digest = hashlib.sha256()
+        with open(path, 'rb') as opened_file:
+            for chunk in iter(lambda: opened_file.read(1 << 16), b''):
+                file_digest.update(chunk)
+        digest.update(file_digest.digest())
+
+    return digest.hexdigest()
+
+def stage_key(stage, source, config, *extra):
+    """ Key of a stage's output
+
+    Args:
+        stage (str): one of `STAGE_CONFIG`
+        source (str): hash of the GPX files, see `files_hash`, or key of the previous stage
+        config (:obj:`dict`)
+        *extra: other values the stage depends on
+    Returns:
+        str
+    """
+    parts = [stage, TRACKTOTRIP_VERSION, source, [config[key] for key in STAGE_CONFIG[stage]], list(extra)]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+class StageCache(object):
+    """ On-disk cache of stage outputs
+
+    Arguments:
+        path: Root folder of the cache
+    """
+    def __init__(self, path, debug=False):
+        self.path = expanduser(path)
+        self.debug = debug
+
+    @staticmethod
+    def from_config(config, debug=False):
+        """ Cache set by the `stage_cache_path` setting
+
+        Args:
+            config (:obj:`dict`)
+            debug (bool, optional): activates debug mode.
+                Defaults to False
+        Returns:
+            :obj:`StageCache` or None: None if the setting isn't set
+        """
+        path = config.get('stage_cache_path')
+        return StageCache(path, debug) if path else None
+
+    def output_path(self, stage, key):
+        """ Path of a stage's output
+
+        Args:
+            stage (str)
+            key (str)
+        Returns:
+            str
+        """
+        return join(self.path, stage, key[:2], '%s.pickle' % key)
+
+    def get(self, stage, key):
+        """ Reads a stage's output
+
+        Args:
+            stage (str)
+            key (str)
+        Returns:
+            Stored output, or None if it isn't cached
+        """
+        path = self.output_path(stage, key)
+        if not isfile(path):
+            return None
+
+        try:
+            with open(path, 'rb') as output_file:
+                return pickle.load(output_file)
+        except Exception as error:
+            # Unreadable outputs are computed again
+            if self.debug:
+                print("Could not read %s: %s" % (path, error))
+            return None
+
+    def put(self, stage, key, output):
+        """ Stores a stage's output
+
+        The output is written to a temporary file first, so readers never see it
+        partially written
+
+        Args:
+            stage (str)
+            key (str)
+            output
+        """
+        path = self.output_path(stage, key)
+        makedirs(join(self.path, stage, key[:2]), exist_ok=True)
+
+        tmp_path = '%s.%d.tmp' % (path, getpid())
+        try:
+            with open(tmp_path, 'wb') as output_file:
+                pickle.dump(output, output_file, pickle.HIGHEST_PROTOCOL)
+            replace(tmp_path, path)
+        except OSError as error:
+            if self.debug:
+                print("Could not write %s: %s" % (path, error))
+
+    def cached(self, stage, key, compute):
+        """ Reads a stage's output, or computes and stores it
+
+        Args:
+            stage (str)
+            key (str or None): None to compute it without caching
+            compute (function): computes the output
+        Returns:
+            The output
+        """
+        if key is None:
+            return compute()
+
+        output = self.get(stage, key)
+        if output is None:
+            output = compute()
+            self.put(stage, key, output)
+        elif self.debug:
+            print("Using cached %s %s" % (stage, key))
+
+        return output
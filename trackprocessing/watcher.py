@@ -0,0 +1,212 @@
+"""
+Watches a folder for files that appear, change or disappear
+
+Uses Linux's inotify, through the C library, and falls back to comparing the folder's
+listing at regular intervals elsewhere, or when inotify can't be used.
+"""
+import os
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+from os.path import expanduser, isdir
+
+# inotify event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+def load_inotify():
+    """ Loads the C library, if it supports inotify
+
+    Returns:
+        :obj:`ctypes.CDLL` or None
+    """
+    library = ctypes.util.find_library('c')
+    if not library:
+        return None
+
+    try:
+        libc = ctypes.CDLL(library, use_errno=True)
+        # Raise AttributeError if the library doesn't have them
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+class Watcher(object):
+    """ Base folder watcher
+
+    The callback is called, from the watcher's thread, with the name of each file
+    that was written, moved or removed, or with None when the changes are unknown and
+    the whole folder should be listed again
+
+    Arguments:
+        path: Folder to watch
+        callback: Function that receives the name of the changed file
+        thread: Thread that waits for changes
+    """
+    def __init__(self, path, callback, debug=False):
+        self.path = expanduser(path)
+        self.callback = callback
+        self.debug = debug
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """ Starts watching in a background thread
+
+        Returns:
+            :obj:`Watcher`: self
+        """
+        self.thread = threading.Thread(target=self.run, name='watcher', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """ Stops watching
+        """
+        self.stopped.set()
+
+    def run(self):
+        """ Waits for changes until stopped
+        """
+        raise NotImplementedError()
+
+    def notify(self, name):
+        """ Calls the callback, without letting its errors stop the watcher
+
+        Args:
+            name (str or None)
+        """
+        try:
+            self.callback(name)
+        except Exception as error:
+            if self.debug:
+                print("Error handling change of %s: %s" % (name, error))
+
+class InotifyWatcher(Watcher):
+    """ Folder watcher that uses inotify
+
+    Arguments:
+        fd: inotify file descriptor
+    """
+    def __init__(self, path, callback, libc, debug=False):
+        super().__init__(path, callback, debug)
+
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        if libc.inotify_add_watch(self.fd, self.path.encode(), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed for %s' % self.path)
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                # Wakes up regularly to check if it was stopped
+                readable, _, _ = select.select([self.fd], [], [], 1.0)
+                if not readable:
+                    continue
+
+                data = os.read(self.fd, 64 * 1024)
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                    offset += EVENT_HEADER.size
+                    name = data[offset:offset + length].rstrip(b'\0').decode()
+                    offset += length
+
+                    if mask & IN_Q_OVERFLOW:
+                        self.notify(None)
+                    elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                        self.notify(None)
+                        return
+                    elif name:
+                        self.notify(name)
+        finally:
+            os.close(self.fd)
+
+class PollingWatcher(Watcher):
+    """ Folder watcher that compares the size and modification time of its files
+
+    Arguments:
+        interval: Seconds between listings
+        files: Dictionary with the size and modification time of each file
+    """
+    def __init__(self, path, callback, interval=2, debug=False):
+        super().__init__(path, callback, debug)
+        self.interval = interval
+        self.files = self.listing()
+
+    def listing(self):
+        """ Size and modification time of each file in the folder
+
+        Returns:
+            :obj:`dict`
+        """
+        if not isdir(self.path):
+            return {}
+
+        files = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        entry_stat = entry.stat()
+                        files[entry.name] = (entry_stat.st_size, entry_stat.st_mtime_ns)
+                except OSError:
+                    pass
+        return files
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                files = self.listing()
+            except OSError:
+                continue
+
+            changed = [name for name in files if self.files.get(name) != files[name]]
+            removed = [name for name in self.files if name not in files]
+            self.files = files
+
+            for name in sorted(changed + removed):
+                self.notify(name)
+
+def watch(path, callback, interval=2, debug=False):
+    """ Starts watching a folder, with inotify if possible
+
+    See `Watcher`
+
+    Args:
+        path (str)
+        callback (function)
+        interval (float, optional): seconds between listings, when polling.
+            Defaults to 2
+        debug (bool, optional): activates debug mode.
+            Defaults to False
+    Returns:
+        :obj:`Watcher`
+    """
+    libc = load_inotify()
+    if libc:
+        try:
+            return InotifyWatcher(path, callback, libc, debug).start()
+        except OSError as error:
+            if debug:
+                print("Can't use inotify, polling %s instead: %s" % (path, error))
+
+    return PollingWatcher(path, callback, interval, debug).start()
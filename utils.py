@@ -1,7 +1,7 @@
 from os.path import expanduser, isfile
 from main.default_config import CONFIG
 import json
-from main import db
+from main import db, tiles
 
 def update_dict(target, updater):
     """ Updates a dictionary, keeping the same structure
@@ -18,22 +18,6 @@ def update_dict(target, updater):
             else:
                 target[key] = updater[key]
 
-def merge_bounding_boxes(bb1, bb2):
-    """ Combines two bounding boxes
-
-    Args:
-        bb1 (:obj:`list` of :obj:`dict`)
-        bb2 (:obj:`list` of :obj:`dict`)
-    Returns:
-        :obj:`list` of :obj:`dict`
-    """
-    min_lat = min(min(bb1[0]["lat"], bb1[1]["lat"]), min(bb2[0]["lat"], bb2[1]["lat"]))
-    min_lon = min(min(bb1[0]["lon"], bb1[1]["lon"]), min(bb2[0]["lon"], bb2[1]["lon"]))
-    max_lat = max(max(bb1[0]["lat"], bb1[1]["lat"]), max(bb2[0]["lat"], bb2[1]["lat"]))
-    max_lon = max(max(bb1[0]["lon"], bb1[1]["lon"]), max(bb2[0]["lon"], bb2[1]["lon"]))
-
-    return [{"lat": min_lat, "lon": min_lon}, {"lat": max_lat, "lon": max_lon}]
-
 
 class Manager(object):
     '''
@@ -52,18 +36,53 @@ class Manager(object):
         update_dict(self.config, new_config)
     
     def db_connect(self):
-        """ Creates a connection with the database
+        """ Checks out a connection from the shared connection pool
 
-        Use `db.dispose` to commit and close cursor and connection
+        Use `db.dispose` to commit, close the cursor and give the connection back to the pool
 
         Returns:
             (psycopg2.connection, psycopg2.cursor): Both are None if the connection is invalid
         """
         dbc = self.config['db']
-        conn = db.connect_db(dbc['host'], dbc['name'], dbc['user'], dbc['port'], dbc['pass'])
+        pool = db.get_pool(
+            dbc['host'], dbc['name'], dbc['user'], dbc['port'], dbc['pass'],
+            dbc['pool_min_size'], dbc['pool_max_size'], dbc['pool_health_check'], dbc['pool_timeout']
+        )
+        conn = db.checkout(pool) if pool else None
         if conn:
             return conn, conn.cursor()
         else:
             return None, None
 
-    
\ No newline at end of file
+    def get_pool_stats(self):
+        """ Gets the usage counters of the database connection pools
+
+        See `db.pool_stats`
+
+        Returns:
+            :obj:`list` of :obj:`dict`
+        """
+        return db.pool_stats()
+
+    def tile_cache(self):
+        """ Gets the on-disk vector tile cache
+
+        Returns:
+            :obj:`tiles.TileCache` or None: None if tiles aren't cached
+        """
+        path = self.config['tile_cache_path']
+        return tiles.TileCache(expanduser(path)) if path else None
+
+    def invalidate_tiles(self, changes):
+        """ Removes cached tiles under changed geometries
+
+        See `tiles.TileCache.invalidate`
+
+        Args:
+            changes (:obj:`dict`): bounding boxes, (min lat, min lon, max lat, max lon),
+                changed in each layer
+        """
+        cache = self.tile_cache()
+        if cache:
+            for layer, bounds in list(changes.items()):
+                cache.invalidate(layer, bounds)